@@ -0,0 +1,407 @@
+import threading
+
+try:
+    import numpy as np
+except ImportError as e:
+    raise ImportError("analytics needs numpy: pip install numpy") from e
+
+from app import Book, Customer, Order
+
+# SALES AND INVENTORY ANALYTICS
+# Column arrays (NumPy) mirroring the store: one row per book, per order line
+# and per customer. Reports are vectorized group-bys over them (bincount on
+# integer codes), not loops over Order objects.
+# The arrays are built from the objects once, in attach(). After that the
+# Book and Order listeners only note what changed, one entry per book and per
+# order however often it changes (so a server that never asks for a report
+# holds at most one per object); refresh() (run by every report) applies
+# them, so the cost follows the changes since the last report, not the size
+# of the store. A status change rewrites its order's slice of the line
+# arrays in place.
+# Line revenue is the order total split over its lines by price * quantity.
+# With the sqlite backend only the orders loaded so far are counted.
+
+STATUS_CODES = {status: code for code, status in enumerate(Order.STATUSES)}
+DEAD = -1  # lines of an order that was read back in again
+BOOK_FIELDS = ("genre", "author", "year", "price", "quantity")
+
+# the engine the listeners feed, None until attach()
+active = None
+
+
+# string <-> small int, so group-bys can use bincount
+class Codes:
+    def __init__(self) -> None:
+        self.codes: dict = {}
+        self.names: list = []
+
+    def __call__(self, name) -> int:
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+# equal length growable columns, table[name] is a view of the used rows
+class Table:
+    def __init__(self, capacity=1024, **dtypes) -> None:
+        self.size = 0
+        self.columns = {
+            name: np.zeros(capacity, dtype) for name, dtype in dtypes.items()
+        }
+
+    def __getitem__(self, name) -> np.ndarray:
+        return self.columns[name][: self.size]
+
+    def __len__(self) -> int:
+        return self.size
+
+    def reserve(self, rows) -> int:
+        start = self.size
+        capacity = len(next(iter(self.columns.values())))
+        if start + rows > capacity:
+            capacity = max(capacity * 2, start + rows)
+            for name, column in self.columns.items():
+                grown = np.zeros(capacity, column.dtype)
+                grown[:start] = column[:start]
+                self.columns[name] = grown
+        self.size = start + rows
+        return start
+
+    def append(self, **values) -> int:
+        row = self.reserve(1)
+        for name, value in values.items():
+            self.columns[name][row] = value
+        return row
+
+    def extend(self, **values) -> int:
+        start = self.reserve(len(next(iter(values.values()))))
+        for name, value in values.items():
+            self.columns[name][start : self.size] = value
+        return start
+
+    def set(self, row, **values) -> None:
+        for name, value in values.items():
+            self.columns[name][row] = value
+
+
+class Analytics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.changed_books: dict = {}  # isbn -> book
+        self.changed_orders: dict = {}  # order_id -> (order, old status)
+        self.genres = Codes()
+        self.authors = Codes()
+        self.member_types = Codes()
+        self.books = Table(
+            genre="i4", author="i4", year="i4", price="f8", quantity="i8"
+        )
+        self.book_rows: dict = {}  # isbn -> row
+        self.book_list: list = []  # row -> book
+        self.lines = Table(book="i4", quantity="i8", revenue="f8", status="i1")
+        self.order_rows: dict = {}  # order_id -> (start, stop) in lines
+        self.dead = 0
+        self.customers = Table(member_type="i4", spent="f8")
+        self.customer_rows: dict = {}  # key -> row
+
+    # LISTENERS
+    # called inside the store's own locks, so they only note the change; a
+    # changed book gets its whole row again, an order keeps the first old
+    # status noted unless it is new (None) since the last refresh
+    def on_book(self, book, field) -> None:
+        if field is None or field in BOOK_FIELDS:
+            self.changed_books[book.isbn] = book
+
+    def on_order(self, order, old, new) -> None:
+        if old is None:
+            self.changed_orders[order.order_id] = (order, None)
+        else:
+            self.changed_orders.setdefault(order.order_id, (order, old))
+
+    # BUILD AND REFRESH
+    def build(self) -> None:
+        with self.lock:
+            self.changed_books.clear()
+            self.changed_orders.clear()
+            books = list(Book.all_books.values())
+            self.book_list = books
+            self.book_rows = {book.isbn: row for row, book in enumerate(books)}
+            self.books.size = 0
+            self.books.extend(
+                genre=[self.genres(book.genre) for book in books],
+                author=[self.authors(book.author) for book in books],
+                year=[book.year or 0 for book in books],
+                price=[book.price for book in books],
+                quantity=[book.quantity for book in books],
+            )
+            self.lines.size = 0
+            self.order_rows = {}
+            self.dead = 0
+            line_book, line_quantity, line_revenue, line_status = [], [], [], []
+            for order in Order.all_orders.values():
+                start = len(line_book)
+                rows, quantities, revenues = self._order_lines(order)
+                line_book += rows
+                line_quantity += quantities
+                line_revenue += revenues
+                line_status += [STATUS_CODES[order.status]] * len(rows)
+                self.order_rows[order.order_id] = (start, len(line_book))
+            if line_book:
+                self.lines.extend(
+                    book=line_book,
+                    quantity=line_quantity,
+                    revenue=line_revenue,
+                    status=line_status,
+                )
+            self.customers.size = 0
+            self.customer_rows = {}
+            for customer in Customer.all_customers.values():
+                self._customer(customer)
+
+    def refresh(self) -> None:
+        with self.lock:
+            # popped one by one, a listener may add more meanwhile
+            while self.changed_books:
+                self._book(self.changed_books.popitem()[1], None)
+            while self.changed_orders:
+                self._order(*self.changed_orders.popitem()[1])
+            if self.dead > len(self.lines) // 2:
+                self._compact_lines()
+
+    def _book(self, book, field) -> int:
+        row = self.book_rows.get(book.isbn)
+        if row is None:
+            row = self.books.append()
+            self.book_rows[book.isbn] = row
+            self.book_list.append(book)
+            field = None
+        self.book_list[row] = book
+        match field:
+            case None:
+                self.books.set(
+                    row,
+                    genre=self.genres(book.genre),
+                    author=self.authors(book.author),
+                    year=book.year or 0,
+                    price=book.price,
+                    quantity=book.quantity,
+                )
+            case "genre":
+                self.books.set(row, genre=self.genres(book.genre))
+            case "author":
+                self.books.set(row, author=self.authors(book.author))
+            case "year":
+                self.books.set(row, year=book.year or 0)
+            case _:
+                self.books.set(row, **{field: getattr(book, field)})
+        return row
+
+    # old is None for an order that is new (or read back in)
+    def _order(self, order, old) -> None:
+        span = self.order_rows.get(order.order_id)
+        if span is not None and old is None:
+            # read back in (reindex, restore): its old lines no longer count
+            self.lines.columns["status"][span[0] : span[1]] = DEAD
+            self.dead += span[1] - span[0]
+            span = None
+        if span is None:
+            rows, quantities, revenues = self._order_lines(order)
+            start = self.lines.size
+            if rows:
+                start = self.lines.extend(
+                    book=rows,
+                    quantity=quantities,
+                    revenue=revenues,
+                    status=STATUS_CODES[order.status],
+                )
+            self.order_rows[order.order_id] = (start, start + len(rows))
+        else:
+            self.lines.columns["status"][span[0] : span[1]] = STATUS_CODES[order.status]
+        self._customer(order.customer)
+
+    def _order_lines(self, order) -> tuple:
+        rows, quantities, weights = [], [], []
+        for book, quantity in order.items.items():
+            row = self.book_rows.get(book.isbn)
+            rows.append(self._book(book, None) if row is None else row)
+            quantities.append(quantity)
+            weights.append(book.price * quantity)
+        weight = sum(weights)
+        if weight:
+            revenues = [order.total * w / weight for w in weights]
+        else:
+            revenues = [order.total / len(rows) if rows else 0] * len(rows)
+        return rows, quantities, revenues
+
+    def _customer(self, customer) -> None:
+        values = {
+            "member_type": self.member_types(customer.member_type),
+            "spent": customer.total_spent,
+        }
+        row = self.customer_rows.get(customer.key)
+        if row is None:
+            self.customer_rows[customer.key] = self.customers.append(**values)
+        else:
+            self.customers.set(row, **values)
+
+    def _compact_lines(self) -> None:
+        status = self.lines["status"]
+        keep = status != DEAD
+        moved = np.cumsum(keep) - keep  # new index of each kept line
+        self.order_rows = {
+            order_id: (
+                (int(moved[start]), int(moved[start]) + stop - start)
+                if stop > start
+                else (0, 0)
+            )
+            for order_id, (start, stop) in self.order_rows.items()
+        }
+        columns = {name: self.lines[name][keep].copy() for name in self.lines.columns}
+        self.lines.size = 0
+        self.lines.extend(**columns)
+        self.dead = 0
+
+    # REPORTS
+    # per book totals of approved lines: units sold and revenue
+    def _sold(self, status="approved") -> tuple:
+        mask = self.lines["status"] == STATUS_CODES[status]
+        books = self.lines["book"][mask]
+        size = len(self.books)
+        units = np.bincount(books, self.lines["quantity"][mask], minlength=size)
+        revenue = np.bincount(books, self.lines["revenue"][mask], minlength=size)
+        return units, revenue
+
+    # approved revenue per genre, author or year, highest first
+    def revenue_by(self, field="genre") -> dict:
+        self.refresh()
+        with self.lock:
+            _, revenue = self._sold()
+            match field:
+                case "genre" | "author":
+                    codes = self.genres if field == "genre" else self.authors
+                    totals = np.bincount(
+                        self.books[field], revenue, minlength=len(codes)
+                    )
+                    names = codes.names
+                case "year":
+                    names, keys = np.unique(self.books["year"], return_inverse=True)
+                    totals = np.bincount(keys, revenue, minlength=len(names))
+                    names = names.tolist()
+                case _:
+                    raise ValueError(f"no revenue by {field}")
+        order = np.argsort(-totals, kind="stable")
+        return {names[i]: float(totals[i]) for i in order if totals[i]}
+
+    # the n best selling books by units ("units") or revenue ("revenue")
+    def top_sellers(self, n=10, by="units") -> list:
+        self.refresh()
+        with self.lock:
+            units, revenue = self._sold()
+            score = {"units": units, "revenue": revenue}[by]
+            n = min(n, int(np.count_nonzero(score)))
+            if not n:
+                return []
+            best = np.argpartition(-score, n - 1)[:n]
+            best = best[np.argsort(-score[best], kind="stable")]
+            return [self._book_row(row, units, revenue) for row in best]
+
+    # books whose stock covers the fewest multiples of what they sold,
+    # quantity is already net of carts and pending orders
+    def stockout_risk(self, n=10) -> list:
+        self.refresh()
+        with self.lock:
+            units, revenue = self._sold()
+            pending, _ = self._sold("pending")
+            sold = np.flatnonzero(units)
+            if not len(sold):
+                return []
+            cover = self.books["quantity"][sold] / units[sold]
+            n = min(n, len(sold))
+            worst = np.argpartition(cover, n - 1)[:n]
+            worst = worst[np.argsort(cover[worst], kind="stable")]
+            return [
+                self._book_row(sold[i], units, revenue)
+                | {"pending": int(pending[sold[i]]), "cover": float(cover[i])}
+                for i in worst
+            ]
+
+    # Customer.total_spent summed per member type
+    def spend_by_member_type(self) -> dict:
+        self.refresh()
+        with self.lock:
+            member_type = self.customers["member_type"]
+            spent = self.customers["spent"]
+            size = len(self.member_types)
+            totals = np.bincount(member_type, spent, minlength=size)
+            buyers = np.bincount(member_type[spent > 0], minlength=size)
+            return {
+                name: {
+                    "spent": float(totals[code]),
+                    "buyers": int(buyers[code]),
+                    "average": (
+                        float(totals[code] / buyers[code]) if buyers[code] else 0.0
+                    ),
+                }
+                for code, name in enumerate(self.member_types.names)
+            }
+
+    # order lines joined with their books, for ad hoc pandas analysis
+    def frame(self):
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("frame() needs pandas: pip install pandas") from e
+        self.refresh()
+        with self.lock:
+            live = self.lines["status"] != DEAD
+            books = self.lines["book"][live]
+            return pd.DataFrame(
+                {
+                    "isbn": np.array([b.isbn for b in self.book_list])[books],
+                    "genre": pd.Categorical.from_codes(
+                        self.books["genre"][books], self.genres.names
+                    ),
+                    "author": pd.Categorical.from_codes(
+                        self.books["author"][books], self.authors.names
+                    ),
+                    "year": self.books["year"][books],
+                    "quantity": self.lines["quantity"][live],
+                    "revenue": self.lines["revenue"][live],
+                    "status": pd.Categorical.from_codes(
+                        self.lines["status"][live], Order.STATUSES
+                    ),
+                }
+            )
+
+    def _book_row(self, row, units, revenue) -> dict:
+        book = self.book_list[row]
+        return {
+            "isbn": book.isbn,
+            "title": book.title,
+            "quantity": int(self.books["quantity"][row]),
+            "units": int(units[row]),
+            "revenue": float(revenue[row]),
+        }
+
+
+# build the engine from the current objects and keep it current from then on
+def attach() -> Analytics:
+    global active
+    if active is None:
+        active = Analytics()
+        Book.listeners.append(active.on_book)
+        Order.listeners.append(active.on_order)
+        active.build()
+    return active
+
+
+def detach() -> None:
+    global active
+    if active is not None:
+        Book.listeners.remove(active.on_book)
+        Order.listeners.remove(active.on_order)
+        active = None
@@ -1,20 +1,29 @@
 import hashlib as hl
-import json
 import logging
+import sys
+import threading
 import time
-from functools import wraps
-
-import pandas as pd
-from IPython.display import HTML, ProgressBar, clear_output, display
-from jinja2 import Environment, FileSystemLoader
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from pathlib import Path
+
+import events
+import hashing
+import metrics
+import shards
+import sqlstore
+import wal
+from indexes import HashIndex, LazySortedIndex, SortedIndex, TextIndex
+from loader import LoadProgress, load_concurrently, load_records
+from userstore import UserStore
 
 # Configure the logger
 logger = logging.getLogger("my_logger")
 logger.setLevel(logging.DEBUG)
 
-# Create a FileHandler with the filename 'main.log'
+# Create a FileHandler with the filename 'main.log', opened on the first record
 log_file = "main.log"
-file_handler = logging.FileHandler(log_file)
+file_handler = logging.FileHandler(log_file, delay=True)
 
 # Create a formatter to specify the log message format
 formatter = logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
@@ -23,21 +32,100 @@ file_handler.setFormatter(formatter)
 # Add the FileHandler to the logger
 logger.addHandler(file_handler)
 
+# Sentinel for attributes that are not set yet
+_MISSING = object()
+
+# STRIPED LOCKS
+# A fixed pool of locks handed out by key hash: per-book/cart/order locking
+# without one lock object per record.
+class LockTable:
+    def __init__(self, size: int = 256) -> None:
+        self.locks = [threading.Lock() for _ in range(size)]
+
+    def __call__(self, key) -> threading.Lock:
+        return self.locks[hash(key) % len(self.locks)]
+
 # BY NAFIS
 class Book:
+    # no per-instance __dict__, a catalog holds millions of these
+    __slots__ = ("isbn", "title", "author", "year", "genre", "price", "quantity")
+
     # class variables
     all_books: dict = {}
+    indexes: dict = {
+        "title": HashIndex(),
+        "author": HashIndex(),
+        "genre": HashIndex(),
+    }
+    text_indexes: dict = {
+        "title": TextIndex(),
+        "author": TextIndex(),
+    }
+    sorted_indexes: dict = {
+        "year": SortedIndex(),
+        "price": SortedIndex(),
+        "quantity": LazySortedIndex("quantity"),  # changes on every reservation
+    }
+    field_indexes: dict = {}  # filled in by link_indexes()
+    # called as listener(book, field) after a field changes, field is None
+    # for a new book; keep them quick, they run inside the caller's locks
+    listeners: list = []
+    stock_locks = LockTable()
     # Constructor
 
     def __init__(self, isbn, title, author, year, genre, price, quantity):
-        self.isbn = isbn
-        self.title = title
-        self.author = author
-        self.year = year
-        self.genre = genre
-        self.price = price
-        self.quantity = quantity
+        if old_book := Book.all_books.get(isbn):
+            old_book.unindex()
+        # set without the __setattr__ hook and index every field in one pass
+        set_field = object.__setattr__
+        set_field(self, "isbn", isbn)
+        set_field(self, "title", title)
+        set_field(self, "author", sys.intern(author))
+        set_field(self, "year", year)
+        set_field(self, "genre", sys.intern(genre))
+        set_field(self, "price", price)
+        set_field(self, "quantity", quantity)
         Book.all_books[isbn] = self
+        self.index()
+        for listener in Book.listeners:
+            listener(self, None)
+        events.publish(events.BookChanged, isbn, None, None)
+
+    # keep the field indexes in sync with every assignment
+    def __setattr__(self, name, value):
+        indexes = Book.field_indexes.get(name)
+        if indexes is None:
+            object.__setattr__(self, name, value)
+            return
+        old_value = getattr(self, name, _MISSING)
+        object.__setattr__(self, name, value)
+        for index in indexes:
+            if old_value is _MISSING:
+                index.add(value, self.isbn, self)
+            else:
+                index.replace(old_value, value, self.isbn, self)
+        sqlstore.touch(self)
+        for listener in Book.listeners:
+            listener(self, name)
+        events.publish(events.BookChanged, self.isbn, name, value)
+
+    def index(self):
+        for name, indexes in Book.field_indexes.items():
+            for index in indexes:
+                index.add(getattr(self, name), self.isbn, self)
+
+    def unindex(self):
+        for name, indexes in Book.field_indexes.items():
+            for index in indexes:
+                index.remove(getattr(self, name), self.isbn)
+
+    # pickled as a plain tuple and restored without the index hook
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in Book.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(Book.__slots__, state):
+            object.__setattr__(self, name, value)
 
     def get_book_details(self):
         return {
@@ -55,9 +143,33 @@ class Book:
             return False
         return self.quantity >= quantity
 
+    # atomic check-and-take of stock, False when not enough is left
+    def reserve(self, quantity):
+        if quantity <= 0:
+            return False
+        with Book.stock_locks(self.isbn):
+            if self.quantity < quantity:
+                return False
+            self.quantity -= quantity
+            return True
+
+    def release(self, quantity):
+        with Book.stock_locks(self.isbn):
+            self.quantity += quantity
+
+    # stock moved by a change that was checked when it happened, see wal.replay
+    def adjust(self, delta):
+        with Book.stock_locks(self.isbn):
+            self.quantity += delta
+
+    # logged with the change it made too, replay applies that instead of the
+    # new quantity because reservations may be logged out of order with it
     def update_quantity(self, new_quantity, user):
         if user.is_employee:
-            self.quantity = new_quantity
+            with Book.stock_locks(self.isbn):
+                delta = new_quantity - self.quantity
+                self.quantity = new_quantity
+            wal.record("quantity", isbn=self.isbn, quantity=new_quantity, delta=delta)
             return True
         else:
             return False
@@ -65,30 +177,130 @@ class Book:
     def update_price(self, new_price, user):
         if user.is_employee:
             self.price = new_price
+            wal.record("price", isbn=self.isbn, price=new_price)
             return True
         else:
             return False
 
     # class methods
+    # mode: "exact", or for title/author also "casefold", "prefix", "substring"
     @classmethod
-    def search_by(cls, category, value):
+    def search_by(cls, category, value, mode="exact", limit=None):
         category = category.lower()
         categories = ["isbn", "title", "author", "genre"]
         result = []
         if category not in categories:
             return result
-        match category:
+        start = time.perf_counter() if metrics.enabled else None
+        try:
+            match category:
+                case "isbn":
+                    return cls.getBook(value)
+                case _ if sqlstore.active:
+                    return sqlstore.active.find_books(category, value, mode, limit)
+                case _ if (
+                    shards.active
+                    and (books := shards.active.search(category, value, mode, limit))
+                    is not None
+                ):
+                    return books
+                case "title" | "author" if mode != "exact":
+                    return cls.text_indexes[category].search(value, mode, limit)
+                case _:
+                    return cls.indexes[category].get(value)[:limit]
+        finally:
+            if start is not None:
+                metrics.observe("search_seconds", time.perf_counter() - start, category)
+
+    # lazy version of search_by, yields books one at a time
+    @classmethod
+    def iter_search_by(cls, category, value, mode="exact"):
+        match category.lower():
             case "isbn":
-                return cls.getBook(value)
-            case _:
-                for book in cls.all_books.values():
-                    if getattr(book, category) == value:
-                        result.append(book)
-                return result
+                if book := cls.getBook(value):
+                    yield book
+            case category if sqlstore.active:
+                yield from sqlstore.active.iter_books(category, value, mode)
+            case category if shards.active and shards.active.serves(category):
+                yield from shards.active.iter_search(category, value, mode)
+            case "title" | "author" as category if mode != "exact":
+                yield from cls.text_indexes[category].iter_search(value, mode)
+            case "title" | "author" | "genre" as category:
+                yield from cls.indexes[category].iter(value)
+
+    # inclusive bounds, results ordered by the field value
+    @classmethod
+    def search_range(cls, category, low=None, high=None, limit=None):
+        start = time.perf_counter() if metrics.enabled else None
+        books = None
+        if sqlstore.active:
+            books = sqlstore.active.range_books(category, low, high, limit)
+        elif shards.active:
+            books = shards.active.search_range(category.lower(), low, high, limit)
+        if books is None:
+            index = cls.sorted_indexes.get(category.lower())
+            books = [] if index is None else index.range(low, high, limit)
+        if start is not None:
+            metrics.observe("search_seconds", time.perf_counter() - start, category)
+        return books
+
+    # buffer text/sorted index updates, they are applied once after the block
+    @classmethod
+    @contextmanager
+    def batch_indexing(cls):
+        with ExitStack() as stack:
+            for indexes in (cls.text_indexes, cls.sorted_indexes):
+                for index in indexes.values():
+                    stack.enter_context(index.deferred_updates())
+            yield
+
+    # every index that follows a field, used by __setattr__
+    @classmethod
+    def link_indexes(cls):
+        cls.field_indexes = {}
+        for indexes in (cls.indexes, cls.text_indexes, cls.sorted_indexes):
+            for name, index in indexes.items():
+                cls.field_indexes.setdefault(name, []).append(index)
+
+    # rows of {"isbn", "price" and/or "quantity"}, e.g. from loader.iter_feed.
+    # One permission check, one index re-sort and one log record for the whole
+    # feed; every row is checked before any book changes.
+    @classmethod
+    def apply_feed(cls, rows, user):
+        if not user.is_employee:
+            return 0
+        changes = []
+        for row in rows:
+            change = {"isbn": str(row["isbn"])}
+            if row.get("price") not in (None, ""):
+                change["price"] = float(row["price"])
+            if row.get("quantity") not in (None, ""):
+                change["quantity"] = int(row["quantity"])
+            if change["isbn"] in cls.all_books:
+                changes.append(change)
+        with cls.batch_indexing():
+            for change in changes:
+                book = cls.all_books[change["isbn"]]
+                if "price" in change:
+                    book.price = change["price"]
+                if "quantity" in change:
+                    with cls.stock_locks(book.isbn):
+                        change["delta"] = change["quantity"] - book.quantity
+                        book.quantity = change["quantity"]
+        if changes:
+            wal.record("feed", changes=changes)
+        return len(changes)
 
     @classmethod
     def getBook(cls, isbn):
-        return cls.all_books.get(isbn, None)
+        book = cls.all_books.get(isbn, None)
+        if metrics.enabled:
+            metrics.count(
+                "cache_requests_total", "books", "miss" if book is None else "hit"
+            )
+        if book is None and sqlstore.active:
+            book = sqlstore.active.load_book(isbn)
+        return book
 
     @classmethod
     def get_all_books(cls):
@@ -99,26 +311,20 @@ class Book:
         if cls.getBook(isbn):
             return False
         else:
-            cls(isbn, title, author, year, genre, price, quantity)
+            # built without __setattr__, so the backend is told here
+            sqlstore.add(cls(isbn, title, author, year, genre, price, quantity))
             return True
 
     @classmethod
-    def from_json(cls, file_path) -> None:
-        with open(file_path, "rb") as f:
-            all_books = json.load(f)
-
-        print("Loading books...")
-        p_bar = ProgressBar(len(all_books))
-        p_bar.display()
-        for book in all_books:
-            cls(**book)
-            p_bar.progress += 1
-        clear_output(wait=True)
+    def from_json(cls, file_path) -> dict:
+        return load_records(cls, file_path, "books", LoadProgress())
+
+Book.link_indexes()
 
 # BY SAFWAN
 class User:
     # class variables
-    all_users: dict = {}
+    all_users: UserStore = UserStore()  # every user, see userstore.py
 
     # Constructor
     def __init__(
@@ -132,19 +338,23 @@ class User:
     ) -> None:
         self.name: str = name
         self.email: str = email
-        self.pin: str = User.encrypt_str(pin)
+        self.key: bytes = User.lookup_key(email)
+        self.pin: str = hashing.hash_pin(pin)
         self.address: str = address
         self.phone: str = phone
         self.is_employee: bool = is_employee
         self.logged_in: bool = False
-        self.__class__.all_users[User.encrypt_str(email)] = self
+        User.all_users.add(self)
 
     # instance methods
     def logout(self) -> None:
         self.logged_in = False
 
     def login(self, pin: str) -> bool:
-        if self.pin == User.encrypt_str(pin):
+        if hashing.verify_pin(pin, self.pin):
+            if hashing.needs_rehash(self.pin):
+                self.pin = hashing.hash_pin(pin)
+                sqlstore.touch(self)
             self.logged_in = True
             return True
         else:
@@ -157,7 +367,7 @@ class User:
 
     @classmethod
     def signin(cls, email: str, pin: str) -> object:
-        user = cls.all_users.get(User.encrypt_str(email), None)
+        user = cls.get_user(email)
         if user and user.login(pin):
             return user
         return None
@@ -172,7 +382,7 @@ class User:
         phone: str,
         is_employee: bool = False,
     ) -> object:
-        if cls.all_users.get(User.encrypt_str(email), None):
+        if cls.get_user(email):
             return None
         else:
             return cls(
@@ -184,22 +394,56 @@ class User:
                 is_employee=is_employee,
             )
 
+    # from memory, or read through from the sqlite backend
+    @classmethod
+    def get_user(cls, email: str):
+        key = User.lookup_key(email)
+        user = User.all_users.get(key)
+        if metrics.enabled:
+            metrics.count(
+                "cache_requests_total", "users", "miss" if user is None else "hit"
+            )
+        if user is None and sqlstore.active:
+            user = sqlstore.active.load_user(key)
+        return user if isinstance(user, cls) else None
+
+    # users of this class whose field (phone, member_type, designation) is value
+    @classmethod
+    def find_by(cls, field, value) -> list:
+        return User.all_users.find(field, value, None if cls is User else cls)
+
+    # gone from every view and index at once, False if there was no such user
     @classmethod
     def delete_user(cls, admin, user_email):
         if admin.is_employee:
-            del cls.all_users[User.encrypt_str(user_email)]
-            return True
+            key = User.lookup_key(user_email)
+            found = User.all_users.get(key) or cls.get_user(user_email)
+            if found:
+                User.all_users.remove(key)
+                if sqlstore.active:
+                    sqlstore.active.delete_user(key)
+            return found is not None
         return False
 
     @classmethod
-    def from_json(cls, file_path) -> None:
-        with open(file_path, "r", encoding="utf-8") as f:
-            all_users = json.load(f)
-        for user in all_users:
-            cls(**user)
+    def from_json(cls, file_path) -> dict:
+        return load_records(cls, file_path, "users")
+
+    # PINs in a batch of records are hashed side by side, see hashing.py
+    @classmethod
+    def prepare_records(cls, records) -> list:
+        hashed = hashing.hash_many([record["pin"] for record in records])
+        for record, pin in zip(records, hashed):
+            record["pin"] = pin
+        return records
 
     # static methods
 
+    @staticmethod
+    def lookup_key(email: str) -> bytes:
+        return hashing.email_key(email)
+
+    # plain sha256 as used before hashing.py, old PIN hashes still verify
     @staticmethod
     def encrypt_str(x_str: str) -> str:
         return hl.sha256(x_str.encode()).hexdigest()
@@ -207,7 +451,7 @@ class User:
 # BY SAFWAN
 class Customer(User):
     # class variables
-    all_customers: dict = {}
+    all_customers = None  # view of User.all_users, set below the class
 
     # Constructor
     def __init__(
@@ -219,43 +463,65 @@ class Customer(User):
         phone: str,
         member_type: str,
     ) -> None:
-        super().__init__(name, email, pin, address, phone, False)
-        self.member_type: str = member_type
+        # set before User.__init__ adds the customer to the store's indexes
+        self.member_type: str = sys.intern(member_type)
         self.orders: dict = {}
         self.cart: Cart = Cart(self)
         self.total_spent: float = 0
-        Customer.all_customers[User.encrypt_str(email)] = self
+        super().__init__(name, email, pin, address, phone, False)
 
     # instance methods
     def checkout(self):
-        if self.cart.can_checkout():
-            order = Order(self, self.cart.items, self.cart.total)
-            self.cart.clear_books()
-            self.orders[order.order_id] = order
-            return True
+        with Cart.locks(self.email):
+            if self.cart.can_checkout():
+                order = Order(self, self.cart.items, self.cart.total, record=True)
+                self.cart.clear_books()
+                self.orders[order.order_id] = order
+                if metrics.enabled:
+                    metrics.count("checkouts_total")
+                return True
         return False
 
     # class methods
+    @classmethod
+    def signup(
+        cls,
+        name: str,
+        email: str,
+        pin: str,
+        address: str,
+        phone: str,
+        member_type: str = "regular",
+    ) -> object:
+        if User.get_user(email):
+            return None
+        customer = cls(name, email, pin, address, phone, member_type)
+        sqlstore.touch(customer)
+        wal.record(
+            "signup",
+            name=name,
+            email=email,
+            pin=customer.pin,
+            address=address,
+            phone=phone,
+            member_type=member_type,
+        )
+        return customer
+
     @classmethod
     def get_all_customers(cls):
         return cls.all_customers
 
     @classmethod
-    def from_json(cls, file_path) -> None:
-        with open(file_path, "r", encoding="utf-8") as f:
-            all_customers = json.load(f)
-        print("Loading customers...")
-        p_bar = ProgressBar(len(all_customers))
-        p_bar.display()
-        for customer in all_customers:
-            cls(**customer)
-            p_bar.progress += 1
-        clear_output(wait=True)
+    def from_json(cls, file_path) -> dict:
+        return load_records(cls, file_path, "customers", LoadProgress())
+
+Customer.all_customers = User.all_users.view(Customer)
 
 # BY NAFIS
 class Employee(User):
     # class variables
-    all_employees: dict = {}
+    all_employees = None  # view of User.all_users, set below the class
 
     # Constructor
     def __init__(
@@ -267,9 +533,8 @@ class Employee(User):
         phone: str,
         designation: str,
     ) -> None:
+        self.designation: str = sys.intern(designation)
         super().__init__(name, email, pin, address, phone, True)
-        self.designation: str = designation
-        Employee.all_employees[User.encrypt_str(email)] = self
 
     # instance methods
 
@@ -280,59 +545,81 @@ class Employee(User):
         return cls.all_employees
 
     @classmethod
-    def from_json(cls, file_path) -> None:
-        with open(file_path, "rb") as f:
-            all_employees = json.load(f)
-        print("Loading employees...")
-        p_bar = ProgressBar(len(all_employees))
-        p_bar.display()
-        for employee in all_employees:
-            cls(**employee)
-            p_bar.progress += 1
-        clear_output(wait=True)
+    def from_json(cls, file_path) -> dict:
+        return load_records(cls, file_path, "employees", LoadProgress())
+
+Employee.all_employees = User.all_users.view(Employee)
 
 # BY MAIMUNA
 class Cart:
+    # class variables
+    locks = LockTable()
+
     def __init__(self, customer):
         self.customer = customer
         self.items = {}
         self.total = 0
+        # cart screen rows and item count, kept up to date by add/remove so
+        # showing the cart does not recompute them
+        self.lines = {}  # book -> {isbn, title, price, quantity, total}
+        self.count = 0
 
     def getcartDict(self):
-        books = []
-        for book, qty in self.items.items():
-            _book = {
-                "isbn": book.isbn,
-                "title": book.title,
-                "price": book.price,
-                "quantity": qty,
-            }
-            books.append(_book)
-        return books
+        return list(self.lines.values())
 
     def add_book(self, isbn, qty=1):
         book = Book.getBook(isbn)
-        if qty > 0 and book and book.is_available(qty):
-            self.items[book] = qty
-            self.total += book.price * qty
-            book.quantity -= qty
-            return True
-        else:
+        if not book:
             return False
+        with Cart.locks(self.customer.email):
+            if book.reserve(qty):
+                quantity = self._add_line(book, qty)
+                wal.record("cart_add", email=self.customer.email, isbn=isbn, qty=qty)
+                events.publish(events.CartChanged, self.customer.email, isbn, quantity)
+                return True
+        return False
+
+    # a cart line read back from storage, its stock is already reserved
+    def restore(self, book, qty):
+        with Cart.locks(self.customer.email):
+            self._add_line(book, qty)
+
+    def _add_line(self, book, qty):
+        quantity = self.items.get(book, 0) + qty
+        line = self.lines.get(book)
+        # a new dict, screens compare the rows they last showed
+        self.lines[book] = {
+            "isbn": book.isbn,
+            "title": book.title,
+            "price": book.price,
+            "quantity": quantity,
+            "total": (line["total"] if line else 0) + book.price * qty,
+        }
+        self.items[book] = quantity
+        self.total += book.price * qty
+        self.count += qty
+        sqlstore.touch(self)
+        return quantity
 
     def remove_book(self, isbn):
         book = Book.getBook(isbn)
-        amount_in_cart = self.items.get(book, 0)
-        if book and amount_in_cart:
-            self.total -= book.price * amount_in_cart
-            book.quantity += amount_in_cart
-            del self.items[book]
-            return True
-        else:
-            return False
+        with Cart.locks(self.customer.email):
+            amount_in_cart = self.items.get(book, 0)
+            if book and amount_in_cart:
+                self.total -= self.lines.pop(book)["total"]
+                self.count -= amount_in_cart
+                book.release(amount_in_cart)
+                del self.items[book]
+                sqlstore.touch(self)
+                wal.record("cart_remove", email=self.customer.email, isbn=isbn)
+                events.publish(events.CartChanged, self.customer.email, isbn, 0)
+                return True
+        return False
 
     def clear_books(self):
         self.__init__(self.customer)
+        sqlstore.touch(self)
+        events.publish(events.CartChanged, self.customer.email, None, 0)
 
     def can_checkout(self):
         return self.total and self.items
@@ -343,16 +630,62 @@ class Cart:
 class Order:
     all_orders = {}
     last_order_id = 0
-
-    def __init__(self, customer, items, total):
-        self.order_id = str(f"{Order.last_order_id:06d}")
+    id_lock = threading.Lock()
+    locks = LockTable()
+    # STATUS INDEXES
+    # Orders by status (insertion ordered, so "pending" is also the approval
+    # queue), running totals and the employee dashboard rows, all updated
+    # when an order changes instead of rescanning all_orders.
+    # version goes up on every change so readers can reuse what they built.
+    STATUSES = ("pending", "approved", "rejected")
+    by_status = {status: {} for status in STATUSES}  # status -> {order_id: order}
+    status_totals = dict.fromkeys(STATUSES, 0)  # status -> sum of order totals
+    pending_rows = {}  # order_id -> employee dashboard row
+    version = 0
+    removed = dict.fromkeys(STATUSES, 0)  # deletions since the dict was rebuilt
+    status_lock = threading.Lock()  # innermost, after the order lock
+    # called as listener(order, old, new) under status_lock on every status
+    # change, old is None for a new order
+    listeners: list = []
+    _pending_list = (-1, [])
+
+    # record: log it as the customer's checkout. Written under id_lock and
+    # before anyone can see the order, so the log holds checkouts in id order
+    # and ahead of their approvals.
+    def __init__(self, customer, items, total, record=False):
+        with Order.id_lock:
+            self.order_id = str(f"{Order.last_order_id:06d}")
+            Order.last_order_id = Order.last_order_id + 1
+            if record:
+                wal.record("checkout", email=customer.email, order_id=self.order_id)
         self.customer = customer
         self.items = items
         self.total = total
         self.approved = False
         self.rejected = False
         Order.all_orders[self.order_id] = self
-        Order.last_order_id = Order.last_order_id + 1
+        self.set_status(None, "pending")
+        sqlstore.touch(self)
+
+    # an order read back from storage, keeps its id
+    @classmethod
+    def restore(cls, order_id, customer, items, total, status):
+        order = cls.__new__(cls)
+        order.order_id = order_id
+        order.customer = customer
+        order.items = items
+        order.total = total
+        order.approved = status == "approved"
+        order.rejected = status == "rejected"
+        cls.all_orders[order_id] = order
+        order.set_status(None, status)
+        return order
+
+    @property
+    def status(self):
+        if self.rejected:
+            return "rejected"
+        return "approved" if self.approved else "pending"
 
     def get_order_details(self):
         return {
@@ -363,43 +696,171 @@ class Order:
             "rejected": self.rejected,
         }
 
+    def get_pending_details(self):
+        return {
+            "order_id": self.order_id,
+            "customer_name": self.customer.name,
+            "item_count": len(self.items),
+            "total": self.total,
+            "approved": self.approved,
+        }
+
+    # move the order between the status indexes, old is None for a new order
+    def set_status(self, old, new):
+        with Order.status_lock:
+            if old is not None:
+                del Order.by_status[old][self.order_id]
+                Order.status_totals[old] -= self.total
+                Order.removed[old] += 1
+                if old == "pending":
+                    del Order.pending_rows[self.order_id]
+                # dicts keep deleted slots until they grow again and iteration
+                # walks over them, copy once they outnumber the live orders
+                if Order.removed[old] > 2 * len(Order.by_status[old]) + 64:
+                    Order.by_status[old] = dict(Order.by_status[old])
+                    if old == "pending":
+                        Order.pending_rows = dict(Order.pending_rows)
+                    Order.removed[old] = 0
+            Order.by_status[new][self.order_id] = self
+            Order.status_totals[new] += self.total
+            if new == "pending":
+                Order.pending_rows[self.order_id] = self.get_pending_details()
+            # what the customer spent on approved orders
+            if old == "approved":
+                self.customer.total_spent -= self.total
+            if new == "approved":
+                self.customer.total_spent += self.total
+            Order.version += 1
+            for listener in Order.listeners:
+                listener(self, old, new)
+            events.publish(
+                events.OrderChanged, self.customer.email, self.order_id, old, new
+            )
+
+    # _approve/_cancel: the caller holds the order lock and logs the change.
+    # A rejected order has given its stock back, it cannot be approved.
+    def _approve(self):
+        if self.rejected:
+            return False
+        status = self.status
+        self.approved = True
+        self.set_status(status, "approved")
+        sqlstore.touch(self)
+        if metrics.enabled:
+            metrics.count("orders_approved_total")
+        return True
+
+    # stock goes back once, cancelling a rejected order again is a no-op
+    def _cancel(self):
+        if self.rejected:
+            return False
+        status = self.status
+        self.rejected = True
+        self.approved = False
+        for book, qty in self.items.items():
+            book.release(qty)
+        self.set_status(status, "rejected")
+        sqlstore.touch(self)
+        if metrics.enabled:
+            metrics.count("orders_rejected_total")
+        return True
+
     def approve(self, employee):
         if employee.is_employee:
-            self.approved = True
-            self.rejected = False
+            with Order.locks(self.order_id):
+                if not self._approve():
+                    return False
+                wal.record("approve", order_id=self.order_id)
             return True
         return False
 
     def cancel(self, employee):
         if employee.is_employee:
-            self.rejected = True
-            self.approved = False
-            for book, qty in self.items.items():
-                book.quantity += qty
+            with Order.locks(self.order_id):
+                if self._cancel():
+                    wal.record("cancel", order_id=self.order_id)
             return True
         return False
 
+    # bulk versions: one permission check and one log record for the batch,
+    # return the ids that were approved / found
+    @classmethod
+    def approve_many(cls, order_ids, employee):
+        if not employee.is_employee:
+            return []
+        approved = []
+        for order_id in order_ids:
+            if order := cls.all_orders.get(order_id):
+                with cls.locks(order_id):
+                    if order._approve():
+                        approved.append(order_id)
+        if approved:
+            wal.record("approve_many", order_ids=approved)
+        return approved
+
+    @classmethod
+    def cancel_many(cls, order_ids, employee):
+        if not employee.is_employee:
+            return []
+        found, cancelled = [], []
+        for order_id in order_ids:
+            if order := cls.all_orders.get(order_id):
+                with cls.locks(order_id):
+                    if order._cancel():
+                        cancelled.append(order_id)
+                found.append(order_id)
+        if cancelled:
+            wal.record("cancel_many", order_ids=cancelled)
+        return found
+
     @classmethod
     def get_all_orders(cls):
         return cls.all_orders
 
+    # the same list is returned until an order changes, do not modify it
     @classmethod
     def get_pending_orders(cls):
-        return [
-            {
-                "order_id": order.order_id,
-                "customer_name": order.customer.name,
-                "item_count": len(order.items),
-                "total": order.total,
-                "approved": order.approved,
-            }
-            for order in cls.all_orders.values()
-            if not (order.approved or order.rejected)
-        ]
+        with cls.status_lock:
+            version, rows = cls._pending_list
+            fresh = version == cls.version
+            if not fresh:
+                rows = list(cls.pending_rows.values())
+                cls._pending_list = (cls.version, rows)
+        if metrics.enabled:
+            metrics.count(
+                "cache_requests_total", "pending_orders", "hit" if fresh else "miss"
+            )
+        return rows
+
+    @classmethod
+    def count(cls, status):
+        return len(cls.by_status[status])
+
+    # rebuild the status indexes from all_orders, e.g. after a snapshot load
+    @classmethod
+    def reindex(cls):
+        with cls.status_lock:
+            for orders in cls.by_status.values():
+                orders.clear()
+            cls.status_totals.update(dict.fromkeys(cls.STATUSES, 0))
+            cls.removed.update(dict.fromkeys(cls.STATUSES, 0))
+            cls.pending_rows.clear()
+            cls.version += 1
+        for order in cls.all_orders.values():
+            order.customer.total_spent = 0
+        for order in cls.all_orders.values():
+            order.set_status(None, order.status)
 
     @classmethod
     def get_order_by_id(cls, order_id):
-        return cls.all_orders.get(order_id, None)
+        order = cls.all_orders.get(order_id, None)
+        if metrics.enabled:
+            metrics.count(
+                "cache_requests_total", "orders", "miss" if order is None else "hit"
+            )
+        if order is None and sqlstore.active:
+            order = sqlstore.active.load_order(order_id)
+        return order
 
 # BY SAFWAN
 class BookStore:
@@ -410,396 +871,184 @@ class BookStore:
         self.total_sales: float = 0
         self.pending_sales: int = 0
         self.completed_sales: int = 0
+        # seconds from a line of input to its screen being displayed
+        self.latencies: deque = deque(maxlen=1000)
 
-    def update_sales(self):
-        for order in Order.get_all_orders().values():
-            if order.approved:
-                self.completed_sales += 1
-                self.total_sales += order.total
-            else:
-                self.pending_sales += 1
-
-    def run(self) -> None:
-        # EVENTLOOP DECORATOR
-        break_loop_flag = False
-        crash: bool = False
-
-        def eventloop(func):
-            @wraps(func)
-            def wrapper(*args, **kwargs):
-                nonlocal break_loop_flag
-                while True:
-                    func(*args, **kwargs)
-                    if break_loop_flag:
-                        break_loop_flag = False
-                        break
-                    time.sleep(0.09)  # set to 0.09 to avoid keyboard input lag
-
-            return wrapper
+    # load books, customers and employees side by side, returns timings
+    @staticmethod
+    def load_data(data_dir="./data", display=True) -> dict:
+        timings = load_concurrently(
+            [
+                ("books", Book, f"{data_dir}/books.json"),
+                ("customers", Customer, f"{data_dir}/customers.json"),
+                ("employees", Employee, f"{data_dir}/employees.json"),
+            ],
+            display=display,
+        )
+        if display:
+            from IPython.display import clear_output
 
-        # JINJA2 TEMPLATE RENDERER
-        env = Environment(loader=FileSystemLoader("./screens/"))
+            clear_output(wait=True)
+            for label, timing in timings.items():
+                print(f"Loaded {timing['records']} {label} in {timing['seconds']:.2f}s")
+        return timings
+
+    # snapshot (or the JSON files on first run) plus the write-ahead log,
+    # every later mutation is logged until close_data().
+    # backend="sqlite" keeps the data in data_dir/store.db instead, see
+    # sqlstore.py; the log then checkpoints into the database.
+    @staticmethod
+    def open_data(data_dir="./data", display=True, backend="memory") -> dict:
+        snapshot_path = Path(data_dir, "store.snapshot")
+        checkpoint = None
+        if backend == "sqlite":
+            stats = sqlstore.open_store(Path(data_dir, "store.db"), data_dir)
+            snapshot_path, checkpoint = None, sqlstore.active.checkpoint
+        elif snapshot_path.exists():
+            stats = BookStore.load_snapshot(snapshot_path)
+        else:
+            stats = BookStore.load_data(data_dir, display)
+        wal.open_log(
+            Path(data_dir, "store.wal"),
+            snapshot_path,
+            after_seq=stats.get("wal_seq", 0),
+            checkpoint=checkpoint,
+        )
+        return stats
 
-        def render(template_name: str, *args, **kwargs) -> str:
-            return env.get_template(template_name).render(*args, **kwargs)
+    @staticmethod
+    def close_data() -> None:
+        if wal.active:
+            wal.active.compact()
+        wal.close_log()
+        sqlstore.close_store()
+        shards.stop()
+
+    # warm start from / save to a binary snapshot, see snapshot.py
+    @staticmethod
+    def load_snapshot(file_path="./data/store.snapshot") -> dict:
+        from snapshot import load_snapshot
 
-        # MISCELLANEOUS FUNCTIONS
+        return load_snapshot(file_path)
 
-        def break_loop() -> None:
-            nonlocal break_loop_flag
-            break_loop_flag = True
+    @staticmethod
+    def save_snapshot(file_path="./data/store.snapshot") -> int:
+        from snapshot import save_snapshot
 
-        # SEARCH RESULTS SCREEN
-        @eventloop
-        def screen_search(
-            searchTitle, headers, body, noResult=True, noResultMsg="No Reasons Given"
-        ) -> None:
-            clear_output(wait=True)
-            display(
-                HTML(
-                    render(
-                        "search.j2",
-                        searchTitle=searchTitle,
-                        headers=headers,
-                        body=body,
-                        noResult=noResult,
-                        noResultMsg=noResultMsg,
-                    )
-                )
-            )
-            choice = input("Enter your choice: ")
-            match choice:
-                case "BACK":
-                    break_loop()
-                case _:
-                    ...
+        return save_snapshot(file_path)
 
-        # EMPLOYEE SCREENS
-        employeeData = {}
+    # orders as a pandas DataFrame for analysis, the only place pandas is used
+    @staticmethod
+    def orders_frame():
+        try:
+            import pandas as pd
+        except ImportError as e:
+            raise ImportError("orders_frame() needs pandas: pip install pandas") from e
+        return pd.DataFrame(
+            [order.get_order_details() for order in Order.all_orders.values()]
+        )
+
+    # sales and inventory reports (revenue by genre/author/year, top sellers,
+    # stock-out risk, spend per member type), see analytics.py. Built from
+    # the loaded data on first use and kept current from then on.
+    @staticmethod
+    def analytics():
+        from analytics import attach
 
-        @eventloop
-        def screen_employee():
-            clear_output(wait=True)
-            nonlocal employeeData
-            employeeData["userName"] = self.current_user.name
-            employeeData["userEmail"] = self.current_user.email
-            employeeData["userDesignation"] = self.current_user.designation
-            employeeData["pendingOrders"] = Order.get_pending_orders()
-            employeeData["pendingOrdersCount"] = len(employeeData["pendingOrders"])
-            display(HTML(render("employee.j2", employeeData)))
-            choice = input("Enter your choice: ")
-            match choice:
-                case "Logout":
-                    self.current_user.logout()
-                    self.current_user = None
-                    break_loop()
-                case "Confirm Order":
-                    clear_output(wait=True)
-                    renderScreen = "<h1>CONFIRM ORDER</h1><br><h2>PLEASE WAIT</h2>"
-                    choice = input("Enter order id: ")
-                    if order := Order.get_order_by_id(choice):
-                        if order.approve(self.current_user):
-                            renderScreen = "<h1>ORDER APPROVED</h1>"
-                            display(HTML(renderScreen))
-                            time.sleep(2)
-                    else:
-                        renderScreen = "<h1>ORDER NOT FOUND</h1>"
-                        display(HTML(renderScreen))
-                        time.sleep(2)
-                case _:
-                    ...
+        return attach()
 
-        # CUSTOMER SCREENS
-        customerData = {
-            "books": [],
-            "cartTotal": 0,
-            "cartItemsCount": 0,
-        }
+    # answer catalog searches from worker processes over a shared-memory
+    # copy of the catalog, one per core by default, see shards.py
+    @staticmethod
+    def shard_catalog(workers=None):
+        return shards.start(workers)
 
-        @eventloop
-        def screen_customer():
-            nonlocal customerData
-            customerData["userName"] = self.current_user.name
-            customerData["userEmail"] = self.current_user.email
-            customerData["cartTotal"] = self.current_user.cart.total
-            customerData["cartItemsCount"] = len(self.current_user.cart.items)
-            customerData["books"] = self.current_user.cart.getcartDict()
-            if customerData["cartItemsCount"]:
-                df = pd.read_json(json.dumps(customerData["books"]))
-                df["total"] = df["price"] * df["quantity"]
-                customerData["cartItemsCount"] = df["quantity"].sum()
-                customerData["books"] = df.to_dict(orient="records")
-            clear_output(wait=True)
-            display(HTML(render("customer.j2", customerData)))
-            choice = input("Enter your choice: ")
-            match choice:
-                case "All Orders":
-                    clear_output(wait=True)
-                    rednderScreen = "<h1>ALL ORDERS</h1><br><h2>PLEASE WAIT</h2>"
-                    display(HTML(rednderScreen))
-                    clear_output(wait=True)
-                    searchTitle = "ALL ORDERS"
-                    headers = [
-                        "Order ID",
-                        "Total Items",
-                        "Total Price",
-                        "Approved",
-                        "Rejected",
-                    ]
-                    body = [
-                        list(order.get_order_details().values())
-                        for order in self.current_user.orders.values()
-                    ]
-                    screen_search(searchTitle, headers, body, False, "No Orders Found!")
-                case "Search Book":
+    # read from the running order totals, safe to call any number of times
+    def update_sales(self):
+        if sqlstore.active:
+            sales = sqlstore.active.sales()
+            self.completed_sales, self.total_sales = sales["approved"]
+            self.pending_sales = sales["pending"][0]
+            return
+        self.completed_sales = Order.count("approved")
+        self.total_sales = Order.status_totals["approved"]
+        self.pending_sales = Order.count("pending")
+
+    # many sessions at once over TCP instead of the single-user run loop;
+    # metrics_port turns metrics on and serves them there for Prometheus
+    # shard_workers: search from that many worker processes, see shards.py
+    def serve(
+        self, host="127.0.0.1", port=8111, metrics_port=None, shard_workers=None
+    ) -> None:
+        from server import serve
+
+        if metrics_port is not None:
+            metrics.enable()
+            metrics.serve(host, metrics_port)
+        if shard_workers:
+            shards.start(shard_workers)
+        try:
+            serve(self, host, port)
+        finally:
+            shards.stop()
+
+    # shard_workers: search from that many worker processes, see shards.py
+    def run(self, shard_workers=None) -> None:
+        from IPython.display import HTML, clear_output, display
+
+        from renderer import Renderer
+        from session import Session
+
+        # SCREEN LOOP
+        # One flat dispatch loop: show the screen if its view changed, wait
+        # for a line, hand it to the session. No sleeps and no recursion, the
+        # stack stays the same depth however long the user navigates.
+        render = Renderer()
+        session = Session(self, render)
+        shown_view = None
+        keypress_at = None
+        crash: bool = False
+        if shard_workers:
+            shards.start(shard_workers)
+        try:
+            while not session.closed:
+                view = session.view()
+                if view != shown_view:
                     clear_output(wait=True)
-                    renderScreen = "<h1>SEARCH BOOK</h1><br><h2>PLEASE WAIT</h2>"
-                    display(HTML(renderScreen))
-                    searchTitle = "SEARCH BOOK"
-                    while True:
-                        category = input(
-                            "Enter search category (isbn|title|author|genre): "
-                        )
-                        if category in ["isbn", "title", "author", "genre"]:
-                            break
-                    value = input("Enter search value: ")
-                    headers = [
-                        "ISBN",
-                        "Title",
-                        "Author",
-                        "Year",
-                        "Genre",
-                        "Price",
-                        "Quantity",
-                    ]
-                    body = [
-                        list(book.get_book_details().values())
-                        for book in Book.search_by(category=category, value=value)
-                    ]
-                    flag = not bool(body)
-                    screen_search(
-                        searchTitle=searchTitle,
-                        headers=headers,
-                        body=body,
-                        noResult=flag,
-                        noResultMsg="No Books Found!",
+                    display(HTML(session.render(view)))
+                    shown_view = view
+                    if keypress_at is not None:
+                        self.latencies.append(time.perf_counter() - keypress_at)
+                screen, prompted_at = session.screen, time.perf_counter()
+                line = input(session.prompt())
+                keypress_at = time.perf_counter()
+                session.handle(line)
+                if metrics.enabled:
+                    handled_at = time.perf_counter()
+                    metrics.observe(
+                        "input_wait_seconds", keypress_at - prompted_at, screen
                     )
-
-                case "Add Book":
-                    clear_output(wait=True)
-                    renderScreen = "<h1>ADD BOOK</h1><br><h2>ENTER BOOK DETAILS</h2>"
-                    display(HTML(renderScreen))
-
-                    isbn = input("Enter ISBN: ").strip()
-                    qty = 0
-                    while not qty:
-                        try:
-                            qty = int(input("Enter Quantity: ").strip())
-                        except ValueError:
-                            qty = int(
-                                input(
-                                    "Enter Quantity (Please enter a number)!: "
-                                ).strip()
-                            )
-                    if book := Book.getBook(isbn):
-                        if self.current_user.cart.add_book(isbn, qty):
-                            renderScreen = "<h1>ADDED BOOK TO CART</h1>"
-                            display(HTML(renderScreen))
-                            time.sleep(2)
-                    else:
-                        renderScreen = "<h1>Please check ISBN and Quantity!</h1>"
-                        display(HTML(renderScreen))
-                        time.sleep(2)
-
-                case "Remove Book":
-                    clear_output(wait=True)
-                    renderScreen = "<h1>REMOVE BOOK</h1><br><h2>ENTER BOOK DETAILS</h2>"
-                    display(HTML(renderScreen))
-                    isbn = input("Enter ISBN: ").strip()
-                    if Book.getBook(isbn):
-                        if self.current_user.cart.remove_book(isbn):
-                            renderScreen = "<h1>REMOVED BOOK FROM CART</h1>"
-                            display(HTML(renderScreen))
-                            time.sleep(2)
-                    else:
-                        renderScreen = "<h1>Please check ISBN!</h1>"
-                        display(HTML(renderScreen))
-                        time.sleep(2)
-                case "Checkout":
-                    clear_output(wait=True)
-                    renderScreen = (
-                        "<h1>TRYING TO PLACE ORDER</h1><br><h2>PLEASE WAIT</h2>"
+                    metrics.observe(
+                        "input_handle_seconds", handled_at - keypress_at, screen
                     )
-                    display(HTML(renderScreen))
-                    if self.current_user.checkout():
-                        renderScreen = "<h1>ORDER PLACED SUCCESSFULLY</h1>"
-                        display(HTML(renderScreen))
-                        time.sleep(2)
-                    else:
-                        renderScreen = "<h1>ORDER PLACEMENT FAILED</h1>"
-                        display(HTML(renderScreen))
-                        time.sleep(2)
-                case "Logout":
-                    self.current_user.logout()
-                    self.current_user = None
-                    break_loop()
-
-        # SIGNIN SCREEN
-        temp_signin_creds: dict = {}
-
-        @eventloop
-        def screen_signin():
-            nonlocal temp_signin_creds
+                self.current_user = session.user
+                if wal.active:
+                    wal.active.maybe_compact()
             clear_output(wait=True)
-            display(HTML(render("signin.j2", temp_signin_creds)))
-            # DYNAMIC SIGNIN FORM
-            if not temp_signin_creds.get("userEmail", None):
-                temp_signin_creds["userEmail"] = input("Enter your email: ")
-            elif not temp_signin_creds.get("userPin", None):
-                temp_signin_creds["userPin"] = input("Enter your pin: ")
-                temp_signin_creds["signinComplete"] = True  # SIGNIN COMPLETE
-
-            # SIGNIN FORM COMPLETE
-            if temp_signin_creds.get("signinComplete", False):
-                clear_output(wait=True)
-                display(HTML(render("signin.j2", temp_signin_creds)))
-                choice = input("Enter your choice: ")
-                match choice:
-                    case "ENTER":
-                        clear_output(wait=True)
-                        user = Customer.signin(
-                            temp_signin_creds["userEmail"],
-                            temp_signin_creds["userPin"],
-                        )
-                        if user:
-                            temp_str = "<h1>SIGNIN SUCCESSFUL</h1><br><h2>WELCOME</h2>"
-                            display(HTML(temp_str))
-                            self.current_user = user
-                            temp_signin_creds = {}
-                            time.sleep(2)
-                            if user.is_employee:
-                                clear_output(wait=True)
-                                renderScreen = "<h1>REDIRECTING TO EMPLOYEE SCREEN</h1><br><h2>PLEASE WAIT</h2>"
-                                display(HTML(renderScreen))
-                                screen_employee()
-                            else:
-                                clear_output(wait=True)
-                                renderScreen = "<h1>REDIRECTING TO CUSTOMER SCREEN</h1><br><h2>PLEASE WAIT</h2>"
-                                display(HTML(renderScreen))
-                                screen_customer()
-                            break_loop()
-                        else:
-                            temp_str = "<h1>SIGNIN FAILED</h1><br><h2>TRY AGAIN</h2>"
-                            display(HTML(temp_str))
-                            time.sleep(2)
-                            temp_signin_creds = {}
-                    case "CLEAR":
-                        temp_signin_creds = {}
-                    case "BACK":
-                        break_loop()
-                    case _:
-                        ...
-
-        temp_signup_creds: dict = {}
-        # SIGNUP SCREEN
-
-        @eventloop
-        def screen_signup():
-            nonlocal temp_signup_creds
+            display(HTML(render("shutdown.j2", crash=crash)))
+        except Exception as exception:
+            crash = True
             clear_output(wait=True)
-            display(HTML(render("signup.j2", temp_signup_creds)))
-
-            # DYNAMIC SIGNUP FORM
-            if not temp_signup_creds.get("userName", None):
-                temp_signup_creds["userName"] = input("Enter your name: ")
-            elif not temp_signup_creds.get("userEmail", None):
-                temp_signup_creds["userEmail"] = input("Enter your email: ")
-            elif not temp_signup_creds.get("userPin", None):
-                temp_signup_creds["userPin"] = input("Enter your pin: ")
-            elif not temp_signup_creds.get("userAddress", None):
-                temp_signup_creds["userAddress"] = input("Enter your address: ")
-            elif not temp_signup_creds.get("userPhone", None):
-                temp_signup_creds["userPhone"] = input("Enter your phone: ")
-                temp_signup_creds["signupComplete"] = True  # SIGNUP COMPLETE
-
-            # SIGNUP FORM COMPLETE
-            if temp_signup_creds.get("signupComplete", False):
-                clear_output(wait=True)
-                display(HTML(render("signup.j2", temp_signup_creds)))
-                choice = input("Enter your choice: ")
-                match choice:
-                    case "ENTER":
-                        clear_output(wait=True)
-                        user = Customer.signup(**temp_signup_creds)
-                        if user:
-                            tempStr = "<h1>SIGNUP SUCCESSFUL</h1><br><h2>LOGIN TO CONTINUE</h2>"
-                            display(HTML(tempStr))
-                            time.sleep(2)
-                            temp_signup_creds = {}
-                            break_loop()
-                        else:
-                            tempStr = "<h1>SIGNUP FAILED</h1><br><h2>TRY AGAIN</h2>"
-                            display(HTML(tempStr))
-                            time.sleep(2)
-                            temp_signup_creds = {}
-                    case "CLEAR":
-                        temp_signup_creds = {}
-                    case "BACK":
-                        break_loop()
-                    case _:
-                        ...
-
-        # LOGIN SCREEN
-
-        @eventloop
-        def screen_login() -> None:
+            display(HTML(render("shutdown.j2", crash=crash, exception=exception)))
+            logger.exception(exception)
+        except KeyboardInterrupt:
+            crash = True
             clear_output(wait=True)
-            display(HTML(render("login.j2")))
-            choice = input("Enter your choice: ")
-            match choice:
-                case "SIGN UP":
-                    screen_signup()
-                case "SIGN IN":
-                    screen_signin()
-                case "BACK":
-                    break_loop()
-                case _:
-                    ...
-
-        # WELCOME SCREEN
-
-        @eventloop
-        def screen_welcome() -> None:
-            clear_output(wait=True)
-            display(
-                HTML(render("home.j2", storeName=self.name, storeAddress=self.address))
-            )
-            choice = input("Enter your choice: ")
-            match choice:
-                case "LOGIN":
-                    screen_login()
-                case "EXIT":
-                    break_loop()
-                case _:
-                    ...
-
-        # MAINLOOP
-
-        def mainloop():
-            nonlocal crash
-            try:
-                screen_welcome()
-                clear_output(wait=True)
-                display(HTML(render("shutdown.j2", crash=crash)))
-            except Exception as exception:
-                crash = True
-                clear_output(wait=True)
-                display(HTML(render("shutdown.j2", crash=crash, exception=exception)))
-                logger.exception(exception)
-            except KeyboardInterrupt:
-                crash = True
-                clear_output(wait=True)
-                display(HTML(render("shutdown.j2", crash=crash)))
-
-        # RUN MAINLOOP
-        mainloop()
+            display(HTML(render("shutdown.j2", crash=crash)))
+        finally:
+            session.close()
+            self.current_user = None
+            # whatever happened, everything logged so far must reach the disk
+            if wal.active:
+                wal.active.flush()
+            shards.stop()
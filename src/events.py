@@ -0,0 +1,126 @@
+import threading
+from collections import namedtuple
+
+# CHANGE EVENTS
+# An in-process change feed, so screens stop rebuilding themselves on every
+# loop just in case something changed. Book, Cart and Order publish a typed
+# event for each change; a subscriber names the event types it wants and,
+# optionally, the keys it cares about (the first field of every event: an
+# isbn or a customer email) and reads what happened when it is ready to,
+# e.g. right before drawing the screen again.
+# Publishers run inside the stock, cart and order locks, so they never wait
+# on each other: the routes are copied on write (subscribe/close hold _lock)
+# and read without a lock, and an event is dropped into the mailbox of each
+# subscriber that wants it, under that mailbox's own lock, and that is all.
+# Mailboxes coalesce: a second change to the same thing (same book field,
+# same cart line, same order) replaces the first one. A mailbox that still
+# overflows, e.g. a reader that is idle through a big restock feed, is
+# cleared and flagged instead of growing, and its reader resyncs from
+# scratch, which is what a flood of changes would cost it anyway.
+# Indexes and caches that must never be stale (analytics, recommend,
+# shards, sqlstore) keep their synchronous listener hooks in app.py.
+
+LIMIT = 256  # pending changes per subscription before it overflows
+
+
+# first field: the key subscriptions filter on, slot(): what coalesces
+class BookChanged(namedtuple("BookChanged", "isbn field value")):
+    __slots__ = ()
+
+    def slot(self):
+        return (BookChanged, self.isbn, self.field)
+
+
+class CartChanged(namedtuple("CartChanged", "email isbn quantity")):
+    __slots__ = ()
+
+    def slot(self):
+        return (CartChanged, self.email, self.isbn)
+
+
+class OrderChanged(namedtuple("OrderChanged", "email order_id old new")):
+    __slots__ = ()
+
+    def slot(self):
+        return (OrderChanged, self.order_id)
+
+    # one change from the first old status to the last new one
+    def merge(self, newer):
+        return newer._replace(old=self.old)
+
+
+_lock = threading.Lock()  # held by subscribe and close, not by publish
+# event type -> {key or None for every key: frozenset of subscriptions}
+_routes: dict = {}
+
+
+class Subscription:
+    def __init__(self, kinds, keys, limit) -> None:
+        self.kinds = tuple(kinds)
+        self.keys = (None,) if keys is None else set(keys)
+        self.limit = limit
+        self.pending: dict = {}  # slot -> event, oldest first
+        self.overflowed = False
+        self.lock = threading.Lock()
+
+    def __bool__(self) -> bool:
+        return self.overflowed or bool(self.pending)
+
+    # called under self.lock
+    def _put(self, event) -> None:
+        if self.overflowed:
+            return
+        slot = event.slot()
+        older = self.pending.pop(slot, None)
+        if older is not None and hasattr(older, "merge"):
+            event = older.merge(event)
+        self.pending[slot] = event
+        if len(self.pending) > self.limit:
+            self.pending.clear()
+            self.overflowed = True
+
+    # the changes since the last drain, None when there were too many to keep
+    def drain(self):
+        with self.lock:
+            events = None if self.overflowed else list(self.pending.values())
+            self.pending = {}
+            self.overflowed = False
+        return events
+
+    def close(self) -> None:
+        with _lock:
+            for kind in self.kinds:
+                routes = _routes.get(kind)
+                if routes is None:
+                    continue
+                for key in self.keys:
+                    subscriptions = routes.get(key, frozenset()) - {self}
+                    if subscriptions:
+                        routes[key] = subscriptions
+                    else:
+                        routes.pop(key, None)
+                if not routes:
+                    del _routes[kind]
+
+
+# keys None: every event of these types
+def subscribe(kinds, keys=None, limit=LIMIT) -> Subscription:
+    subscription = Subscription(kinds, keys, limit)
+    with _lock:
+        for kind in subscription.kinds:
+            routes = _routes.setdefault(kind, {})
+            for key in subscription.keys:
+                routes[key] = routes.get(key, frozenset()) | {subscription}
+    return subscription
+
+
+# kind(*fields), built only when someone listens for that type
+def publish(kind, *fields) -> None:
+    routes = _routes.get(kind)
+    if routes is None:
+        return
+    event = kind(*fields)
+    for key in (event[0], None):
+        for subscription in routes.get(key, ()):
+            with subscription.lock:
+                subscription._put(event)
@@ -0,0 +1,149 @@
+import hashlib
+import hmac
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import metrics
+
+# HASHING
+# Two jobs that used to share one unsalted sha256:
+# - lookup keys: the user store is keyed by a 16-byte keyed blake2b digest of
+#   the normalized email (trimmed, case-folded), cheap enough for every lookup.
+# - PIN hashes: a salted, deliberately slow KDF stored as
+#   "scheme$params$salt$hash". pbkdf2 by default, scrypt if PIN_SCHEME says
+#   so; plain sha256 hex from older data still verifies and is upgraded on
+#   the next sign-in.
+# The KDFs release the GIL, so hash_many/verify_async run them on a small
+# thread pool instead of stalling every other session. Successful checks are
+# remembered, a returning user does not pay for the KDF again; a wrong PIN
+# always does, so guessing stays as slow as the KDF.
+# A first load from the JSON files hashes every PIN once (about 6 ms each at
+# the default cost), the snapshot keeps the hashes from then on. To make the
+# KDF slower, raise PBKDF2_ITERATIONS (or SCRYPT_COST): stored hashes verify
+# with the parameters they were made with and are upgraded on next sign-in.
+
+LOOKUP_KEY = b"bookstore-users"
+PIN_SCHEME = "pbkdf2"  # or "scrypt"
+PBKDF2_ITERATIONS = 10_000
+SCRYPT_COST = 2**14  # scrypt n, with r=8 and p=1
+SALT_SIZE = 16
+WORKERS = 4
+VERIFIED_CACHE_SIZE = 4096
+
+_pool = None
+_pool_lock = threading.Lock()
+# stored hash -> keyed digest of the PIN that matched it, the key only lives
+# in this process
+_verified: OrderedDict = OrderedDict()
+_verified_key = os.urandom(32)
+_verified_lock = threading.Lock()
+
+
+# a PIN that is hashed already (snapshots, the log, pre-hashed loads),
+# hash_pin passes it through unchanged
+class Hashed(str):
+    pass
+
+
+def normalize_email(email) -> str:
+    return str(email).strip().casefold()
+
+
+def email_key(email) -> bytes:
+    digest = hashlib.blake2b(
+        normalize_email(email).encode(), key=LOOKUP_KEY, digest_size=16
+    )
+    return digest.digest()
+
+
+def hash_pin(pin, scheme=None) -> str:
+    if isinstance(pin, Hashed):
+        return str(pin)
+    scheme = scheme or PIN_SCHEME
+    salt = os.urandom(SALT_SIZE)
+    match scheme:
+        case "pbkdf2":
+            params = str(PBKDF2_ITERATIONS)
+        case "scrypt":
+            params = str(SCRYPT_COST)
+        case _:
+            raise ValueError(f"unknown PIN hashing scheme: {scheme}")
+    digest = _derive(scheme, params, str(pin).encode(), salt)
+    return f"{scheme}${params}${salt.hex()}${digest.hex()}"
+
+
+def verify_pin(pin, stored: str) -> bool:
+    pin = str(pin).encode()
+    with _verified_lock:
+        remembered = _verified.get(stored)
+        if remembered is not None:
+            _verified.move_to_end(stored)
+    # only a match is answered from the cache, a wrong PIN pays for the KDF
+    hit = remembered is not None and hmac.compare_digest(
+        remembered, _remember_digest(pin)
+    )
+    if metrics.enabled:
+        metrics.count("cache_requests_total", "pin", "hit" if hit else "miss")
+    if hit:
+        return True
+    if "$" not in stored:
+        ok = hmac.compare_digest(hashlib.sha256(pin).hexdigest(), stored)
+    else:
+        scheme, params, salt, digest = stored.split("$")
+        derived = _derive(scheme, params, pin, bytes.fromhex(salt))
+        ok = hmac.compare_digest(derived.hex(), digest)
+    if ok:
+        with _verified_lock:
+            _verified[stored] = _remember_digest(pin)
+            if len(_verified) > VERIFIED_CACHE_SIZE:
+                _verified.popitem(last=False)
+    return ok
+
+
+# stored with an older scheme or weaker parameters than the current ones
+def needs_rehash(stored: str) -> bool:
+    if "$" not in stored:
+        return True
+    scheme, params, _, _ = stored.split("$")
+    current = PBKDF2_ITERATIONS if scheme == "pbkdf2" else SCRYPT_COST
+    return scheme != PIN_SCHEME or int(params) < current
+
+
+def forget_verified() -> None:
+    with _verified_lock:
+        _verified.clear()
+
+
+def pool() -> ThreadPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(WORKERS, thread_name_prefix="hashing")
+        return _pool
+
+
+# hash a batch of PINs side by side, e.g. while loading users
+def hash_many(pins) -> list:
+    return [Hashed(digest) for digest in pool().map(hash_pin, pins)]
+
+
+async def verify_async(pin, stored: str) -> bool:
+    import asyncio
+
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(pool(), verify_pin, pin, stored)
+
+
+def _derive(scheme, params, pin: bytes, salt: bytes) -> bytes:
+    match scheme:
+        case "pbkdf2":
+            return hashlib.pbkdf2_hmac("sha256", pin, salt, int(params))
+        case "scrypt":
+            return hashlib.scrypt(pin, salt=salt, n=int(params), r=8, p=1)
+    raise ValueError(f"unknown PIN hashing scheme: {scheme}")
+
+
+def _remember_digest(pin: bytes) -> bytes:
+    return hashlib.blake2b(pin, key=_verified_key, digest_size=32).digest()
@@ -0,0 +1,418 @@
+import re
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+from heapq import nsmallest
+
+# indexes are shared by every session, public methods hold the index lock
+def locked(method):
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.lock:
+            return method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class Index:
+    def __init__(self) -> None:
+        self.lock = threading.RLock()
+
+    # locks cannot be pickled, snapshots get a fresh one
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.RLock()
+
+    # an item's key changed from old_key to key
+    @locked
+    def replace(self, old_key, key, item_id, item) -> None:
+        self.remove(old_key, item_id)
+        self.add(key, item_id, item)
+
+
+# BOOK INDEXES
+# Buckets map a field value to {isbn: book} so lookups cost O(matches) and
+# results keep the order books were added in.
+
+
+class HashIndex(Index):
+    def __init__(self) -> None:
+        super().__init__()
+        self.buckets: dict = {}
+
+    @locked
+    def add(self, key, item_id, item) -> None:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = {}
+        bucket[item_id] = item
+
+    @locked
+    def remove(self, key, item_id) -> None:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return
+        bucket.pop(item_id, None)
+        if not bucket:
+            del self.buckets[key]
+
+    @locked
+    def get(self, key) -> list:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            return []
+        return list(bucket.values())
+
+    # snapshot of the bucket's items so it can be consumed lazily while
+    # other sessions keep updating the index
+    @locked
+    def iter(self, key):
+        return iter(tuple(self.buckets.get(key, {}).values()))
+
+    @locked
+    def count(self, key) -> int:
+        return len(self.buckets.get(key, ()))
+
+    def keys(self):
+        return self.buckets.keys()
+
+    @locked
+    def clear(self) -> None:
+        self.buckets.clear()
+
+
+# TEXT INDEX
+# Case-folded token and trigram postings for prefix/substring search.
+# Inside deferred_updates() new texts are queued and indexed once the
+# outermost block ends, before anyone searches.
+class TextIndex(Index):
+    def __init__(self) -> None:
+        super().__init__()
+        self.texts: dict = {}  # item_id -> folded text
+        self.items: dict = {}  # item_id -> item
+        self.exact: dict = {}  # folded text -> {item_id}
+        self.tokens: dict = {}  # token -> {item_id}
+        self.sorted_tokens: list = []  # rebuilt lazily when None
+        self.grams: dict = {}  # trigram -> {item_id}
+        self.pending: dict = {}  # item_id -> (key, item)
+        self.deferred: int = 0
+
+    @staticmethod
+    def fold(text) -> str:
+        return str(text).casefold().strip()
+
+    @staticmethod
+    def tokenize(folded: str) -> set:
+        return set(_WORDS.findall(folded))
+
+    @staticmethod
+    def trigrams(folded: str) -> set:
+        return {folded[i : i + 3] for i in range(len(folded) - 2)}
+
+    @locked
+    def add(self, key, item_id, item) -> None:
+        if self.deferred:
+            self.pending[item_id] = (key, item)
+            return
+        folded = self.fold(key)
+        self.texts[item_id] = folded
+        self.items[item_id] = item
+        _post(self.exact, folded, item_id)
+        for token in self.tokenize(folded):
+            if _post(self.tokens, token, item_id):
+                self.sorted_tokens = None
+        grams = self.grams
+        for gram in self.trigrams(folded):
+            postings = grams.get(gram)
+            if postings is None:
+                grams[gram] = {item_id}
+            else:
+                postings.add(item_id)
+
+    @locked
+    def remove(self, key, item_id) -> None:
+        if self.pending.pop(item_id, None) is not None:
+            return
+        folded = self.texts.pop(item_id, None)
+        if folded is None:
+            return
+        del self.items[item_id]
+        _discard(self.exact, folded, item_id)
+        for token in self.tokenize(folded):
+            if _discard(self.tokens, token, item_id) and self.sorted_tokens:
+                i = bisect_left(self.sorted_tokens, token)
+                del self.sorted_tokens[i]
+        for gram in self.trigrams(folded):
+            _discard(self.grams, gram, item_id)
+
+    @locked
+    def flush(self) -> None:
+        pending, self.pending = self.pending, {}
+        for item_id, (key, item) in pending.items():
+            self.add(key, item_id, item)
+
+    @contextmanager
+    def deferred_updates(self):
+        with self.lock:
+            self.deferred += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.deferred -= 1
+                if not self.deferred:
+                    self.flush()
+
+    @locked
+    def clear(self) -> None:
+        tables = (self.texts, self.items, self.exact, self.tokens, self.grams)
+        for table in tables + (self.pending,):
+            table.clear()
+        self.sorted_tokens = []
+
+    def _prefixed(self, prefix: str) -> set:
+        if self.sorted_tokens is None:
+            self.sorted_tokens = sorted(self.tokens)
+        tokens = self.sorted_tokens
+        ids = set()
+        i = bisect_left(tokens, prefix)
+        while i < len(tokens) and tokens[i].startswith(prefix):
+            ids |= self.tokens[tokens[i]]
+            i += 1
+        return ids
+
+    def _candidates(self, query: str, mode: str) -> set:
+        match mode:
+            case "casefold":
+                return set(self.exact.get(query, ()))
+            case "prefix":
+                ids = None
+                for token in sorted(self.tokenize(query), key=len, reverse=True):
+                    found = self._prefixed(token)
+                    ids = found if ids is None else ids & found
+                    if not ids:
+                        return set()
+                return ids or set()
+            case "substring":
+                grams = self.trigrams(query)
+                if not grams:
+                    # too short for trigrams, check every distinct text
+                    return {i for i, text in self.texts.items() if query in text}
+                postings = sorted((self.grams.get(g, set()) for g in grams), key=len)
+                ids = postings[0].intersection(*postings[1:])
+                return {i for i in ids if query in self.texts[i]}
+        raise ValueError(f"unknown search mode: {mode}")
+
+    # best first: whole text, text prefix, word prefix, anywhere; then shorter
+    def _rank(self, query: str, item_id) -> tuple:
+        text = self.texts[item_id]
+        if text == query:
+            score = 0
+        elif text.startswith(query):
+            score = 1
+        elif f" {query}" in text:
+            score = 2
+        else:
+            score = 3
+        return (score, len(text), text, str(item_id))
+
+    @locked
+    def search(self, query, mode: str = "substring", limit=None) -> list:
+        return [item for _, item in self.search_ranked(query, mode, limit)]
+
+    # lazy search, best first: ranks the best `first` matches, then four times
+    # more each step, all after the last one given out. A page of a big result
+    # set does not sort all of it.
+    def iter_search(self, query, mode: str = "substring", first=64):
+        after, limit = None, first
+        while ranked := self.search_ranked(query, mode, limit, after):
+            for _, item in ranked:
+                yield item
+            if len(ranked) < limit:
+                return
+            after, limit = ranked[-1][0], limit * 4
+
+    # [(rank, item)] best first, the ranks let partial results be merged;
+    # after: only the matches ranked behind it
+    @locked
+    def search_ranked(
+        self, query, mode: str = "substring", limit=None, after=None
+    ) -> list:
+        if self.pending and not self.deferred:
+            self.flush()  # queued in a snapshot saved by an older version
+        query = self.fold(query)
+        if not query:
+            return []
+        ranked = ((self._rank(query, i), i) for i in self._candidates(query, mode))
+        if after is not None:
+            ranked = (pair for pair in ranked if pair[0] > after)
+        if limit is None:
+            ranked = sorted(ranked)
+        else:
+            ranked = nsmallest(limit, ranked)
+        return [(rank, self.items[i]) for rank, i in ranked]
+
+
+# SORTED INDEX
+# (value, item_id) pairs kept in order for O(log n + k) range queries.
+# Inside deferred_updates() changes are buffered and sorted once at the end.
+class SortedIndex(Index):
+    def __init__(self) -> None:
+        super().__init__()
+        self.keys: list = []
+        self.items: dict = {}
+        self.stale: set = set()
+        self.deferred: int = 0
+        self.dirty: bool = False
+
+    @locked
+    def add(self, key, item_id, item) -> None:
+        self.items[item_id] = item
+        if not self.deferred:
+            insort(self.keys, (key, item_id))
+        elif (key, item_id) in self.stale:
+            self.stale.discard((key, item_id))
+        else:
+            self.keys.append((key, item_id))
+            self.dirty = True
+
+    @locked
+    def remove(self, key, item_id) -> None:
+        if self.items.pop(item_id, None) is None:
+            return
+        if self.deferred:
+            self.stale.add((key, item_id))
+            self.dirty = True
+            return
+        i = bisect_left(self.keys, (key, item_id))
+        if i < len(self.keys) and self.keys[i] == (key, item_id):
+            del self.keys[i]
+
+    @locked
+    def flush(self) -> None:
+        if not self.dirty:
+            return
+        if self.stale:
+            self.keys = [k for k in self.keys if k not in self.stale]
+            self.stale.clear()
+        self.keys.sort()
+        self.dirty = False
+
+    @contextmanager
+    def deferred_updates(self):
+        with self.lock:
+            self.deferred += 1
+        try:
+            yield self
+        finally:
+            with self.lock:
+                self.deferred -= 1
+                if not self.deferred:
+                    self.flush()
+
+    @locked
+    def clear(self) -> None:
+        self.keys.clear()
+        self.items.clear()
+        self.stale.clear()
+        self.dirty = False
+
+    # both bounds are inclusive, None means unbounded
+    @locked
+    def range(self, low=None, high=None, limit=None) -> list:
+        return [item for _, item in self.range_keyed(low, high, limit)]
+
+    # [((value, item_id), item)] in order, the keys let partial results be merged
+    @locked
+    def range_keyed(self, low=None, high=None, limit=None) -> list:
+        self.flush()
+        lo = 0 if low is None else bisect_left(self.keys, low, key=_first)
+        hi = len(self.keys)
+        if high is not None:
+            hi = bisect_right(self.keys, high, lo, key=_first)
+        if limit is not None:
+            hi = min(hi, lo + limit)
+        return [(key, self.items[key[1]]) for key in self.keys[lo:hi]]
+
+
+# LAZY SORTED INDEX
+# A SortedIndex over a field that changes far more often than it is queried
+# (stock, on every reservation). A change only notes the item, without a
+# lock, so changing it never waits on other writers; the next query re-keys
+# what was noted, from the field's value at that moment. A change made
+# while re-keying is noted again, so the index catches up on the next query.
+RESORT_AT = 1024  # noted changes applied with one re-sort instead of insorts
+
+
+class LazySortedIndex(SortedIndex):
+    def __init__(self, field) -> None:
+        super().__init__()
+        self.field = field
+        self.keyed: dict = {}  # item_id -> key it is filed under
+        self.changed: dict = {}  # item_id -> item, since the last query
+
+    def replace(self, old_key, key, item_id, item) -> None:
+        self.changed[item_id] = item
+
+    @locked
+    def add(self, key, item_id, item) -> None:
+        super().add(key, item_id, item)
+        self.keyed[item_id] = key
+
+    # filed under the key it was last re-keyed with, not the caller's
+    @locked
+    def remove(self, key, item_id) -> None:
+        self.changed.pop(item_id, None)
+        super().remove(self.keyed.pop(item_id, key), item_id)
+
+    @locked
+    def clear(self) -> None:
+        super().clear()
+        self.keyed.clear()
+        self.changed.clear()
+
+    @locked
+    def range_keyed(self, low=None, high=None, limit=None) -> list:
+        bulk = len(self.changed) > RESORT_AT
+        with self.deferred_updates() if bulk else nullcontext():
+            # popped one by one, a writer may note more meanwhile
+            while self.changed:
+                item_id, item = self.changed.popitem()
+                if item_id in self.keyed:
+                    self.remove(self.keyed[item_id], item_id)
+                    self.add(getattr(item, self.field), item_id, item)
+        return super().range_keyed(low, high, limit)
+
+
+_WORDS = re.compile(r"[^\W_]+")
+
+
+def _first(pair):
+    return pair[0]
+
+
+# returns True when a new postings set had to be created
+def _post(table: dict, key, item_id) -> bool:
+    postings = table.get(key)
+    if postings is None:
+        table[key] = {item_id}
+        return True
+    postings.add(item_id)
+    return False
+
+
+def _discard(table: dict, key, item_id) -> bool:
+    postings = table.get(key)
+    if postings is None:
+        return False
+    postings.discard(item_id)
+    if not postings:
+        del table[key]
+        return True
+    return False
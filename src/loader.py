@@ -0,0 +1,158 @@
+import codecs
+import csv
+import gc
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from itertools import islice
+
+# STREAMING JSON LOADER
+# Reads a top-level JSON array record by record, so memory stays bounded by
+# one chunk plus one batch instead of the whole file.
+
+CHUNK_SIZE = 1 << 16
+BATCH_SIZE = 2048
+PROGRESS_INTERVAL = 0.25  # seconds between progress redraws
+
+_SEPARATORS = re.compile(r"[\s,]*")
+
+
+def iter_json_array(file_path, chunk_size=CHUNK_SIZE, on_read=None):
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    with open(file_path, "rb") as f:
+        buffer, pos, eof = "", 0, False
+
+        def refill():
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + text.decode(chunk, final=eof)
+            pos = 0
+            if on_read:
+                on_read(f.tell())
+
+        refill()
+        pos = _SEPARATORS.match(buffer, pos).end()
+        if buffer[pos : pos + 1] != "[":
+            raise ValueError(f"{file_path}: expected a JSON array")
+        pos += 1
+        while True:
+            pos = _SEPARATORS.match(buffer, pos).end()
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f"{file_path}: unexpected end of file")
+                refill()
+                continue
+            if buffer[pos] == "]":
+                return
+            try:
+                record, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                refill()  # record is split across chunks
+                continue
+            yield record
+            pos = end
+
+
+# price/quantity feed rows from a .csv file (with a header line) or a JSON
+# array, see Book.apply_feed
+def iter_feed(file_path):
+    if str(file_path).lower().endswith(".csv"):
+        with open(file_path, newline="", encoding="utf-8") as f:
+            yield from csv.DictReader(f)
+    else:
+        yield from iter_json_array(file_path)
+
+
+def iter_batches(records, batch_size=BATCH_SIZE):
+    records = iter(records)
+    while batch := list(islice(records, batch_size)):
+        yield batch
+
+
+# the collector would rescan the growing heap over and over while loading
+@contextmanager
+def paused_gc():
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+# PROGRESS REPORTER
+# One throttled display shared by every loader instead of a redraw per record.
+class LoadProgress:
+    def __init__(self, interval=PROGRESS_INTERVAL, display=True) -> None:
+        self.interval = interval
+        self.display = display
+        self.jobs: dict = {}
+        self.last_draw = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, label, done, total, force=False) -> None:
+        with self.lock:
+            self.jobs[label] = (done, total)
+            now = time.perf_counter()
+            if not self.display or not (force or now - self.last_draw >= self.interval):
+                return
+            from IPython.display import clear_output
+
+            self.last_draw = now
+            lines = []
+            for name, (done, total) in self.jobs.items():
+                percent = 100 * done // total if total else 100
+                lines.append(f"Loading {name}... {percent:3d}%")
+            clear_output(wait=True)
+            print(*lines, sep="\n")
+
+
+def load_records(cls, file_path, label=None, progress=None, batch_size=BATCH_SIZE):
+    label = label or cls.__name__.lower()
+    total = os.path.getsize(file_path)
+    start = time.perf_counter()
+    count = 0
+
+    def on_read(done):
+        if progress:
+            progress.update(label, done, total)
+
+    batching = getattr(cls, "batch_indexing", None)
+    prepare = getattr(cls, "prepare_records", None)
+    with paused_gc(), batching() if batching else nullcontext():
+        records = iter_json_array(file_path, on_read=on_read)
+        for batch in iter_batches(records, batch_size):
+            if prepare:
+                batch = prepare(batch)
+            for record in batch:
+                cls(**record)
+            count += len(batch)
+    if progress:
+        progress.update(label, total, total, force=True)
+    return {"records": count, "seconds": time.perf_counter() - start}
+
+
+# jobs: [(label, cls, file_path)], loaded side by side on a thread pool
+def load_concurrently(jobs, display=True) -> dict:
+    progress = LoadProgress(display=display)
+    start = time.perf_counter()
+    with paused_gc(), ThreadPoolExecutor(max_workers=len(jobs) or 1) as pool:
+        futures = {
+            label: pool.submit(load_records, cls, file_path, label, progress)
+            for label, cls, file_path in jobs
+        }
+        timings = {label: future.result() for label, future in futures.items()}
+    timings["total"] = {
+        "records": sum(t["records"] for t in timings.values()),
+        "seconds": time.perf_counter() - start,
+    }
+    return timings
@@ -0,0 +1,232 @@
+import bisect
+import logging
+import threading
+
+# METRICS
+# In-process counters and histograms for the hot paths: screen renders,
+# input wait vs handling time, searches by category, checkouts and order
+# decisions, cache hits. Nothing leaves the process except through
+# export() (Prometheus text format, also served over HTTP by serve()) and
+# the periodic summary that enable() logs through a QueueHandler, so the
+# thread that records a value never waits on a file.
+# Off by default. Call sites check `metrics.enabled` before doing any work
+# (reading the clock included), so a disabled hook costs one attribute
+# lookup and a branch.
+
+PREFIX = "bookstore_"
+# upper bounds in seconds
+BUCKETS = (1e-5, 5e-5, 1e-4, 5e-4, 1e-3, 5e-3, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+LOG_INTERVAL = 60.0  # seconds between logged summaries
+SLOW_SECONDS = 1.0  # single observations above this are logged right away
+
+# name -> (kind, help, label names)
+DEFINITIONS = {
+    "screen_render_seconds": ("histogram", "Time to render a screen", ("screen",)),
+    "input_wait_seconds": (
+        "histogram",
+        "Time spent waiting for a line of input",
+        ("screen",),
+    ),
+    "input_handle_seconds": (
+        "histogram",
+        "Time spent handling a line of input",
+        ("screen",),
+    ),
+    "search_seconds": ("histogram", "Book search latency", ("category",)),
+    "checkouts_total": ("counter", "Orders placed", ()),
+    "orders_approved_total": ("counter", "Orders approved", ()),
+    "orders_rejected_total": ("counter", "Orders rejected", ()),
+    "cache_requests_total": (
+        "counter",
+        "Cache and registry lookups",
+        ("cache", "result"),
+    ),
+}
+
+enabled = False
+logger = logging.getLogger("metrics")
+_lock = threading.Lock()
+_values: dict = {}  # name -> {label values: count, or [bucket counts, sum, count]}
+_listener = None
+_summary = None  # (thread, stop event)
+
+
+# add amount to a counter
+def count(name, *labels, amount=1) -> None:
+    if not enabled:
+        return
+    with _lock:
+        series = _values.setdefault(name, {})
+        series[labels] = series.get(labels, 0) + amount
+
+
+# record one value (seconds) in a histogram
+def observe(name, seconds, *labels) -> None:
+    if not enabled:
+        return
+    with _lock:
+        series = _values.setdefault(name, {})
+        value = series.get(labels)
+        if value is None:
+            value = series[labels] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        value[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+        value[1] += seconds
+        value[2] += 1
+    if seconds > SLOW_SECONDS:
+        logger.warning("slow %s%s: %.3fs", name, _format_labels(name, labels), seconds)
+
+
+# ENABLE / DISABLE
+# handlers receive the log records on the listener thread; the default is
+# a metrics.log file opened on the first record
+def enable(handlers=None, log_interval=LOG_INTERVAL) -> None:
+    global enabled, _listener, _summary
+    from logging.handlers import QueueHandler, QueueListener
+    from queue import SimpleQueue
+
+    disable()
+    if handlers is None:
+        file_handler = logging.FileHandler("metrics.log", delay=True)
+        file_handler.setFormatter(
+            logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        )
+        handlers = [file_handler]
+    records = SimpleQueue()
+    logger.handlers[:] = [QueueHandler(records)]
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    _listener = QueueListener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    if log_interval:
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=_log_summaries, args=(stop, log_interval), daemon=True
+        )
+        _summary = (thread, stop)
+        thread.start()
+    enabled = True
+
+
+def disable() -> None:
+    global enabled, _listener, _summary
+    enabled = False
+    if _summary is not None:
+        thread, stop = _summary
+        stop.set()
+        thread.join()
+        _summary = None
+    if _listener is not None:
+        _listener.stop()  # writes out whatever is still queued
+        _listener = None
+        logger.handlers.clear()
+
+
+def reset() -> None:
+    with _lock:
+        _values.clear()
+
+
+def _log_summaries(stop, interval) -> None:
+    while not stop.wait(interval):
+        for line in summary():
+            logger.info(line)
+
+
+# READING
+# one line per series: counters as their value, histograms as count, mean
+# and the bucket the 95th percentile falls in
+def summary() -> list:
+    lines = []
+    with _lock:
+        for name, series in sorted(_values.items()):
+            for labels, value in series.items():
+                series_name = name + _format_labels(name, labels)
+                if isinstance(value, int):
+                    lines.append(f"{series_name} {value}")
+                    continue
+                buckets, total, n = value
+                lines.append(
+                    f"{series_name} count={n} mean={total / n * 1e3:.3f}ms "
+                    f"p95<={_percentile(buckets, n, 0.95)}"
+                )
+    return lines
+
+
+def get(name, *labels):
+    with _lock:
+        value = _values.get(name, {}).get(labels)
+        if isinstance(value, list):
+            return {"count": value[2], "sum": value[1]}
+        return value
+
+
+# everything recorded so far in the Prometheus text exposition format
+def export() -> str:
+    lines = []
+    with _lock:
+        for name, (kind, help_text, _) in DEFINITIONS.items():
+            full_name = PREFIX + name
+            lines.append(f"# HELP {full_name} {help_text}")
+            lines.append(f"# TYPE {full_name} {kind}")
+            for labels, value in _values.get(name, {}).items():
+                label_pairs = _label_pairs(name, labels)
+                if kind == "counter":
+                    lines.append(f"{full_name}{_braces(label_pairs)} {value}")
+                    continue
+                buckets, total, n = value
+                cumulative = 0
+                for bound, bucket in zip((*BUCKETS, "+Inf"), buckets):
+                    cumulative += bucket
+                    pairs = label_pairs + [("le", str(bound))]
+                    lines.append(f"{full_name}_bucket{_braces(pairs)} {cumulative}")
+                lines.append(f"{full_name}_sum{_braces(label_pairs)} {total}")
+                lines.append(f"{full_name}_count{_braces(label_pairs)} {n}")
+    return "\n".join(lines) + "\n"
+
+
+# export() over HTTP for a Prometheus scraper, on a daemon thread
+def serve(host="127.0.0.1", port=9111):
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = export().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def _label_pairs(name, labels) -> list:
+    return list(zip(DEFINITIONS.get(name, ("", "", ()))[2], labels))
+
+
+def _braces(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for key, value in pairs
+    )
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+def _format_labels(name, labels) -> str:
+    return _braces(_label_pairs(name, labels))
+
+
+def _percentile(buckets, n, fraction) -> str:
+    seen = 0
+    for bound, bucket in zip((*BUCKETS, "+Inf"), buckets):
+        seen += bucket
+        if seen >= fraction * n:
+            return f"{bound}s" if bound != "+Inf" else bound
+    return "+Inf"
@@ -0,0 +1,186 @@
+import heapq
+import threading
+from operator import itemgetter
+
+from app import Book, Order
+
+# CUSTOMERS ALSO BOUGHT
+# An item-item co-purchase matrix: pairs[a][b] is the number of orders that
+# contain both book a and book b. It is a sparse matrix kept as dict of
+# dicts (scipy's DOK layout), the only layout that takes one order at a time
+# cheaply: each new order adds 1 to the k * (k - 1) cells of its own books
+# through the Order listener, a rejected order takes them off again.
+# Each book's best TOP_PER_BOOK partners are kept in a short sorted list,
+# built on first use and then patched in place as counts go up (a count
+# going down drops the list). "Also bought" reads one list; suggestions for a
+# customer or for a page of search results add up the lists of their books,
+# so serving stays well under a millisecond whatever the order count.
+# The same pattern as analytics.py: attach() builds it once from
+# Order.all_orders and the listener keeps it current.
+
+TOP_PER_BOOK = 50  # partners kept per book, the most any list can use
+HISTORY = 20  # most recent books of a customer that suggestions start from
+SUGGESTIONS = 5
+
+# the recommender the Order listener feeds, None until attach()
+active = None
+
+
+class Recommender:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.pairs: dict = {}  # isbn -> {isbn: orders with both}
+        self.counted: set = set()  # ids of the orders in pairs
+        self.top: dict = {}  # isbn -> [(isbn, count)], best first
+        self.version = 0  # goes up whenever pairs change
+        self.for_customers: dict = {}  # customer key -> (version, orders, isbns)
+
+    # LISTENER
+    # runs under Order.status_lock, an order has a handful of books
+    def on_order(self, order, old, new) -> None:
+        if new == "rejected":
+            self.remove(order)
+        elif old is None:
+            self.add(order)
+
+    def add(self, order) -> None:
+        with self.lock:
+            if order.order_id in self.counted:
+                return
+            self.counted.add(order.order_id)
+            self._count([book.isbn for book in order.items], 1)
+
+    def remove(self, order) -> None:
+        with self.lock:
+            if order.order_id not in self.counted:
+                return
+            self.counted.discard(order.order_id)
+            self._count([book.isbn for book in order.items], -1)
+
+    def _count(self, isbns, delta) -> None:
+        if len(isbns) < 2:
+            return
+        pairs = self.pairs
+        for isbn in isbns:
+            row = pairs.get(isbn)
+            if row is None:
+                row = pairs[isbn] = {}
+            for other in isbns:
+                if other == isbn:
+                    continue
+                count = row.get(other, 0) + delta
+                if count > 0:
+                    row[other] = count
+                else:
+                    row.pop(other, None)
+                self._update_top(isbn, other, count, delta)
+        self.version += 1
+
+    # keeps the cached list the best partners: every book left out has a
+    # count no higher than the last one in
+    def _update_top(self, isbn, other, count, delta) -> None:
+        top = self.top.get(isbn)
+        if top is None:
+            return
+        for i, (partner, _) in enumerate(top):
+            if partner == other:
+                if delta < 0:
+                    del self.top[isbn]  # something left out may now rank higher
+                    return
+                top[i] = (other, count)
+                break
+        else:
+            if delta < 0:
+                return
+            if len(top) < TOP_PER_BOOK:
+                top.append((other, count))
+            elif count > top[-1][1]:
+                top[-1] = (other, count)
+            else:
+                return
+        top.sort(key=itemgetter(1), reverse=True)
+
+    def build(self) -> None:
+        for order in list(Order.all_orders.values()):
+            if order.status != "rejected":
+                self.add(order)
+
+    # QUERIES
+    # the books bought most often together with this one
+    def also_bought(self, isbn, k=SUGGESTIONS) -> list:
+        with self.lock:
+            isbns = [other for other, _ in self._top(isbn)[: k * 2]]
+        return self._books(isbns, (isbn,), k)
+
+    # suggestions for a set of books, e.g. a results page, not in it
+    def for_books(self, isbns, k=SUGGESTIONS) -> list:
+        isbns = list(isbns)
+        with self.lock:
+            best = self._merge(isbns, set(isbns), k * 2)
+        return self._books(best, isbns, k)
+
+    # from the books in the customer's recent orders, leaving those out
+    def for_customer(self, customer, k=SUGGESTIONS) -> list:
+        orders = customer.orders
+        with self.lock:
+            version, order_count, best = self.for_customers.get(
+                customer.key, (-1, -1, [])
+            )
+            if version != self.version or order_count != len(orders):
+                recent = {}  # isbn -> None, most recent order first
+                for order in reversed(orders.values()):
+                    if len(recent) >= HISTORY:
+                        break
+                    if not order.rejected:
+                        for book in order.items:
+                            recent.setdefault(book.isbn)
+                best = self._merge(list(recent)[:HISTORY], recent, k * 2)
+                self.for_customers[customer.key] = (self.version, len(orders), best)
+        return self._books(best, (), k)
+
+    def _top(self, isbn) -> list:
+        top = self.top.get(isbn)
+        if top is None:
+            row = self.pairs.get(isbn, {})
+            top = self.top[isbn] = heapq.nlargest(
+                TOP_PER_BOOK, row.items(), key=itemgetter(1)
+            )
+        return top
+
+    def _merge(self, isbns, exclude, k) -> list:
+        scores: dict = {}
+        for isbn in isbns:
+            for other, count in self._top(isbn):
+                if other not in exclude:
+                    scores[other] = scores.get(other, 0) + count
+        return [
+            isbn for isbn, _ in heapq.nlargest(k, scores.items(), key=itemgetter(1))
+        ]
+
+    # books that still exist and can be bought, at most k of them
+    def _books(self, isbns, exclude, k) -> list:
+        books = []
+        for isbn in isbns:
+            book = Book.all_books.get(isbn)
+            if book is not None and book.quantity > 0 and isbn not in exclude:
+                books.append(book)
+                if len(books) == k:
+                    break
+        return books
+
+
+# build from the current orders and keep up with new ones from then on
+def attach() -> Recommender:
+    global active
+    if active is None:
+        active = Recommender()
+        Order.listeners.append(active.on_order)
+        active.build()
+    return active
+
+
+def detach() -> None:
+    global active
+    if active is not None:
+        Order.listeners.remove(active.on_order)
+        active = None
@@ -0,0 +1,85 @@
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
+
+import metrics
+
+# SCREEN RENDERER
+# Every template in screens/ is compiled once at startup (the compiled
+# bytecode is also cached on disk, so later starts skip the parser), and
+# rendered output is memoized on the template name plus its context: an
+# unchanged home screen or cart is rendered once and then reused, across
+# all sessions.
+
+SCREENS_DIR = Path(__file__).parent / "screens"
+MEMO_SIZE = 512
+SCALARS = frozenset((str, int, float, bool, type(None)))
+
+
+class Renderer:
+    def __init__(self, screens_dir=SCREENS_DIR, cache_dir=None, memo_size=MEMO_SIZE):
+        self.env = Environment(
+            loader=FileSystemLoader(str(screens_dir)),
+            bytecode_cache=FileSystemBytecodeCache(cache_dir),
+            auto_reload=False,
+        )
+        self.templates: dict = {
+            name: self.env.get_template(name)
+            for name in self.env.list_templates(extensions=["j2"])
+        }
+        self.memo: OrderedDict = OrderedDict()
+        self.memo_size = memo_size
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, template_name: str, *args, **kwargs) -> str:
+        context = dict(*args, **kwargs)
+        try:
+            key = (template_name, freeze(context))
+            hash(key)
+        except TypeError:
+            return self.render(template_name, context)  # not memoizable
+        with self.lock:
+            html = self.memo.get(key)
+            if html is not None:
+                self.memo.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        if metrics.enabled:
+            metrics.count(
+                "cache_requests_total", "render", "miss" if html is None else "hit"
+            )
+        if html is not None:
+            return html
+        html = self.render(template_name, context)
+        with self.lock:
+            self.memo[key] = html
+            if len(self.memo) > self.memo_size:
+                self.memo.popitem(last=False)
+        return html
+
+    def render(self, template_name: str, context: dict) -> str:
+        template = self.templates.get(template_name)
+        if template is None:
+            template = self.templates[template_name] = self.env.get_template(
+                template_name
+            )
+        return template.render(context)
+
+
+# hashable stand-in for a render context made of dicts, lists and scalars.
+# Scalars keep their type: 0, 0.0 and False are equal but render differently.
+def freeze(value):
+    if isinstance(value, dict):
+        return tuple((k, freeze(v)) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        items = tuple(value)
+        types = tuple(map(type, items))
+        if SCALARS.issuperset(types):  # a row of plain values, no deeper walk
+            return types, items
+        return tuple(freeze(v) for v in items)
+    return type(value), value
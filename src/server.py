@@ -0,0 +1,106 @@
+import asyncio
+import itertools
+import json
+import time
+
+import hashing
+import metrics
+import wal
+from renderer import Renderer
+from session import Session
+
+# SESSION SERVER
+# Serves many people at once over a plain line protocol on TCP. Each line a
+# client sends answers the current prompt; each reply is one JSON line
+# {"session": id, "screen": html, "prompt": text}. Every connection gets its
+# own Session, so nothing is shared between people except the store itself.
+# Like the notebook loop, the write-ahead log is compacted between
+# interactions once it is long enough, and flushed when the server stops.
+
+HOST = "127.0.0.1"
+PORT = 8111
+BACKLOG = 4096
+# screens whose input runs a PIN hash, handled on the hashing pool so the
+# event loop keeps serving everyone else meanwhile
+HASHING_SCREENS = {"signin", "signup"}
+
+
+class SessionServer:
+    def __init__(self, store, host=HOST, port=PORT) -> None:
+        self.store = store
+        self.host = host
+        self.port = port
+        self.render = Renderer()
+        self.sessions: dict = {}
+        self.session_ids = itertools.count(1)
+        self.server = None
+
+    async def start(self):
+        self.server = await asyncio.start_server(
+            self.handle_client, self.host, self.port, backlog=BACKLOG
+        )
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self.server
+
+    async def serve_forever(self) -> None:
+        if self.server is None:
+            await self.start()
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def stop(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def handle_client(self, reader, writer) -> None:
+        session_id = next(self.session_ids)
+        session = self.sessions[session_id] = Session(self.store, self.render)
+        try:
+            await self.send(writer, session_id, session)
+            loop = asyncio.get_running_loop()
+            while not session.closed:
+                screen, prompted_at = session.screen, time.perf_counter()
+                if not (line := await reader.readline()):
+                    break
+                line = line.decode("utf-8", errors="replace")
+                received_at = time.perf_counter()
+                if session.screen in HASHING_SCREENS:
+                    await loop.run_in_executor(hashing.pool(), session.handle, line)
+                else:
+                    session.handle(line)
+                if metrics.enabled:
+                    handled_at = time.perf_counter()
+                    metrics.observe(
+                        "input_wait_seconds", received_at - prompted_at, screen
+                    )
+                    metrics.observe(
+                        "input_handle_seconds", handled_at - received_at, screen
+                    )
+                if wal.active:
+                    wal.active.maybe_compact()
+                await self.send(writer, session_id, session)
+        except ConnectionError:
+            pass
+        finally:
+            session.close()
+            del self.sessions[session_id]
+            writer.close()
+
+    async def send(self, writer, session_id, session) -> None:
+        reply = {
+            "session": session_id,
+            "screen": session.render(),
+            "prompt": "" if session.closed else session.prompt(),
+        }
+        writer.write(json.dumps(reply).encode() + b"\n")
+        await writer.drain()
+
+
+def serve(store, host=HOST, port=PORT) -> None:
+    try:
+        asyncio.run(SessionServer(store, host, port).serve_forever())
+    finally:
+        # however the server stopped, everything logged so far must reach the disk
+        if wal.active:
+            wal.active.flush()
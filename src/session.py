@@ -0,0 +1,479 @@
+import time
+from itertools import islice
+from pathlib import Path
+
+import metrics
+import recommend
+from app import Book, Customer, Order, User
+from events import BookChanged, CartChanged, OrderChanged, subscribe
+from loader import iter_feed
+
+# SESSION STATE MACHINE
+# One Session per person using the store. It holds everything the old
+# BookStore.run closures kept in nonlocals (current user, half-filled forms,
+# the last search) and moves between screens on each line of input, so the
+# same flow can be driven by input() or by a network connection.
+# The customer, employee and results screens subscribe to the change events
+# that can alter them (events.py) and keep the context they last built
+# until one arrives, instead of re-reading the cart or the pending orders
+# every time the screen is shown. Suggestions on the customer screen follow
+# the customer's own cart and orders, not everyone else's.
+
+CHOICE_PROMPT = "Enter your choice: "
+PAGE_SIZE = 20  # rows per results page
+SEARCH_CATEGORIES = ["isbn", "title", "author", "genre"]
+# Update Stock reads feed files from here only: the name is typed by whoever
+# is signed in, over the network in server mode
+FEEDS_DIR = Path("./data/feeds")
+
+# form name -> [(field, prompt)], asked in order until every field is set
+FORMS = {
+    "signin": [
+        ("userEmail", "Enter your email: "),
+        ("userPin", "Enter your pin: "),
+    ],
+    "signup": [
+        ("userName", "Enter your name: "),
+        ("userEmail", "Enter your email: "),
+        ("userPin", "Enter your pin: "),
+        ("userAddress", "Enter your address: "),
+        ("userPhone", "Enter your phone: "),
+    ],
+    "search": [
+        ("category", "Enter search category (isbn|title|author|genre): "),
+        ("value", "Enter search value: "),
+    ],
+    "add": [
+        ("isbn", "Enter ISBN: "),
+        ("qty", "Enter Quantity: "),
+    ],
+    "remove": [
+        ("isbn", "Enter ISBN: "),
+    ],
+    "confirm": [
+        ("order_id", "Enter order id(s): "),
+    ],
+    "reject": [
+        ("order_id", "Enter order id(s): "),
+    ],
+    "feed": [
+        ("path", "Enter a feed file in data/feeds (CSV or JSON): "),
+    ],
+}
+
+# shown while a customer/employee task is asking for its fields
+TASK_SCREENS = {
+    "search": "<h1>SEARCH BOOK</h1><br><h2>PLEASE WAIT</h2>",
+    "add": "<h1>ADD BOOK</h1><br><h2>ENTER BOOK DETAILS</h2>",
+    "remove": "<h1>REMOVE BOOK</h1><br><h2>ENTER BOOK DETAILS</h2>",
+    "confirm": "<h1>CONFIRM ORDER</h1><br><h2>PLEASE WAIT</h2>",
+    "reject": "<h1>REJECT ORDER</h1><br><h2>PLEASE WAIT</h2>",
+    "feed": "<h1>UPDATE STOCK</h1><br><h2>PLEASE WAIT</h2>",
+}
+
+EMPLOYEE_TASKS = {
+    "Confirm Order": "confirm",
+    "Reject Order": "reject",
+    "Update Stock": "feed",
+}
+
+BOOK_HEADERS = ["ISBN", "Title", "Author", "Year", "Genre", "Price", "Quantity"]
+ORDER_HEADERS = ["Order ID", "Total Items", "Total Price", "Approved", "Rejected"]
+
+
+class Session:
+    def __init__(self, store, render) -> None:
+        self.store = store
+        self.render_template = render
+        self.user: User = None
+        self.screen: str = "welcome"
+        self.form_name: str = None  # form being filled in, if any
+        self.form: dict = {}
+        self.task: str = None  # customer/employee action waiting for input
+        self.results: dict = {}  # page of the table on the results screen
+        self.results_source = None  # () -> iterator over every result
+        self.results_seen: list = []  # results fetched so far, in order
+        self.results_rest = None  # iterator over the ones not fetched yet
+        self.results_rerun: bool = False  # refetch when the page refreshes
+        self.results_row = None  # result -> table row
+        self.results_suggest = None  # page of results -> books to suggest
+        self.results_watch = None  # page of results -> (event types, keys)
+        self.page: int = 0
+        self.previous: str = None  # screen the results screen goes back to
+        self.message: str = ""  # one-off banner shown above the next screen
+        self.closed: bool = False
+        self.recommender = recommend.attach()
+        self.feed = None  # subscription to the changes of the screen shown
+        self.live_screen: str = None  # screen the feed and context belong to
+        self.live_context: dict = None
+
+    # instance methods
+    def prompt(self) -> str:
+        if field := self._missing_field():
+            if field == "qty" and self.form.get("qtyError"):
+                return "Enter Quantity (Please enter a number)!: "
+            return dict(FORMS[self.form_name])[field]
+        return CHOICE_PROMPT
+
+    # (banner, template, context) that fully describes the next screen,
+    # equal views render to the same HTML
+    def view(self) -> tuple:
+        return (self.message, *self._screen_view())
+
+    def render(self, view=None) -> str:
+        message, template_name, context = view or self.view()
+        if template_name is None:
+            return message + context
+        if not metrics.enabled:
+            return message + self.render_template(template_name, context)
+        start = time.perf_counter()
+        html = message + self.render_template(template_name, context)
+        screen = template_name.removesuffix(".j2")
+        metrics.observe("screen_render_seconds", time.perf_counter() - start, screen)
+        return html
+
+    def handle(self, line: str) -> None:
+        self.message = ""
+        line = line.strip()
+        if field := self._missing_field():
+            self._fill(field, line)
+            if self.task and not self._missing_field():
+                self._run_task()
+            return
+        getattr(self, f"on_{self.screen}")(line)
+
+    def close(self) -> None:
+        self._watch(None)
+        if self.user:
+            self.user.logout()
+            self.user = None
+        self.closed = True
+        self.screen = "closed"
+
+    # FORMS
+    def _start_form(self, form_name) -> None:
+        self.form_name = form_name
+        self.form = {}
+
+    def _missing_field(self):
+        for field, _ in FORMS.get(self.form_name, ()):
+            if not self.form.get(field):
+                return field
+        return None
+
+    def _fill(self, field, value) -> None:
+        match field:
+            case "category" if value not in SEARCH_CATEGORIES:
+                return
+            case "qty":
+                try:
+                    value = int(value)
+                except ValueError:
+                    self.form["qtyError"] = True
+                    return
+        self.form[field] = value
+        if not self._missing_field():
+            self.form[f"{self.form_name}Complete"] = True
+
+    # SCREENS
+    def _screen_view(self) -> tuple:
+        match self.screen:
+            case "welcome":
+                return "home.j2", {
+                    "storeName": self.store.name,
+                    "storeAddress": self.store.address,
+                }
+            case "login":
+                return "login.j2", {}
+            case "signin" | "signup":
+                return f"{self.screen}.j2", dict(self.form)
+            case "customer" | "employee" if self.task:
+                return None, TASK_SCREENS[self.task]
+            case "customer":
+                return "customer.j2", self._live(
+                    self.customer_data, (CartChanged, OrderChanged), [self.user.email]
+                )
+            case "employee":
+                return "employee.j2", self._live(self.employee_data, (OrderChanged,))
+            case "results":
+                if self.feed:  # something on this page changed
+                    if self.results_rerun:
+                        self._fetch_results()
+                    self.show_page(self.page)
+                return "search.j2", self.results
+            case "closed":
+                return "shutdown.j2", {"crash": False}
+
+    def customer_data(self) -> dict:
+        cart = self.user.cart
+        return {
+            "userName": self.user.name,
+            "userEmail": self.user.email,
+            "cartTotal": cart.total,
+            "cartItemsCount": cart.count,
+            "books": cart.getcartDict(),
+            "suggestions": [
+                suggestion_row(book)
+                for book in self.recommender.for_customer(self.user)
+            ],
+        }
+
+    # the screen's context, built again only after a change it subscribed to
+    def _live(self, build, kinds, keys=None) -> dict:
+        if self.live_screen != self.screen:
+            self._watch(kinds, keys)
+            self.live_context = None
+        if self.live_context is None or self.feed:
+            self.feed.drain()  # before building, a later change is kept
+            self.live_context = build()
+        return self.live_context
+
+    # kinds None: stop following changes
+    def _watch(self, kinds, keys=None) -> None:
+        if self.feed is not None:
+            self.feed.close()
+        self.feed = None if kinds is None else subscribe(kinds, keys)
+        self.live_screen = None if kinds is None else self.screen
+
+    def employee_data(self) -> dict:
+        pending_orders = Order.get_pending_orders()
+        return {
+            "userName": self.user.name,
+            "userEmail": self.user.email,
+            "userDesignation": self.user.designation,
+            "pendingOrders": pending_orders,
+            "pendingOrdersCount": len(pending_orders),
+        }
+
+    # results are paged lazily: only the visible rows are ever built, so
+    # memory and render time do not grow with the size of the result set.
+    # The source runs once per view and the results fetched are kept, so
+    # NEXT/PREV and refreshes do not search again; rows are built from the
+    # live objects. rerun: the results can gain rows, refetch on a refresh.
+    def show_results(
+        self,
+        title,
+        headers,
+        source,
+        to_row,
+        no_result_msg,
+        suggest=None,
+        watch=None,
+        rerun=False,
+    ) -> None:
+        self.previous = self.screen
+        self.screen = "results"
+        self.results_source = source
+        self.results_rerun = rerun
+        self._fetch_results()
+        self.results_row = to_row
+        self.results_suggest = suggest
+        self.results_watch = watch
+        self.results = {
+            "searchTitle": title,
+            "headers": headers,
+            "noResultMsg": no_result_msg,
+        }
+        self.show_page(0)
+
+    def _fetch_results(self) -> None:
+        self.results_seen = []
+        self.results_rest = self.results_source()
+
+    def show_page(self, page) -> None:
+        start = page * PAGE_SIZE
+        # one extra result tells whether there is a next page
+        stop = start + PAGE_SIZE + 1
+        seen = self.results_seen
+        if len(seen) < stop and self.results_rest is not None:
+            seen.extend(islice(self.results_rest, stop - len(seen)))
+            if len(seen) < stop:
+                self.results_rest = None
+        items = seen[start:stop]
+        watch = self.results_watch(items[:PAGE_SIZE]) if self.results_watch else (None,)
+        self._watch(*watch)
+        body = [self.results_row(item) for item in items[:PAGE_SIZE]]
+        suggestions = []
+        if self.results_suggest and body:
+            suggestions = self.results_suggest(items[:PAGE_SIZE])
+        self.page = page
+        self.results = dict(
+            self.results,
+            body=body,
+            suggestions=[suggestion_row(item) for item in suggestions],
+            noResult=not body and page == 0,
+            page=page + 1,
+            hasPrev=page > 0,
+            hasNext=len(items) > PAGE_SIZE,
+        )
+
+    def logout(self) -> None:
+        self._watch(None)
+        self.user.logout()
+        self.user = None
+        self.screen = "login"
+
+    def on_welcome(self, choice) -> None:
+        match choice:
+            case "LOGIN":
+                self.screen = "login"
+            case "EXIT":
+                self.close()
+
+    def on_login(self, choice) -> None:
+        match choice:
+            case "SIGN UP" | "SIGN IN":
+                self.screen = "signup" if choice == "SIGN UP" else "signin"
+                self._start_form(self.screen)
+            case "BACK":
+                self.screen = "welcome"
+
+    def on_signin(self, choice) -> None:
+        match choice:
+            case "ENTER":
+                user = User.signin(self.form["userEmail"], self.form["userPin"])
+                self._start_form("signin")
+                if user:
+                    self.message = "<h1>SIGNIN SUCCESSFUL</h1><br><h2>WELCOME</h2>"
+                    self.user = user
+                    self.screen = "employee" if user.is_employee else "customer"
+                    self.form_name = None
+                else:
+                    self.message = "<h1>SIGNIN FAILED</h1><br><h2>TRY AGAIN</h2>"
+            case "CLEAR":
+                self._start_form("signin")
+            case "BACK":
+                self.form_name = None
+                self.screen = "login"
+
+    def on_signup(self, choice) -> None:
+        match choice:
+            case "ENTER":
+                user = Customer.signup(
+                    name=self.form["userName"],
+                    email=self.form["userEmail"],
+                    pin=self.form["userPin"],
+                    address=self.form["userAddress"],
+                    phone=self.form["userPhone"],
+                )
+                self._start_form("signup")
+                if user:
+                    self.message = (
+                        "<h1>SIGNUP SUCCESSFUL</h1><br><h2>LOGIN TO CONTINUE</h2>"
+                    )
+                    self.form_name = None
+                    self.screen = "login"
+                else:
+                    self.message = "<h1>SIGNUP FAILED</h1><br><h2>TRY AGAIN</h2>"
+            case "CLEAR":
+                self._start_form("signup")
+            case "BACK":
+                self.form_name = None
+                self.screen = "login"
+
+    def on_customer(self, choice) -> None:
+        match choice:
+            case "All Orders":
+                orders, email = self.user.orders, self.user.email
+                self.show_results(
+                    "ALL ORDERS",
+                    ORDER_HEADERS,
+                    lambda: iter(tuple(orders.values())),
+                    lambda order: list(order.get_order_details().values()),
+                    "No Orders Found!",
+                    watch=lambda page: ((OrderChanged,), [email]),
+                    rerun=True,
+                )
+            case "Search Book" | "Add Book" | "Remove Book":
+                self.task = choice.split()[0].lower()
+                self._start_form(self.task)
+            case "Checkout":
+                if self.user.checkout():
+                    self.message = "<h1>ORDER PLACED SUCCESSFULLY</h1>"
+                else:
+                    self.message = "<h1>ORDER PLACEMENT FAILED</h1>"
+            case "Logout":
+                self.logout()
+
+    def on_employee(self, choice) -> None:
+        match choice:
+            case "Confirm Order" | "Reject Order" | "Update Stock":
+                self.task = EMPLOYEE_TASKS[choice]
+                self._start_form(self.task)
+            case "Logout":
+                self.logout()
+
+    def on_results(self, choice) -> None:
+        match choice:
+            case "BACK":
+                self.screen = self.previous
+            case "NEXT" if self.results["hasNext"]:
+                self.show_page(self.page + 1)
+            case "PREV" if self.results["hasPrev"]:
+                self.show_page(self.page - 1)
+
+    # TASKS
+    def _run_task(self) -> None:
+        task, form = self.task, self.form
+        self.task, self.form_name, self.form = None, None, {}
+        match task:
+            case "search":
+                self.search(form["category"], form["value"])
+            case "add":
+                if Book.getBook(form["isbn"]) and self.user.cart.add_book(
+                    form["isbn"], form["qty"]
+                ):
+                    self.message = "<h1>ADDED BOOK TO CART</h1>"
+                else:
+                    self.message = "<h1>Please check ISBN and Quantity!</h1>"
+            case "remove":
+                if self.user.cart.remove_book(form["isbn"]):
+                    self.message = "<h1>REMOVED BOOK FROM CART</h1>"
+                else:
+                    self.message = "<h1>Please check ISBN!</h1>"
+            case "confirm" | "reject":
+                # several ids at once, separated by commas or spaces
+                order_ids = form["order_id"].replace(",", " ").split()
+                if task == "confirm":
+                    done = Order.approve_many(order_ids, self.user)
+                else:
+                    done = Order.cancel_many(order_ids, self.user)
+                if done:
+                    action = "APPROVED" if task == "confirm" else "REJECTED"
+                    self.message = f"<h1>{len(done)} ORDER(S) {action}</h1>"
+                elif task == "confirm":
+                    self.message = "<h1>ORDER NOT FOUND OR ALREADY REJECTED</h1>"
+                else:
+                    self.message = "<h1>ORDER NOT FOUND</h1>"
+            case "feed":
+                feeds = FEEDS_DIR.resolve()
+                path = (feeds / form["path"]).resolve()
+                try:
+                    if not path.is_relative_to(feeds):
+                        raise ValueError(f"feed outside {FEEDS_DIR}: {path}")
+                    count = Book.apply_feed(iter_feed(path), self.user)
+                except (OSError, ValueError, KeyError):
+                    self.message = "<h1>Please check the feed file!</h1>"
+                else:
+                    self.message = f"<h1>UPDATED {count} BOOK(S)</h1>"
+
+    def search(self, category, value) -> None:
+        mode = "substring" if category in ["title", "author"] else "exact"
+        start = time.perf_counter()
+        self.show_results(
+            "SEARCH BOOK",
+            BOOK_HEADERS,
+            lambda: Book.iter_search_by(category, value, mode),
+            lambda book: list(book.get_book_details().values()),
+            "No Books Found!",
+            lambda books: self.recommender.for_books(book.isbn for book in books),
+            lambda books: ((BookChanged,), [book.isbn for book in books]),
+        )
+        # the first page is fetched by now
+        if metrics.enabled:
+            metrics.observe("search_seconds", time.perf_counter() - start, category)
+
+
+# "customers also bought" entry on the customer and results screens
+def suggestion_row(book) -> dict:
+    return {"isbn": book.isbn, "title": book.title, "price": book.price}
@@ -0,0 +1,343 @@
+import heapq
+import itertools
+import json
+import mmap
+import os
+import threading
+from array import array
+from concurrent.futures import Future
+from itertools import islice
+
+from indexes import HashIndex, SortedIndex, TextIndex
+
+# SHARDED CATALOG
+# Read-heavy search spread over worker processes, so searches are not all
+# run by the one core that holds the GIL. The catalog (isbn, title, author,
+# genre, year and price of every book) is written once to a file in
+# /dev/shm and mapped by every worker, no worker gets its own copy of it.
+# Worker i owns rows lo..hi of the file and builds the same indexes the
+# Book class keeps, but only for its rows and keyed by row number.
+# Book.search_by, Book.iter_search_by (the search screen) and
+# Book.search_range fan a query out to every shard and merge the partial
+# results: exact matches in catalog order, text matches by TextIndex rank,
+# ranges by (value, isbn), so the answers are the ones the in-process
+# indexes give.
+# The file is a snapshot. A field changed since (a new book changes all of
+# them) is answered in process again until refresh() writes a new one.
+# Quantity changes with every cart, it is never sharded.
+
+TEXT_FIELDS = ("isbn", "title", "author", "genre")
+NUMBER_FIELDS = {"year": "q", "price": "d"}
+SHARDED = {"title", "author", "genre", "year", "price"}
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+# workers start clean instead of with a forked copy of the parent's heap
+# (and of locks other threads may hold at that moment)
+START_METHOD = "spawn"
+ITER_FIRST = 64  # results fetched by the first step of iter_search
+
+# the catalog Book queries fan out to, None when searching in process
+active = None
+
+
+# CATALOG FILE
+# 8-byte header size, a JSON header, then 8-byte aligned arrays: row offsets
+# and a UTF-8 blob for each text field, one array per number field
+def write_catalog(books, directory=SHM_DIR) -> str:
+    import tempfile
+
+    arrays, layout, position = [], {}, 0
+
+    def place(name, data: bytes) -> None:
+        nonlocal position
+        layout[name] = (position, len(data))
+        arrays.append(data + bytes(-len(data) % 8))
+        position += len(data) + -len(data) % 8
+
+    for field in TEXT_FIELDS:
+        encoded = [str(getattr(book, field)).encode() for book in books]
+        offsets = array("q", itertools.accumulate(map(len, encoded), initial=0))
+        place(f"{field}.offsets", offsets.tobytes())
+        place(field, b"".join(encoded))
+    for field, code in NUMBER_FIELDS.items():
+        place(field, array(code, (getattr(book, field) for book in books)).tobytes())
+    header = json.dumps({"count": len(books), "layout": layout}).encode()
+    header += b" " * (-len(header) % 8)
+    fd, path = tempfile.mkstemp(prefix="catalog-", suffix=".bin", dir=directory)
+    with os.fdopen(fd, "wb") as f:
+        f.write(len(header).to_bytes(8, "little"))
+        f.write(header)
+        f.writelines(arrays)
+    return path
+
+
+class Catalog:
+    def __init__(self, path) -> None:
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        size = int.from_bytes(self.map[:8], "little")
+        header = json.loads(self.map[8 : 8 + size])
+        self.count = header["count"]
+        self.view = memoryview(self.map)[8 + size :]
+        self.columns = {}
+        for name, (start, length) in header["layout"].items():
+            self.columns[name] = self.view[start : start + length]
+        for field in TEXT_FIELDS:
+            name = f"{field}.offsets"
+            self.columns[name] = self.columns[name].cast("q")
+        for field, code in NUMBER_FIELDS.items():
+            self.columns[field] = self.columns[field].cast(code)
+
+    def text(self, field, row) -> str:
+        offsets = self.columns[f"{field}.offsets"]
+        return bytes(self.columns[field][offsets[row] : offsets[row + 1]]).decode()
+
+    def number(self, field, row):
+        return self.columns[field][row]
+
+    def close(self) -> None:
+        for name in list(self.columns):
+            self.columns[name].release()
+        self.view.release()
+        self.map.close()
+
+
+# WORKERS
+# one process per shard, answering requests from its pipe in order
+class ShardIndexes:
+    def __init__(self, catalog: Catalog, lo, hi) -> None:
+        self.catalog = catalog
+        self.exact = {field: HashIndex() for field in ("title", "author", "genre")}
+        self.text = {field: TextIndex() for field in ("title", "author")}
+        self.sorted = {field: SortedIndex() for field in NUMBER_FIELDS}
+        with self.text["title"].deferred_updates(), self.text[
+            "author"
+        ].deferred_updates(), self.sorted["year"].deferred_updates(), self.sorted[
+            "price"
+        ].deferred_updates():
+            for row in range(lo, hi):
+                isbn = catalog.text("isbn", row)
+                for field, index in self.exact.items():
+                    value = catalog.text(field, row)
+                    index.add(value, row, row)
+                    if field in self.text:
+                        self.text[field].add(value, isbn, row)
+                for field, index in self.sorted.items():
+                    index.add(catalog.number(field, row), isbn, row)
+
+    def search(self, category, value, mode, limit) -> list:
+        if category in self.text and mode != "exact":
+            return self.text[category].search_ranked(value, mode, limit)
+        return self.exact[category].get(value)[:limit]
+
+    def range(self, category, low, high, limit) -> list:
+        return self.sorted[category].range_keyed(low, high, limit)
+
+
+def _serve_shard(conn, path, lo, hi) -> None:
+    catalog = Catalog(path)
+    shard = ShardIndexes(catalog, lo, hi)
+    conn.send(("ready", hi - lo))
+    while True:
+        try:
+            request_id, method, args = conn.recv()
+        except EOFError:
+            break
+        if method == "stop":
+            break
+        try:
+            conn.send((request_id, True, getattr(shard, method)(*args)))
+        except Exception as e:  # the caller raises it
+            conn.send((request_id, False, e))
+    catalog.close()
+
+
+# PARENT SIDE
+# requests to a shard are pipelined: any number of threads can have one
+# outstanding, a reader thread hands each reply to its future
+class Shard:
+    def __init__(self, context, path, lo, hi) -> None:
+        self.conn, child = context.Pipe()
+        self.process = context.Process(
+            target=_serve_shard, args=(child, path, lo, hi), daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.pending: dict = {}
+        self.ids = itertools.count()
+        self.send_lock = threading.Lock()
+        self.reader = None
+
+    def wait_ready(self) -> int:
+        _, rows = self.conn.recv()
+        self.reader = threading.Thread(target=self._read, daemon=True)
+        self.reader.start()
+        return rows
+
+    def call(self, method, *args) -> Future:
+        future = Future()
+        with self.send_lock:
+            request_id = next(self.ids)
+            self.pending[request_id] = future
+            self.conn.send((request_id, method, args))
+        return future
+
+    def _read(self) -> None:
+        while True:
+            try:
+                request_id, ok, result = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            future = self.pending.pop(request_id)
+            if ok:
+                future.set_result(result)
+            else:
+                future.set_exception(result)
+        for future in self.pending.values():
+            future.set_exception(EOFError("shard worker exited"))
+
+    def stop(self) -> None:
+        with self.send_lock:
+            try:
+                self.conn.send((None, "stop", ()))
+            except OSError:
+                pass
+        self.process.join()
+        if self.reader is not None:
+            self.reader.join()
+        self.conn.close()
+
+
+class ShardedCatalog:
+    def __init__(self, workers=None) -> None:
+        import multiprocessing
+
+        self.workers = workers or os.cpu_count() or 1
+        self.context = multiprocessing.get_context(START_METHOD)
+        self.shards: list = []
+        self.isbns: list = []  # row -> isbn
+        self.path = None
+        self.stale: set = set()  # fields changed since the file was written
+        self.lock = threading.Lock()
+
+    # write the catalog file from Book.all_books and (re)start the workers
+    def refresh(self) -> None:
+        from app import Book
+
+        books = list(Book.all_books.values())
+        path = write_catalog(books)
+        size = -(-len(books) // self.workers)  # rows per shard, rounded up
+        shards = []
+        try:
+            for lo in range(0, len(books) or 1, size or 1):
+                shards.append(Shard(self.context, path, lo, min(lo + size, len(books))))
+            for shard in shards:
+                shard.wait_ready()
+        except BaseException:
+            self._stop(shards, path)
+            raise
+        with self.lock:
+            old_shards, old_path = self.shards, self.path
+            self.shards, self.path = shards, path
+            self.isbns = [book.isbn for book in books]
+            self.stale = set()
+        self._stop(old_shards, old_path)
+
+    def close(self) -> None:
+        with self.lock:
+            shards, path, self.shards, self.path = self.shards, self.path, [], None
+        self._stop(shards, path)
+
+    @staticmethod
+    def _stop(shards, path) -> None:
+        for shard in shards:
+            shard.stop()
+        if path is not None:
+            os.unlink(path)
+
+    # Book listener
+    def on_book(self, book, field) -> None:
+        if field is None:
+            self.stale.update(SHARDED)
+        elif field in SHARDED:
+            self.stale.add(field)
+
+    def serves(self, category) -> bool:
+        return bool(self.shards) and category in SHARDED and category not in self.stale
+
+    # QUERIES
+    # None when the shards cannot answer, the caller searches in process
+    def search(self, category, value, mode="exact", limit=None):
+        if not self.serves(category):
+            return None
+        return self._books(self._search_rows(category, value, mode, limit))
+
+    # the same results for a lazy reader (Book.iter_search_by, the results
+    # screen): fetched ITER_FIRST at first, then four times more each time
+    # the reader gets past what it has
+    def iter_search(self, category, value, mode="exact"):
+        from app import Book
+
+        limit, done = ITER_FIRST, 0
+        while (rows := self._search_rows(category, value, mode, limit)) is not None:
+            yield from self._books(rows[done:])
+            if len(rows) < limit:
+                return
+            done, limit = len(rows), limit * 4
+        # the field changed meanwhile, the rest comes from the Book indexes
+        yield from islice(Book.iter_search_by(category, value, mode), done, None)
+
+    def _search_rows(self, category, value, mode, limit):
+        if not self.serves(category):
+            return None
+        parts = self._fan_out("search", category, value, mode, limit)
+        if category in ("title", "author") and mode != "exact":
+            rows = (row for _, row in heapq.merge(*parts))
+        else:
+            rows = itertools.chain.from_iterable(parts)
+        return list(islice(rows, limit))
+
+    def search_range(self, category, low=None, high=None, limit=None):
+        if not self.serves(category):
+            return None
+        parts = self._fan_out("range", category, low, high, limit)
+        rows = (row for _, row in heapq.merge(*parts))
+        return self._books(islice(rows, limit))
+
+    def _fan_out(self, method, *args) -> list:
+        shards = self.shards
+        futures = [shard.call(method, *args) for shard in shards]
+        return [future.result() for future in futures]
+
+    def _books(self, rows) -> list:
+        from app import Book
+
+        isbns, all_books = self.isbns, Book.all_books
+        books = (all_books.get(isbns[row]) for row in rows)
+        return [book for book in books if book is not None]
+
+
+# shard the current catalog over workers processes (default: one per core)
+def start(workers=None) -> ShardedCatalog:
+    global active
+    from app import Book
+
+    stop()
+    catalog = ShardedCatalog(workers)
+    Book.listeners.append(catalog.on_book)
+    try:
+        catalog.refresh()
+    except BaseException:
+        Book.listeners.remove(catalog.on_book)
+        raise
+    active = catalog
+    return catalog
+
+
+def stop() -> None:
+    global active
+    from app import Book
+
+    if active is not None:
+        catalog, active = active, None
+        Book.listeners.remove(catalog.on_book)
+        catalog.close()
@@ -0,0 +1,78 @@
+import mmap
+import os
+import pickle
+import struct
+import time
+
+from app import Book, Order, User
+import wal
+from loader import paused_gc
+
+# BINARY SNAPSHOT
+# The whole object graph (books with their indexes, users, carts, orders) is
+# pickled behind a small header. Users keep their already hashed keys and
+# PINs, so loading does no per-record hashing, and the file is read through
+# mmap instead of being copied into a bytes object first.
+# Only load snapshots this store wrote itself, pickle can run arbitrary code.
+
+MAGIC = b"BKSNAP"
+VERSION = 4  # 3: hashing.py keys and PINs, 4: one user store
+HEADER = struct.Struct("<6sHQ")  # magic, version, payload size
+
+
+def _registries() -> dict:
+    return {
+        "all_books": Book.all_books,
+        "all_users": User.all_users,
+        "all_orders": Order.all_orders,
+    }
+
+
+def save_snapshot(file_path) -> int:
+    state = {
+        "registries": _registries(),
+        "book_indexes": (Book.indexes, Book.text_indexes, Book.sorted_indexes),
+        "last_order_id": Order.last_order_id,
+        "wal_seq": wal.last_seq(),
+    }
+    with paused_gc():
+        payload = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(payload)))
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+    return HEADER.size + len(payload)
+
+
+def load_snapshot(file_path) -> dict:
+    start = time.perf_counter()
+    with open(file_path, "rb") as f, mmap.mmap(
+        f.fileno(), 0, access=mmap.ACCESS_READ
+    ) as mapped:
+        magic, version, size = HEADER.unpack_from(mapped)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{file_path}: not a version {VERSION} store snapshot")
+        with memoryview(mapped)[HEADER.size : HEADER.size + size] as payload:
+            with paused_gc():
+                state = pickle.loads(payload)
+
+    for name, loaded in state["registries"].items():
+        registry = _registries()[name]
+        registry.clear()
+        registry.update(loaded)
+    Book.indexes, Book.text_indexes, Book.sorted_indexes = state["book_indexes"]
+    Book.link_indexes()
+    Order.last_order_id = state["last_order_id"]
+    Order.reindex()
+    for user in User.all_users.values():
+        user.logged_in = False
+    return {
+        "books": len(Book.all_books),
+        "users": len(User.all_users),
+        "orders": len(Order.all_orders),
+        "wal_seq": state["wal_seq"],
+        "seconds": time.perf_counter() - start,
+    }
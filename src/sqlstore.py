@@ -0,0 +1,578 @@
+import json
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+
+from loader import iter_batches, iter_json_array
+
+# SQLITE BACKEND
+# Optional storage for books, users and orders (BookStore.open_data with
+# backend="sqlite"). Nothing is loaded up front: Book.getBook, User.get_user
+# and Order.get_order_by_id read rows through on first use and the objects
+# then live in the class registries as before, so carts, indexes and locks
+# work unchanged. Searches run as indexed SQL.
+# Changed objects are only marked dirty; checkpoint() writes them back with
+# one executemany per table. The write-ahead log calls it instead of saving
+# a snapshot, so the database plus the log is always the whole store.
+# Carts are stored too: the stock they hold is already taken off the books
+# table, so a cart left out of the database would lose those copies once the
+# log is truncated.
+
+POOL_SIZE = 8
+IMPORT_BATCH = 5000
+ITER_FIRST = 64  # rows read by the first step of iter_books
+
+# held while rows become objects, so two sessions never build the same
+# book or user twice
+_load_lock = threading.RLock()
+
+# the store the class APIs read through, None when running from memory
+active = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    isbn TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    author TEXT NOT NULL,
+    year INTEGER,
+    genre TEXT,
+    price REAL,
+    quantity INTEGER
+);
+CREATE TABLE IF NOT EXISTS users (
+    key BLOB PRIMARY KEY,
+    email TEXT NOT NULL,
+    name TEXT,
+    pin TEXT,
+    address TEXT,
+    phone TEXT,
+    role TEXT NOT NULL,
+    member_type TEXT,
+    designation TEXT
+);
+CREATE TABLE IF NOT EXISTS orders (
+    order_id TEXT PRIMARY KEY,
+    customer_key BLOB NOT NULL,
+    total REAL,
+    status TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS order_items (
+    order_id TEXT,
+    isbn TEXT,
+    qty INTEGER,
+    PRIMARY KEY (order_id, isbn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS cart_items (
+    customer_key BLOB,
+    isbn TEXT,
+    qty INTEGER,
+    PRIMARY KEY (customer_key, isbn)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value
+);
+"""
+
+# (name, table, columns)
+INDEXES = [
+    ("books_title", "books", "title"),
+    ("books_title_nocase", "books", "title COLLATE NOCASE"),
+    ("books_author", "books", "author"),
+    ("books_author_nocase", "books", "author COLLATE NOCASE"),
+    ("books_genre", "books", "genre"),
+    ("books_year", "books", "year"),
+    ("books_price", "books", "price"),
+    ("books_quantity", "books", "quantity"),
+    ("users_phone", "users", "phone"),
+    ("users_member_type", "users", "member_type"),
+    ("users_designation", "users", "designation"),
+    ("orders_status", "orders", "status"),
+    ("orders_customer", "orders", "customer_key"),
+]
+
+# every statement is a constant, sqlite3 keeps them prepared per connection
+BOOK_FIELDS = ("isbn", "title", "author", "year", "genre", "price", "quantity")
+BOOK_COLUMNS = ", ".join(BOOK_FIELDS)
+SELECT_BOOK = f"SELECT {BOOK_COLUMNS} FROM books WHERE isbn = ?"
+UPSERT_BOOK = (
+    f"INSERT OR REPLACE INTO books ({BOOK_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)"
+)
+USER_COLUMNS = "key, email, name, pin, address, phone, role, member_type, designation"
+SELECT_USER = f"SELECT {USER_COLUMNS} FROM users WHERE key = ?"
+UPSERT_USER = (
+    f"INSERT OR REPLACE INTO users ({USER_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+SELECT_CUSTOMER_ORDERS = """
+SELECT order_id, total, status FROM orders WHERE customer_key = ? ORDER BY order_id
+"""
+SELECT_ORDER_ITEMS = "SELECT isbn, qty FROM order_items WHERE order_id = ?"
+SELECT_ORDER_CUSTOMER = "SELECT customer_key FROM orders WHERE order_id = ?"
+SELECT_STATUS_CUSTOMERS = "SELECT DISTINCT customer_key FROM orders WHERE status = ?"
+DELETE_USER = "DELETE FROM users WHERE key = ?"
+UPSERT_ORDER = "INSERT OR REPLACE INTO orders VALUES (?, ?, ?, ?)"
+DELETE_ORDER_ITEMS = "DELETE FROM order_items WHERE order_id = ?"
+INSERT_ORDER_ITEM = "INSERT INTO order_items VALUES (?, ?, ?)"
+SELECT_CART_ITEMS = "SELECT isbn, qty FROM cart_items WHERE customer_key = ?"
+DELETE_CART_ITEMS = "DELETE FROM cart_items WHERE customer_key = ?"
+INSERT_CART_ITEM = "INSERT INTO cart_items VALUES (?, ?, ?)"
+SALES = """
+SELECT status, count(*), coalesce(sum(total), 0) FROM orders
+WHERE order_id NOT IN (SELECT value FROM json_each(?))
+GROUP BY status
+"""
+LAST_ORDER_ID = "SELECT max(CAST(order_id AS INTEGER)) FROM orders"
+GET_META = "SELECT value FROM meta WHERE name = ?"
+SET_META = "INSERT OR REPLACE INTO meta VALUES (?, ?)"
+
+# best first like TextIndex: whole text, text prefix, word prefix, anywhere
+RANKED = """
+ORDER BY CASE
+    WHEN {column} = :query COLLATE NOCASE THEN 0
+    WHEN {column} LIKE :query || '%' ESCAPE '\\' THEN 1
+    WHEN {column} LIKE '% ' || :query || '%' ESCAPE '\\' THEN 2
+    ELSE 3
+END, length({column}), {column} COLLATE NOCASE, isbn
+"""
+
+
+# SQLite connections for concurrent sessions, one per borrower at a time
+class ConnectionPool:
+    def __init__(self, path, size=POOL_SIZE) -> None:
+        self.path = str(path)
+        self.idle = queue.LifoQueue()
+        self.size = size
+        self.opened = 0
+        self.lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path, check_same_thread=False, cached_statements=256
+        )
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=OFF")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            with self.lock:
+                grow = self.opened < self.size
+                self.opened += grow
+            conn = self._open() if grow else self.idle.get()
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+
+    def close(self) -> None:
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class SqliteStore:
+    def __init__(self, path, pool_size=POOL_SIZE) -> None:
+        self.path = Path(path)
+        self.pool = ConnectionPool(path, pool_size)
+        self.write_lock = threading.Lock()  # sqlite has one writer anyway
+        self.dirty: set = set()
+        self.dirty_lock = threading.Lock()
+        with self.pool.connection() as conn:
+            conn.executescript(SCHEMA)
+            conn.executescript(_create_indexes())
+
+    def close(self) -> None:
+        self.pool.close()
+
+    def query(self, sql, params=()) -> list:
+        with self.pool.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def meta(self, name, default=None):
+        rows = self.query(GET_META, (name,))
+        return rows[0][0] if rows else default
+
+    # BULK IMPORT
+    # One executemany per batch instead of an object per row. The table's
+    # indexes are dropped and rebuilt once at the end, sorting every row once
+    # is several times cheaper than updating each b-tree row by row.
+    @contextmanager
+    def _bulk(self, table):
+        with self.write_lock, self.pool.connection() as conn:
+            for name, on, _ in INDEXES:
+                if on == table:
+                    conn.execute(f"DROP INDEX IF EXISTS {name}")
+            try:
+                yield conn
+            finally:
+                conn.executescript(_create_indexes(table))
+
+    def import_books(self, records) -> int:
+        count = 0
+        with self._bulk("books") as conn:
+            for batch in iter_batches(records, IMPORT_BATCH):
+                rows = [
+                    tuple(record[name] for name in BOOK_FIELDS) for record in batch
+                ]
+                with conn:
+                    conn.executemany(UPSERT_BOOK, rows)
+                count += len(rows)
+        return count
+
+    def import_users(self, records, role) -> int:
+        import hashing
+
+        count = 0
+        with self._bulk("users") as conn:
+            for batch in iter_batches(records, IMPORT_BATCH):
+                pins = hashing.hash_many([r["pin"] for r in batch])
+                rows = [
+                    (
+                        hashing.email_key(record["email"]),
+                        record["email"],
+                        record["name"],
+                        pin,
+                        record["address"],
+                        record["phone"],
+                        role,
+                        record.get("member_type"),
+                        record.get("designation"),
+                    )
+                    for record, pin in zip(batch, pins)
+                ]
+                with conn:
+                    conn.executemany(UPSERT_USER, rows)
+                count += len(rows)
+        return count
+
+    def import_json(self, data_dir) -> dict:
+        return {
+            "books": self.import_books(iter_json_array(f"{data_dir}/books.json")),
+            "customers": self.import_users(
+                iter_json_array(f"{data_dir}/customers.json"), "customer"
+            ),
+            "employees": self.import_users(
+                iter_json_array(f"{data_dir}/employees.json"), "employee"
+            ),
+        }
+
+    # READ THROUGH
+    # rows become the usual objects, registered like any other
+    def load_book(self, isbn):
+        from app import Book
+
+        if book := Book.all_books.get(isbn):
+            return book
+        rows = self.query(SELECT_BOOK, (isbn,))
+        if not rows:
+            return None
+        return self._books(rows)[0]
+
+    def _books(self, rows) -> list:
+        from app import Book
+
+        books = []
+        with _load_lock:
+            for row in rows:
+                book = Book.all_books.get(row[0])
+                if book is None:
+                    book = Book(*row)
+                books.append(book)
+        return books
+
+    def load_user(self, key):
+        from app import Customer, Employee, User
+        from hashing import Hashed
+
+        rows = self.query(SELECT_USER, (key,))
+        if not rows:
+            return None
+        _, email, name, pin, address, phone, role, member_type, designation = rows[0]
+        with _load_lock:
+            if user := User.all_users.get(key):
+                return user
+            if role == "employee":
+                return Employee(name, email, Hashed(pin), address, phone, designation)
+            customer = Customer(name, email, Hashed(pin), address, phone, member_type)
+            self._load_orders(customer)
+            self._load_cart(customer)
+            return customer
+
+    def _load_orders(self, customer) -> None:
+        from app import Order
+
+        rows = self.query(SELECT_CUSTOMER_ORDERS, (customer.key,))
+        for order_id, total, status in rows:
+            items = {}
+            for isbn, qty in self.query(SELECT_ORDER_ITEMS, (order_id,)):
+                if book := self.load_book(isbn):
+                    items[book] = qty
+            order = Order.restore(order_id, customer, items, total, status)
+            customer.orders[order_id] = order
+
+    def _load_cart(self, customer) -> None:
+        for isbn, qty in self.query(SELECT_CART_ITEMS, (customer.key,)):
+            if book := self.load_book(isbn):
+                customer.cart.restore(book, qty)
+
+    def load_order(self, order_id):
+        from app import Order
+
+        rows = self.query(SELECT_ORDER_CUSTOMER, (order_id,))
+        if rows:
+            self.load_user(rows[0][0])
+        return Order.all_orders.get(order_id)
+
+    # customers with an order in this status, so e.g. the pending queue is whole
+    def load_orders_with_status(self, status) -> None:
+        for (key,) in self.query(SELECT_STATUS_CUSTOMERS, (status,)):
+            self.load_user(key)
+
+    # QUERIES
+    # mode: "exact", or for title/author also "casefold", "prefix", "substring"
+    def find_books(self, category, value, mode="exact", limit=None) -> list:
+        if (found := _find_sql(category, value, mode)) is None:
+            return []
+        sql, params = found
+        params["limit"] = -1 if limit is None else limit
+        return self._books(self.query(f"{sql} LIMIT :limit", params))
+
+    # lazy find_books for paging (Book.iter_search_by): ITER_FIRST rows, then
+    # four times more each step. Each step is a short query, so a results
+    # screen left open does not keep a pooled connection.
+    def iter_books(self, category, value, mode="exact"):
+        if (found := _find_sql(category, value, mode)) is None:
+            return
+        sql, params = found
+        offset, limit = 0, ITER_FIRST
+        while True:
+            params.update(offset=offset, limit=limit)
+            rows = self.query(f"{sql} LIMIT :limit OFFSET :offset", params)
+            yield from self._books(rows)
+            if len(rows) < limit:
+                return
+            offset, limit = offset + limit, limit * 4
+
+    # prices and stock change in memory between checkpoints: the rows of
+    # changed books are skipped and the books themselves merged in. Only the
+    # bounds given go into the WHERE clause, so SQLite uses the column's index,
+    # and only the rows returned become books.
+    def range_books(self, category, low=None, high=None, limit=None) -> list:
+        from app import Book
+
+        column = category.lower()
+        if column not in ("year", "price", "quantity"):
+            return []
+        with self.dirty_lock:
+            changed = [item for item in self.dirty if isinstance(item, Book)]
+        stale = {book.isbn for book in changed}
+        bounds = []
+        if low is not None:
+            bounds.append(f"{column} >= :low")
+        if high is not None:
+            bounds.append(f"{column} <= :high")
+        where = f"WHERE {' AND '.join(bounds)}" if bounds else ""
+        sql = f"""
+            SELECT {BOOK_COLUMNS} FROM books {where}
+            ORDER BY {column}, isbn LIMIT :limit
+        """
+        # enough rows that every stale one can be skipped
+        count = -1 if limit is None else limit + len(stale)
+        rows = self.query(sql, {"low": low, "high": high, "limit": count})
+
+        def inside(book) -> bool:
+            value = getattr(book, column)
+            return (low is None or value >= low) and (high is None or value <= high)
+
+        field = BOOK_FIELDS.index(column)
+        found = [((row[field], row[0]), row) for row in rows if row[0] not in stale]
+        found += [((getattr(b, column), b.isbn), b) for b in changed if inside(b)]
+        found.sort(key=lambda pair: pair[0])
+        return [
+            item if isinstance(item, Book) else self._books([item])[0]
+            for _, item in found[:limit]
+        ]
+
+    # status -> (count, total) over every order: saved rows, except those
+    # changed since the last checkpoint, which are counted as they are now
+    def sales(self) -> dict:
+        from app import Order
+
+        with self.dirty_lock:
+            changed = [item for item in self.dirty if isinstance(item, Order)]
+        ids = json.dumps([order.order_id for order in changed])
+        totals = {status: [0, 0] for status in Order.STATUSES}
+        for status, count, total in self.query(SALES, (ids,)):
+            totals[status] = [count, total]
+        for order in changed:
+            totals[order.status][0] += 1
+            totals[order.status][1] += order.total
+        return {status: tuple(value) for status, value in totals.items()}
+
+    # WRITE BACK
+    def touch(self, item) -> None:
+        with self.dirty_lock:
+            self.dirty.add(item)
+
+    def delete_user(self, key) -> None:
+        with self.write_lock, self.pool.connection() as conn, conn:
+            conn.execute(DELETE_USER, (key,))
+            conn.execute(DELETE_CART_ITEMS, (key,))
+
+    # write every dirty object back, call between interactions (the
+    # write-ahead log does, instead of saving a snapshot)
+    def checkpoint(self, wal_seq=None) -> int:
+        from app import Book, Cart, Order, User
+
+        with self.dirty_lock:
+            dirty, self.dirty = self.dirty, set()
+        books = [item for item in dirty if isinstance(item, Book)]
+        users = [item for item in dirty if isinstance(item, User)]
+        orders = [item for item in dirty if isinstance(item, Order)]
+        carts = [item for item in dirty if isinstance(item, Cart)]
+        self._write(books, users, orders, carts, wal_seq)
+        return len(dirty)
+
+    def _write(self, books, users, orders, carts=(), wal_seq=None) -> None:
+        from app import Order
+
+        with self.write_lock, self.pool.connection() as conn, conn:
+            conn.executemany(
+                UPSERT_BOOK,
+                [tuple(getattr(book, name) for name in BOOK_FIELDS) for book in books],
+            )
+            conn.executemany(
+                UPSERT_USER,
+                [
+                    (
+                        user.key,
+                        user.email,
+                        user.name,
+                        user.pin,
+                        user.address,
+                        user.phone,
+                        "employee" if user.is_employee else "customer",
+                        getattr(user, "member_type", None),
+                        getattr(user, "designation", None),
+                    )
+                    for user in users
+                ],
+            )
+            conn.executemany(
+                UPSERT_ORDER,
+                [(o.order_id, o.customer.key, o.total, o.status) for o in orders],
+            )
+            conn.executemany(DELETE_ORDER_ITEMS, [(o.order_id,) for o in orders])
+            conn.executemany(
+                INSERT_ORDER_ITEM,
+                [
+                    (o.order_id, book.isbn, qty)
+                    for o in orders
+                    for book, qty in o.items.items()
+                ],
+            )
+            # a cart is written whole, as it is now
+            conn.executemany(DELETE_CART_ITEMS, [(c.customer.key,) for c in carts])
+            conn.executemany(
+                INSERT_CART_ITEM,
+                [
+                    (c.customer.key, book.isbn, qty)
+                    for c in carts
+                    for book, qty in list(c.items.items())
+                ],
+            )
+            if wal_seq is not None:
+                conn.execute(SET_META, ("wal_seq", wal_seq))
+            conn.execute(SET_META, ("last_order_id", Order.last_order_id))
+
+
+def touch(item) -> None:
+    if active is not None:
+        active.touch(item)
+
+
+# a new book is written right away, so SQL searches find it before the
+# next checkpoint
+def add(book) -> None:
+    if active is not None:
+        active._write([book], (), ())
+
+
+# open (importing the JSON files on first use) and make it the active store
+def open_store(path, data_dir=None) -> dict:
+    global active
+    from app import Order
+
+    close_store()
+    first_run = not Path(path).exists()
+    store = SqliteStore(path)
+    stats = {}
+    if first_run and data_dir is not None:
+        stats = store.import_json(data_dir)
+    active = store
+    Order.last_order_id = max(
+        Order.last_order_id,
+        store.meta("last_order_id", 0),
+        (store.query(LAST_ORDER_ID)[0][0] or -1) + 1,
+    )
+    store.load_orders_with_status("pending")
+    stats["wal_seq"] = store.meta("wal_seq", 0)
+    return stats
+
+
+def close_store() -> None:
+    global active
+    if active is not None:
+        active.checkpoint()
+        active.close()
+        active = None
+
+
+def _create_indexes(table=None) -> str:
+    return "\n".join(
+        f"CREATE INDEX IF NOT EXISTS {name} ON {on} ({columns});"
+        for name, on, columns in INDEXES
+        if table in (None, on)
+    )
+
+
+# (sql without LIMIT, params) for find_books, None for an unknown category
+def _find_sql(category, value, mode):
+    column = category.lower()
+    if column not in ("title", "author", "genre"):
+        return None
+    if column == "genre":
+        mode = "exact"
+    params = {"value": value, "query": _escape(str(value).strip())}
+    match mode:
+        case "exact":
+            where = f"{column} = :value"
+        case "casefold":
+            where = f"{column} = :value COLLATE NOCASE"
+            params["value"] = str(value).strip()
+        case "prefix":
+            words = str(value).split() or [""]
+            where = " AND ".join(
+                f"({column} LIKE :w{i} || '%' ESCAPE '\\'"
+                f" OR {column} LIKE '% ' || :w{i} || '%' ESCAPE '\\')"
+                for i in range(len(words))
+            )
+            params.update({f"w{i}": _escape(w) for i, w in enumerate(words)})
+        case "substring":
+            where = f"{column} LIKE '%' || :query || '%' ESCAPE '\\'"
+        case _:
+            raise ValueError(f"unknown search mode: {mode}")
+    order = RANKED.format(column=column) if mode != "exact" else "ORDER BY rowid"
+    return f"SELECT {BOOK_COLUMNS} FROM books WHERE {where} {order}", params
+
+
+def _escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
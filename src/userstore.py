@@ -0,0 +1,169 @@
+from indexes import Index, locked
+
+# USER STORE
+# Every user lives in one dict keyed by the 16-byte lookup digest from
+# hashing.email_key. Customers and employees are role views of it instead of
+# second copies, and phone, member_type and designation are indexed so
+# attribute queries cost O(matches).
+# An index bucket holds the user itself while a value has one user (phones
+# are nearly unique) and becomes a {key: user} dict from the second one on.
+
+INDEXED_FIELDS = ("phone", "member_type", "designation")
+
+
+class UserStore(Index):
+    def __init__(self, fields=INDEXED_FIELDS) -> None:
+        super().__init__()
+        self.users: dict = {}  # key -> user
+        self.indexes: dict = {field: {} for field in fields}
+        self.counts: dict = {}  # role class -> number of users with that role
+
+    # MAPPING
+    # read the same way as the dicts it replaced
+    def get(self, key, default=None):
+        return self.users.get(key, default)
+
+    def __getitem__(self, key):
+        return self.users[key]
+
+    def __contains__(self, key) -> bool:
+        return key in self.users
+
+    def __iter__(self):
+        return iter(self.users)
+
+    def __len__(self) -> int:
+        return len(self.users)
+
+    def keys(self):
+        return self.users.keys()
+
+    def values(self):
+        return self.users.values()
+
+    def items(self):
+        return self.users.items()
+
+    def __delitem__(self, key) -> None:
+        if self.remove(key) is None:
+            raise KeyError(key)
+
+    # WRITES
+    @locked
+    def add(self, user) -> None:
+        if user.key in self.users:
+            self.remove(user.key)
+        self.users[user.key] = user
+        role = type(user)
+        self.counts[role] = self.counts.get(role, 0) + 1
+        for field, table in self.indexes.items():
+            value = getattr(user, field, None)
+            if value is None:
+                continue
+            bucket = table.get(value)
+            if bucket is None:
+                table[value] = user
+            elif isinstance(bucket, dict):
+                bucket[user.key] = user
+            else:
+                table[value] = {bucket.key: bucket, user.key: user}
+
+    @locked
+    def remove(self, key):
+        user = self.users.pop(key, None)
+        if user is None:
+            return None
+        self.counts[type(user)] -= 1
+        for field, table in self.indexes.items():
+            value = getattr(user, field, None)
+            bucket = table.get(value)
+            if bucket is user:
+                del table[value]
+            elif isinstance(bucket, dict):
+                bucket.pop(key, None)
+                if len(bucket) == 1:
+                    table[value] = next(iter(bucket.values()))
+        return user
+
+    @locked
+    def clear(self) -> None:
+        self.users.clear()
+        self.counts.clear()
+        for table in self.indexes.values():
+            table.clear()
+
+    # an empty store takes a loaded (e.g. unpickled) store's tables as they are
+    @locked
+    def update(self, other) -> None:
+        if isinstance(other, UserStore) and not self.users:
+            self.users, self.indexes, self.counts = (
+                other.users,
+                other.indexes,
+                other.counts,
+            )
+            return
+        for user in other.values():
+            self.add(user)
+
+    # QUERIES
+    # users whose field equals value, only those of the given role if any
+    @locked
+    def find(self, field, value, role=None) -> list:
+        bucket = self.indexes[field].get(value)
+        if bucket is None:
+            return []
+        users = list(bucket.values()) if isinstance(bucket, dict) else [bucket]
+        if role is None:
+            return users
+        return [user for user in users if isinstance(user, role)]
+
+    def count(self, role) -> int:
+        return sum(n for cls, n in self.counts.items() if issubclass(cls, role))
+
+    def view(self, role) -> "RoleView":
+        return RoleView(self, role)
+
+
+# the users of one role (and its subclasses), read like a dict of them
+class RoleView:
+    def __init__(self, store: UserStore, role) -> None:
+        self.store = store
+        self.role = role
+
+    def get(self, key, default=None):
+        user = self.store.users.get(key)
+        return user if isinstance(user, self.role) else default
+
+    def __getitem__(self, key):
+        user = self.get(key)
+        if user is None:
+            raise KeyError(key)
+        return user
+
+    def __contains__(self, key) -> bool:
+        return self.get(key) is not None
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def __len__(self) -> int:
+        return self.store.count(self.role)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [user for _, user in self.items()]
+
+    def items(self):
+        role = self.role
+        users = list(self.store.users.items())
+        return [(key, user) for key, user in users if isinstance(user, role)]
+
+    def find(self, field, value) -> list:
+        return self.store.find(field, value, self.role)
+
+    # removes this role's users from the store
+    def clear(self) -> None:
+        for key in self.keys():
+            self.store.remove(key)
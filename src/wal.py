@@ -0,0 +1,247 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# WRITE-AHEAD LOG
+# Store mutations (signups, cart changes, checkouts, approvals, price and
+# stock updates, and their bulk versions) are appended as JSON lines. A
+# background writer group-commits them: it waits COMMIT_INTERVAL for more
+# records, then writes and fsyncs the whole batch at once, so a burst of
+# checkouts costs one fsync, not one each.
+# Every record carries a sequence number; snapshots remember the last one
+# they contain and replay skips anything older.
+# Records are appended after the locks that ordered the change, so two
+# customers' records can reach the log in the other order. Replay therefore
+# applies stock as changes (a logged reservation is taken even if the release
+# that made room for it comes later) and gives out order ids after the
+# highest one replayed.
+
+COMMIT_INTERVAL = 0.005  # seconds a batch stays open
+COMPACT_EVERY = 10_000  # records between snapshots
+
+# the log mutations are recorded to, None when logging is off
+active = None
+_replaying = False
+
+
+class WriteAheadLog:
+    def __init__(
+        self,
+        file_path,
+        snapshot_path=None,
+        last_seq=0,
+        commit_interval=COMMIT_INTERVAL,
+        compact_every=COMPACT_EVERY,
+        checkpoint=None,
+    ) -> None:
+        self.file_path = file_path
+        self.snapshot_path = snapshot_path
+        # called with the last sequence number instead of saving a snapshot
+        self.checkpoint = checkpoint
+        self.commit_interval = commit_interval
+        self.compact_every = compact_every
+        self.file = open(file_path, "ab")
+        self.lock = threading.Condition()
+        self.io_lock = threading.Lock()
+        self.buffer: list = []
+        self.seq: int = last_seq  # last sequence number handed out
+        self.durable: int = last_seq  # last sequence number on disk
+        self.since_compact: int = 0
+        self.closed: bool = False
+        self.writer = threading.Thread(target=self._run, name="wal-writer", daemon=True)
+        self.writer.start()
+
+    def append(self, op, **data) -> int:
+        with self.lock:
+            if self.closed:
+                raise ValueError("write-ahead log is closed")
+            self.seq += 1
+            data["seq"] = self.seq
+            data["op"] = op
+            self.buffer.append(json.dumps(data, separators=(",", ":")))
+            self.since_compact += 1
+            self.lock.notify()
+            return self.seq
+
+    # block until every record up to seq (default: all so far) is on disk
+    def wait(self, seq=None) -> None:
+        with self.lock:
+            seq = self.seq if seq is None else seq
+            self.lock.wait_for(lambda: self.durable >= seq or self.writer_failed())
+
+    def flush(self) -> None:
+        self.wait()
+
+    def writer_failed(self) -> bool:
+        return not self.writer.is_alive()
+
+    def _run(self) -> None:
+        while True:
+            with self.lock:
+                self.lock.wait_for(lambda: self.buffer or self.closed)
+                if not self.buffer:
+                    return
+            time.sleep(self.commit_interval)  # let concurrent appends join
+            self._commit()
+
+    def _commit(self) -> None:
+        with self.io_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+                upto = self.seq
+            if batch:
+                self.file.write(("\n".join(batch) + "\n").encode())
+                self.file.flush()
+                os.fsync(self.file.fileno())
+            with self.lock:
+                self.durable = max(self.durable, upto)
+                self.lock.notify_all()
+
+    def close(self) -> None:
+        with self.lock:
+            self.closed = True
+            self.lock.notify_all()
+        self.writer.join()
+        self._commit()
+        self.file.close()
+
+    # fold the log into a fresh snapshot (or the checkpoint) and start an empty log,
+    # call between interactions so no mutation is half recorded
+    def compact(self) -> None:
+        from snapshot import save_snapshot
+
+        with self.io_lock:
+            with self.lock:
+                batch, self.buffer = self.buffer, []
+                upto = self.seq
+                if batch:
+                    self.file.write(("\n".join(batch) + "\n").encode())
+                if self.checkpoint is not None:
+                    self.checkpoint(upto)
+                else:
+                    save_snapshot(self.snapshot_path)
+                self.file.truncate(0)
+                self.file.flush()
+                os.fsync(self.file.fileno())
+                self.durable = max(self.durable, upto)
+                self.since_compact = 0
+                self.lock.notify_all()
+
+    def maybe_compact(self) -> bool:
+        can_compact = self.snapshot_path or self.checkpoint
+        if can_compact and self.since_compact >= self.compact_every:
+            self.compact()
+            return True
+        return False
+
+
+def record(op, **data) -> None:
+    if active is not None and not _replaying:
+        active.append(op, **data)
+
+
+def last_seq() -> int:
+    return active.seq if active is not None else 0
+
+
+@contextmanager
+def replaying():
+    global _replaying
+    _replaying = True
+    try:
+        yield
+    finally:
+        _replaying = False
+
+
+def read_records(file_path):
+    with open(file_path, "rb") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return  # torn tail from a crash mid-write
+
+
+# re-apply records newer than after_seq, returns the last sequence number seen
+def replay(file_path, after_seq=0) -> int:
+    from app import Book, Customer, Order
+    from hashing import Hashed
+
+    system = _SystemUser()
+    seq = after_seq
+    next_order_id = Order.last_order_id
+    if not os.path.exists(file_path):
+        return seq
+    with replaying():
+        for data in read_records(file_path):
+            seq = max(seq, data["seq"])
+            if data["seq"] <= after_seq:
+                continue
+            customer = Customer.get_user(data.get("email", ""))
+            match data["op"]:
+                case "signup" if not customer:
+                    fields = ["name", "email", "address", "phone", "member_type"]
+                    # logged already hashed
+                    pin = Hashed(data["pin"])
+                    Customer.signup(pin=pin, **{f: data[f] for f in fields})
+                case "cart_add" if customer and (book := Book.getBook(data["isbn"])):
+                    book.adjust(-data["qty"])
+                    customer.cart.restore(book, data["qty"])
+                case "cart_remove" if customer:
+                    customer.cart.remove_book(data["isbn"])
+                case "checkout" if customer:
+                    Order.last_order_id = int(data["order_id"])
+                    customer.checkout()
+                    next_order_id = max(next_order_id, Order.last_order_id)
+                case "approve" if order := Order.get_order_by_id(data["order_id"]):
+                    order.approve(system)
+                case "cancel" if order := Order.get_order_by_id(data["order_id"]):
+                    order.cancel(system)
+                case "approve_many":
+                    Order.approve_many(data["order_ids"], system)
+                case "cancel_many":
+                    Order.cancel_many(data["order_ids"], system)
+                case "feed":
+                    # prices as logged, quantities as the change they made
+                    rows = []
+                    for change in data["changes"]:
+                        if "delta" in change:
+                            if book := Book.getBook(change["isbn"]):
+                                book.adjust(change["delta"])
+                            change = {**change, "quantity": None}
+                        rows.append(change)
+                    Book.apply_feed(rows, system)
+                case "price" if book := Book.getBook(data["isbn"]):
+                    book.update_price(data["price"], system)
+                case "quantity" if book := Book.getBook(data["isbn"]):
+                    if "delta" in data:
+                        book.adjust(data["delta"])
+                    else:  # logged before changes were
+                        book.update_quantity(data["quantity"], system)
+    Order.last_order_id = max(Order.last_order_id, next_order_id)
+    return seq
+
+
+def open_log(file_path, snapshot_path=None, after_seq=0, **options):
+    global active
+    if active is not None:
+        active.close()
+    seq = replay(file_path, after_seq)
+    active = WriteAheadLog(file_path, snapshot_path, seq, **options)
+    return active
+
+
+def close_log() -> None:
+    global active
+    if active is not None:
+        active.close()
+        active = None
+
+
+# replayed approvals and stock changes were permission-checked when logged
+class _SystemUser:
+    name = "system"
+    is_employee = True
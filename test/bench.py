@@ -0,0 +1,1432 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from itertools import islice
+
+sys.path.append("./src")
+
+import wal  # noqa: E402
+from app import Book, BookStore, Customer, Employee, Order, User  # noqa: E402
+from conftest import reset_books, reset_store  # noqa: E402
+from loader import load_records  # noqa: E402
+
+GENRES = [
+    "Action",
+    "Comedy",
+    "Drama",
+    "Fantasy",
+    "Horror",
+    "Mystery",
+    "Romance",
+    "Sci-Fi",
+    "Thriller",
+    "Western",
+]
+SYLLABLES = (
+    "al am an ar ba be bo ca ce co da de di el en er fa fe fi ga ge go ha he "
+    "hi in ir ka ke ki la le li lo ma me mi mo na ne ni no or pa pe pi ra re "
+    "ri ro sa se si so ta te ti to ul un va ve vi wa we wi ya yo za ze zo"
+).split()
+WORDS = sorted({a + b + c for a in SYLLABLES[:24] for b in SYLLABLES for c in "nrst"})
+
+BENCHMARKS = {}
+# RESULTS
+# Every report() lands in RESULTS["<benchmark>[<size>]"][name] as seconds;
+# --save writes them to JSON and --compare flags what got slower than in an
+# earlier saved run.
+RESULTS: dict = {}
+current_run = "adhoc"
+REGRESSION_TOLERANCE = 0.25  # slower by more than this fraction is flagged
+NOISE_FLOOR = 1e-6  # seconds, faster timings are too noisy to compare
+
+
+def benchmark(func):
+    BENCHMARKS[func.__name__.removeprefix("bench_")] = func
+    return func
+
+
+def best_of(func, repeat=5, number=1) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def report(name, seconds, unit="ms") -> None:
+    scale = {"s": 1, "ms": 1e3, "us": 1e6}[unit]
+    print(f"{name:<40} {seconds * scale:>12.3f} {unit}")
+    RESULTS.setdefault(current_run, {})[name] = seconds
+
+
+def iter_books(n, seed=111):
+    rng = random.Random(seed)
+    for i in range(n):
+        yield {
+            "isbn": f"{i:09d}-{i % 10}",
+            "title": " ".join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+            "author": f"{rng.choice(WORDS).title()} {rng.choice(WORDS).title()}",
+            "year": rng.randint(1900, 2023),
+            "genre": rng.choice(GENRES),
+            "price": round(rng.uniform(50, 1000), 2),
+            "quantity": rng.randint(0, 99),
+        }
+
+
+def iter_customers(n, seed=222):
+    rng = random.Random(seed)
+    for i in range(n):
+        first, last = rng.choice(WORDS), rng.choice(WORDS)
+        yield {
+            "name": f"{first.title()} {last.title()}",
+            "email": f"{first[0]}{last}{i}@example.com",
+            "pin": f"{rng.randint(0, 999999):06d}",
+            "address": rng.choice(WORDS).title(),
+            "phone": f"{rng.randint(100, 999)}-{rng.randint(100, 999)}-{i % 10000:04d}",
+            "member_type": rng.choice(["regular", "premium"]),
+        }
+
+
+def iter_employees(n, seed=333):
+    for i, row in enumerate(iter_customers(n, seed)):
+        del row["member_type"]
+        row["email"] = row["email"].replace("@", "@staff.")
+        yield row | {"designation": ("Cashier", "Manager", "Clerk")[i % 3]}
+
+
+def make_books(n, seed=111) -> list:
+    return list(iter_books(n, seed))
+
+
+def write_json_array(file_path, records) -> None:
+    with open(file_path, "w", encoding="utf-8") as f:
+        f.write("[")
+        for i, record in enumerate(records):
+            f.write(",\n" if i else "\n")
+            json.dump(record, f)
+        f.write("\n]")
+
+
+# run func in a forked child, returns (result, peak RSS in MB of the child)
+def in_child(func):
+    def target(queue):
+        result = func()
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        queue.put((result, peak))
+
+    ctx = multiprocessing.get_context("fork")
+    queue = ctx.Queue()
+    process = ctx.Process(target=target, args=(queue,))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def load_books(n) -> dict:
+    reset_books()
+    with Book.batch_indexing():
+        for book in iter_books(n):
+            Book(**book)
+    return Book.all_books
+
+
+def linear_search(category, value, mode) -> list:
+    value = value.casefold()
+    result = []
+    for book in Book.all_books.values():
+        text = getattr(book, category).casefold()
+        found = text.startswith(value) if mode == "prefix" else value in text
+        if found:
+            result.append(book)
+    return result
+
+
+@benchmark
+def bench_text_search(size=100_000) -> None:
+    load_books(size)
+    sample = Book.getBook(make_books(size)[size // 2]["isbn"])
+    title_words = sample.title.split()
+    queries = [
+        ("title", sample.title[2:12], "substring"),
+        ("title", title_words[0], "substring"),
+        ("title", title_words[-1][:3], "prefix"),
+        ("author", sample.author.split()[-1], "substring"),
+    ]
+    print(f"text search over {size} books")
+    for category, value, mode in queries:
+        indexed = best_of(lambda: Book.search_by(category, value, mode, limit=20))
+        scan = best_of(lambda: linear_search(category, value, mode), repeat=3)
+        label = f"{category} {mode} {value!r}"
+        report(f"{label} indexed", indexed)
+        report(f"{label} linear scan", scan)
+
+
+@benchmark
+def bench_range_search(size=100_000) -> None:
+    load_books(size)
+    books = list(Book.all_books.values())
+    print(f"range queries over {size} books")
+    for category, low, high in [
+        ("price", None, 300),
+        ("year", 1950, 1970),
+        ("quantity", None, 9),
+        ("price", 500, 501),
+    ]:
+        indexed = best_of(lambda: Book.search_range(category, low, high))
+        scan = best_of(
+            lambda: [
+                book
+                for book in books
+                if (low is None or getattr(book, category) >= low)
+                and getattr(book, category) <= high
+            ],
+            repeat=3,
+        )
+        label = f"{category} {low}..{high}"
+        report(f"{label} indexed", indexed)
+        report(f"{label} linear scan", scan)
+    rng = random.Random(7)
+    update = best_of(
+        lambda: setattr(rng.choice(books), "quantity", rng.randint(0, 99)),
+        number=1000,
+    )
+    report("quantity update (reindex)", update, "us")
+
+
+def legacy_load(file_path) -> int:
+    with open(file_path, "rb") as f:
+        all_books = json.load(f)
+    progress = 0
+    with Book.batch_indexing():
+        for book in all_books:
+            Book(**book)
+            progress += 1
+    return progress
+
+
+@benchmark
+def bench_loader(size=1_000_000) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, "books.json")
+        write_json_array(file_path, iter_books(size))
+        megabytes = os.path.getsize(file_path) / 2**20
+        print(f"loading {size} books ({megabytes:.0f} MB)")
+        for name, load in [
+            ("json.load + construct", lambda: legacy_load(file_path)),
+            ("streamed, batched", lambda: load_records(Book, file_path)),
+        ]:
+            reset_books()
+            start = time.perf_counter()
+            _, peak = in_child(load)
+            report(f"{name} (peak {peak:.0f} MB)", time.perf_counter() - start, "s")
+
+
+class DictBook:
+    def __init__(self, isbn, title, author, year, genre, price, quantity):
+        self.isbn = isbn
+        self.title = title
+        self.author = author
+        self.year = year
+        self.genre = genre
+        self.price = price
+        self.quantity = quantity
+
+
+class SlotBook:
+    __slots__ = Book.__slots__
+
+    def __init__(self, isbn, title, author, year, genre, price, quantity):
+        self.isbn = isbn
+        self.title = title
+        self.author = sys.intern(author)
+        self.year = year
+        self.genre = sys.intern(genre)
+        self.price = price
+        self.quantity = quantity
+
+
+def traced_bytes(build) -> int:
+    tracemalloc.start()
+    kept = build()  # noqa: F841
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current
+
+
+@benchmark
+def bench_book_memory(size=1_000_000) -> None:
+    print(f"memory for {size} book records")
+    for name, build in [
+        ("__dict__ records", lambda: [DictBook(**b) for b in iter_books(size)]),
+        ("__slots__ + interned", lambda: [SlotBook(**b) for b in iter_books(size)]),
+        ("Book catalog with indexes", lambda: load_books(size)),
+    ]:
+        reset_books()
+        total, _ = in_child(lambda: traced_bytes(build))
+        print(f"{name:<40} {total / 2**20:>9.1f} MB {total / size:>7.0f} B/book")
+
+
+@benchmark
+def bench_snapshot(size=1_000_000) -> None:
+    customers = size // 10
+    with tempfile.TemporaryDirectory() as tmp:
+        books_path = os.path.join(tmp, "books.json")
+        customers_path = os.path.join(tmp, "customers.json")
+        snapshot_path = os.path.join(tmp, "store.snapshot")
+        write_json_array(books_path, iter_books(size))
+        write_json_array(customers_path, iter_customers(customers))
+        print(f"cold vs warm start, {size} books and {customers} customers")
+
+        def cold_start():
+            reset_books()
+            start = time.perf_counter()
+            load_records(Book, books_path)
+            load_records(Customer, customers_path)
+            seconds = time.perf_counter() - start
+            BookStore.save_snapshot(snapshot_path)
+            return seconds
+
+        seconds, _ = in_child(cold_start)
+        report("from JSON", seconds, "s")
+        megabytes = os.path.getsize(snapshot_path) / 2**20
+        seconds, _ = in_child(lambda: BookStore.load_snapshot(snapshot_path)["seconds"])
+        report(f"from snapshot ({megabytes:.0f} MB)", seconds, "s")
+
+
+def load_customers(n) -> list:
+    Customer.all_customers.clear()
+    Customer.all_users.clear()
+    return [Customer(**customer) for customer in iter_customers(n)]
+
+
+@benchmark
+def bench_wal_checkout(size=20_000) -> None:
+    load_books(1000)
+    customers = load_customers(100)
+    isbns = list(Book.all_books)
+    print(f"{size} logged checkouts")
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, durable_each in [("group commit", False), ("fsync per order", True)]:
+            log = wal.open_log(os.path.join(tmp, f"{durable_each}.wal"))
+            count = size if not durable_each else size // 20
+            start = time.perf_counter()
+            for i in range(count):
+                customer = customers[i % len(customers)]
+                book = Book.getBook(isbns[i % len(isbns)])
+                book.quantity = 100
+                customer.cart.add_book(book.isbn, 1)
+                customer.checkout()
+                if durable_each:
+                    log.wait()
+            log.flush()
+            seconds = time.perf_counter() - start
+            print(f"{name:<40} {count / seconds:>12.0f} checkouts/s")
+            wal.close_log()
+
+
+@benchmark
+def bench_concurrent_checkout(size=100_000, threads=8) -> None:
+    load_books(200)
+    customers = load_customers(threads * 8)
+    Order.all_orders.clear()
+    for book in Book.all_books.values():
+        book.quantity = 50
+    stock = sum(book.quantity for book in Book.all_books.values())
+    isbns = list(Book.all_books)
+    per_thread = size // threads
+    placed = [0] * threads
+
+    def shopper(n):
+        rng = random.Random(n)
+        mine = customers[n::threads]
+        for i in range(per_thread):
+            customer = mine[i % len(mine)]
+            customer.cart.add_book(rng.choice(isbns), rng.randint(1, 3))
+            if customer.checkout():
+                placed[n] += 1
+
+    workers = [threading.Thread(target=shopper, args=(n,)) for n in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    seconds = time.perf_counter() - start
+
+    ordered = sum(sum(o.items.values()) for o in Order.all_orders.values())
+    in_carts = sum(sum(c.cart.items.values()) for c in customers)
+    left = sum(book.quantity for book in Book.all_books.values())
+    print(f"{threads} threads, {size} add+checkout attempts on {stock} copies")
+    print(f"{'checkouts':<40} {sum(placed):>12} ({sum(placed) / seconds:.0f}/s)")
+    print(f"{'copies ordered + in carts + left':<40} {ordered + in_carts + left:>12}")
+    print(f"{'negative stock':<40} {sum(b.quantity < 0 for b in Book.all_books.values()):>12}")
+    # two checkouts given the same id would leave one order in all_orders
+    print(f"{'orders lost to id clashes':<40} {sum(placed) - len(Order.all_orders):>12}")
+    assert ordered + in_carts + left == stock, "stock was oversold"
+    assert sum(placed) == len(Order.all_orders), "order ids clashed"
+
+
+SESSION_SCRIPT = [
+    "LOGIN",
+    "SIGN IN",
+    "{email}",
+    "{pin}",
+    "ENTER",
+    "Search Book",
+    "genre",
+    "Drama",
+    "BACK",
+    "Add Book",
+    "{isbn}",
+    "1",
+    "Checkout",
+    "Logout",
+]
+
+
+@benchmark
+def bench_sessions(size=2000) -> None:
+    from server import SessionServer
+
+    load_books(1000)
+    rows = list(iter_customers(size))
+    load_customers(size)
+    isbns = list(Book.all_books)
+    latencies = []
+
+    async def client(port, row, isbn):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        await reader.readline()
+        for line in SESSION_SCRIPT:
+            start = time.perf_counter()
+            writer.write(line.format(isbn=isbn, **row).encode() + b"\n")
+            await writer.drain()
+            await reader.readline()
+            latencies.append(time.perf_counter() - start)
+        writer.close()
+
+    async def run():
+        server = SessionServer(type("Store", (), {"name": "Bench", "address": ""}))
+        server.port = 0
+        await server.start()
+        start = time.perf_counter()
+        await asyncio.gather(
+            *(
+                client(server.port, row, isbns[i % len(isbns)])
+                for i, row in enumerate(rows)
+            )
+        )
+        seconds = time.perf_counter() - start
+        await server.stop()
+        return seconds
+
+    seconds = asyncio.run(run())
+    latencies.sort()
+    steps = len(latencies)
+    print(f"{size} concurrent sessions, {len(SESSION_SCRIPT)} steps each")
+    print(f"{'interactions':<40} {steps:>12} ({steps / seconds:.0f}/s)")
+    report("latency p50", latencies[steps // 2])
+    report("latency p99", latencies[steps * 99 // 100])
+
+
+@benchmark
+def bench_screen_latency(size=200) -> None:
+    from renderer import Renderer
+    from session import Session
+
+    load_books(1000)
+    row = next(iter_customers(1))
+    load_customers(1)
+    isbn = next(iter(Book.all_books))
+    store = type("Store", (), {"name": "Bench", "address": ""})
+    render = Renderer()
+    timings = {}
+    for _ in range(size):
+        session = Session(store, render)
+        shown_view = None
+        for line in SESSION_SCRIPT:
+            line = line.format(isbn=isbn, **row)
+            start = time.perf_counter()
+            session.handle(line)
+            view = session.view()
+            if view != shown_view:
+                session.render(view)
+                shown_view = view
+            timings.setdefault(line, []).append(time.perf_counter() - start)
+    print(f"keypress -> rendered screen, {size} runs (display excluded)")
+    for line, samples in timings.items():
+        samples.sort()
+        report(f"{line!r} p50", samples[len(samples) // 2])
+
+
+@benchmark
+def bench_render(size=2000) -> None:
+    from jinja2 import Environment, FileSystemLoader
+
+    from renderer import SCREENS_DIR, Renderer
+
+    load_books(1000)
+    books = [
+        dict(book.get_book_details(), total=book.price * 2)
+        for book in list(Book.all_books.values())[:10]
+    ]
+    rows = [
+        list(book.get_book_details().values())
+        for book in Book.search_by("genre", "Drama")
+    ]
+    screens = [
+        ("home.j2", {"storeName": "Bench", "storeAddress": "Somewhere"}),
+        ("customer.j2", {"userName": "A", "userEmail": "a@b.c", "books": books}),
+        ("search.j2", {"searchTitle": "SEARCH BOOK", "headers": [], "body": rows}),
+    ]
+    env = Environment(loader=FileSystemLoader(str(SCREENS_DIR)))
+    renderer = Renderer()
+    print(f"renders/s over {size} renders per screen")
+    for name, context in screens:
+        for label, render in [
+            ("get_template + render", lambda: env.get_template(name).render(context)),
+            ("precompiled", lambda: renderer.render(name, context)),
+            ("memoized", lambda: renderer(name, context)),
+        ]:
+            seconds = best_of(render, repeat=3, number=size)
+            print(f"{name + ' ' + label:<40} {1 / seconds:>12.0f} renders/s")
+
+
+@benchmark
+def bench_result_pages(size=1_000_000) -> None:
+    from renderer import Renderer
+    from session import BOOK_HEADERS, Session
+
+    render = Renderer()
+    store = type("Store", (), {"name": "Bench", "address": ""})
+    genre = GENRES[0]
+    print(f"search by genre {genre!r}, whole table vs first page")
+    for n in (size // 100, size // 10, size):
+        load_books(n)
+
+        def whole_table():
+            body = [
+                list(book.get_book_details().values())
+                for book in Book.search_by("genre", genre)
+            ]
+            return render.render(
+                "search.j2",
+                {"searchTitle": "SEARCH BOOK", "headers": BOOK_HEADERS, "body": body},
+            )
+
+        def first_page():
+            session = Session(store, render.render)
+            session.search("genre", genre)
+            return session.render()
+
+        def next_page():
+            session.on_results("NEXT")
+            return session.render()
+
+        session = Session(store, render.render)
+        session.search("genre", genre)
+        hits = Book.indexes["genre"].count(genre)
+        for label, build in [
+            ("whole table", whole_table),
+            ("first page", first_page),
+            ("next page", next_page),
+        ]:
+            tracemalloc.start()
+            start = time.perf_counter()
+            build()
+            seconds = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                f"{n:>9} books {hits:>7} hits {label:<12}"
+                f" {seconds * 1e3:>10.2f} ms {peak / 2**20:>8.2f} MB peak"
+            )
+
+
+# the cart screen before carts kept their lines: a pandas round trip per refresh
+def pandas_cart_lines(cart) -> tuple:
+    import pandas as pd
+
+    books = [
+        {"isbn": b.isbn, "title": b.title, "price": b.price, "quantity": q}
+        for b, q in cart.items.items()
+    ]
+    df = pd.read_json(io.StringIO(json.dumps(books)))
+    df["total"] = df["price"] * df["quantity"]
+    return df["quantity"].sum(), df.to_dict(orient="records")
+
+
+@benchmark
+def bench_cart_screen(size=50) -> None:
+    from session import Session
+
+    load_books(1000)
+    customer = load_customers(1)[0]
+    for isbn in list(Book.all_books)[:size]:
+        customer.cart.add_book(isbn, 2)
+    session = Session(None, None)
+    session.user = customer
+    print(f"cart screen data, {size} lines")
+    report("pandas round trip", best_of(lambda: pandas_cart_lines(customer.cart)))
+    report("incremental cart", best_of(session.customer_data, number=1000), "us")
+
+    # fresh interpreters, so nothing is imported yet
+    def import_seconds(module) -> float:
+        code = f"import time; t = time.perf_counter(); import {module}; "
+        code += "print(time.perf_counter() - t)"
+        samples = []
+        for _ in range(3):
+            out = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd="./src",
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            samples.append(float(out.stdout))
+        return min(samples)
+
+    report("cold import pandas", import_seconds("pandas"))
+    report("cold import app", import_seconds("app"))
+
+
+# employee dashboard rows before orders kept status indexes
+def scan_pending_orders() -> list:
+    return [
+        {
+            "order_id": order.order_id,
+            "customer_name": order.customer.name,
+            "item_count": len(order.items),
+            "total": order.total,
+            "approved": order.approved,
+        }
+        for order in Order.all_orders.values()
+        if not (order.approved or order.rejected)
+    ]
+
+
+@benchmark
+def bench_order_dashboard(size=100_000) -> None:
+    load_books(1000)
+    customers = load_customers(100)
+    books = list(Book.all_books.values())
+    Order.all_orders.clear()
+    Order.reindex()
+    employee = type("Employee", (), {"is_employee": True})()
+    for i in range(size):
+        Order(customers[i % 100], {books[i % 1000]: 1}, books[i % 1000].price)
+    # most orders are already handled, a few are still waiting
+    for order in list(Order.all_orders.values())[: size - 50]:
+        order.approve(employee)
+    store = BookStore("Bench", "")
+    print(f"{size} orders, {Order.count('pending')} pending")
+    report("scan pending orders", best_of(scan_pending_orders))
+    report("pending queue", best_of(Order.get_pending_orders, number=1000), "us")
+
+    def approve_next():
+        next(iter(Order.by_status["pending"].values())).approve(employee)
+        Order.get_pending_orders()
+
+    report("approve + pending queue", best_of(approve_next, repeat=1, number=20), "us")
+    report("update_sales", best_of(store.update_sales, number=1000), "us")
+
+
+@benchmark
+def bench_bulk_ops(size=20_000) -> None:
+    from loader import iter_feed
+
+    load_books(100_000)
+    customers = load_customers(100)
+    books = list(Book.all_books.values())
+    employee = type("Employee", (), {"is_employee": True})()
+    rng = random.Random(333)
+    feed = [
+        {"isbn": book.isbn, "price": round(rng.uniform(50, 1000), 2), "quantity": 50}
+        for book in rng.sample(books, size)
+    ]
+    print(f"{size} orders / feed rows, 100000 books, write-ahead log on")
+    with tempfile.TemporaryDirectory() as tmp:
+        feed_path = os.path.join(tmp, "feed.csv")
+        with open(feed_path, "w", encoding="utf-8") as f:
+            f.write("isbn,price,quantity\n")
+            f.writelines(f"{r['isbn']},{r['price']},{r['quantity']}\n" for r in feed)
+        wal.open_log(os.path.join(tmp, "store.wal"))
+
+        def place_orders() -> list:
+            Order.all_orders.clear()
+            Order.reindex()
+            for i in range(size):
+                book = books[i % len(books)]
+                Order(customers[i % 100], {book: 1}, book.price)
+            return list(Order.all_orders)
+
+        def one_by_one(order_ids):
+            for order_id in order_ids:
+                Order.get_order_by_id(order_id).approve(employee)
+
+        def updates_one_by_one():
+            for row in feed:
+                book = Book.getBook(row["isbn"])
+                book.update_price(row["price"], employee)
+                book.update_quantity(row["quantity"], employee)
+
+        for name, prepare, run in [
+            ("approve one by one", place_orders, one_by_one),
+            (
+                "approve_many",
+                place_orders,
+                lambda order_ids: Order.approve_many(order_ids, employee),
+            ),
+            ("update_price/quantity one by one", list, lambda _: updates_one_by_one()),
+            (
+                "apply_feed (CSV)",
+                list,
+                lambda _: Book.apply_feed(iter_feed(feed_path), employee),
+            ),
+        ]:
+            prepared = prepare()
+            start = time.perf_counter()
+            run(prepared)
+            wal.active.flush()
+            seconds = time.perf_counter() - start
+            print(f"{name:<40} {size / seconds:>12.0f} ops/s")
+        wal.close_log()
+
+
+@benchmark
+def bench_signin(size=500) -> None:
+    import hashlib
+
+    import hashing
+
+    rows = list(iter_customers(size))
+    start = time.perf_counter()
+    load_customers(size)
+    print(f"{size} customers, pin hashing {hashing.PIN_SCHEME}")
+    report("create (hash every PIN)", time.perf_counter() - start, "s")
+
+    # sha256 email keys and PINs, as before hashing.py
+    legacy = {
+        hashlib.sha256(r["email"].encode()).hexdigest(): hashlib.sha256(
+            r["pin"].encode()
+        ).hexdigest()
+        for r in rows
+    }
+
+    def legacy_signin(row):
+        stored = legacy.get(hashlib.sha256(row["email"].encode()).hexdigest())
+        return stored == hashlib.sha256(row["pin"].encode()).hexdigest()
+
+    def signin_all(signin, forget=False):
+        def run():
+            for row in rows:
+                if forget:
+                    hashing.forget_verified()
+                signin(row)
+
+        return run
+
+    signin = lambda row: User.signin(row["email"], row["pin"])  # noqa: E731
+    for name, run in [
+        ("legacy sha256", signin_all(legacy_signin)),
+        ("KDF", signin_all(signin, forget=True)),
+        ("KDF, verified before", signin_all(signin)),
+    ]:
+        seconds = best_of(run, repeat=3)
+        print(f"{name:<40} {size / seconds:>12.0f} sign-ins/s")
+
+    # how long the event loop stalls while sign-ins are being checked
+    async def stalls(offload) -> float:
+        worst, done = 0.0, False
+
+        async def ticker():
+            nonlocal worst
+            last = time.perf_counter()
+            while not done:
+                await asyncio.sleep(0)
+                now = time.perf_counter()
+                worst, last = max(worst, now - last), now
+
+        task = asyncio.create_task(ticker())
+        await asyncio.sleep(0)
+        hashing.forget_verified()
+        for row in rows[:50]:
+            user = User.all_users[User.lookup_key(row["email"])]
+            if offload:
+                await hashing.verify_async(row["pin"], user.pin)
+            else:
+                hashing.verify_pin(row["pin"], user.pin)
+                await asyncio.sleep(0)
+        done = True
+        await task
+        return worst
+
+    report("worst loop stall, inline", asyncio.run(stalls(False)))
+    report("worst loop stall, hashing pool", asyncio.run(stalls(True)))
+
+
+# just the fields the user registries look at
+class LightUser:
+    def __init__(self, email, phone, member_type=None, designation=None) -> None:
+        self.email = email
+        self.phone = phone
+        if member_type is not None:
+            self.member_type = sys.intern(member_type)
+        if designation is not None:
+            self.designation = sys.intern(designation)
+
+
+class LightCustomer(LightUser):
+    pass
+
+
+class LightEmployee(LightUser):
+    pass
+
+
+def make_light_users(n) -> list:
+    users = []
+    for i, row in enumerate(iter_customers(n)):
+        if i % 50:
+            users.append(LightCustomer(row["email"], row["phone"], row["member_type"]))
+        else:
+            designation = ("Cashier", "Manager", "Clerk")[i % 3]
+            users.append(LightEmployee(row["email"], row["phone"], None, designation))
+    return users
+
+
+# the registries before the user store: two dicts keyed by sha256 hex
+def legacy_registries(users) -> tuple:
+    import hashlib
+
+    all_users, by_role = {}, {LightCustomer: {}, LightEmployee: {}}
+    for user in users:
+        all_users[hashlib.sha256(user.email.encode()).hexdigest()] = user
+        by_role[type(user)][hashlib.sha256(user.email.encode()).hexdigest()] = user
+    return all_users, by_role
+
+
+def user_store(users):
+    import hashing
+    from userstore import UserStore
+
+    store = UserStore()
+    for user in users:
+        user.key = hashing.email_key(user.email)
+        store.add(user)
+    return store
+
+
+@benchmark
+def bench_user_store(size=1_000_000) -> None:
+    import hashlib
+
+    import hashing
+
+    print(f"{size} users, registry memory (user objects excluded) and lookups")
+    for name, build in [
+        ("sha256 hex, two dicts", legacy_registries),
+        ("user store with indexes", user_store),
+    ]:
+
+        def measure():
+            users = make_light_users(size)
+            return traced_bytes(lambda: build(users))
+
+        total, _ = in_child(measure)
+        print(f"{name:<40} {total / 2**20:>9.1f} MB {total / size:>7.0f} B/user")
+
+    users = make_light_users(size)
+    all_users, by_role = legacy_registries(users)
+    store = user_store(users)
+    sample = random.Random(5).sample(users, 1000)
+
+    def legacy_email():
+        for user in sample:
+            all_users[hashlib.sha256(user.email.encode()).hexdigest()]
+
+    def store_email():
+        for user in sample:
+            store[hashing.email_key(user.email)]
+
+    def legacy_phone():
+        return [u for u in all_users.values() if u.phone == sample[0].phone]
+    for name, run, number in [
+        ("by email x1000, sha256 dict", legacy_email, 10),
+        ("by email x1000, user store", store_email, 10),
+        ("by phone, scan", legacy_phone, 1),
+        ("by phone, index", lambda: store.find("phone", sample[0].phone), 1000),
+        (
+            "premium customers, scan",
+            lambda: [
+                u for u in by_role[LightCustomer].values() if u.member_type == "premium"
+            ],
+            1,
+        ),
+        (
+            "premium customers, index",
+            lambda: store.find("member_type", "premium"),
+            1,
+        ),
+        ("managers, index", lambda: store.find("designation", "Manager"), 100),
+    ]:
+        report(name, best_of(run, repeat=3, number=number))
+
+
+@benchmark
+def bench_sqlite(size=100_000) -> None:
+    import sqlstore
+
+    rng = random.Random(444)
+    isbns = [f"{i:09d}-{i % 10}" for i in rng.sample(range(size), 1000)]
+    title = next(iter_books(1))["title"].split()[0].lower()
+    author = next(iter_books(1))["author"]
+    print(f"{size} books, in-memory dicts and indexes vs sqlite")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "store.db")
+
+        def import_sqlite():
+            store = sqlstore.SqliteStore(path)
+            count = store.import_books(iter_books(size))
+            store.close()
+            return count
+
+        def open_sqlite():
+            store = sqlstore.SqliteStore(path)
+            store.query("SELECT count(*) FROM books")
+            return store
+
+        for name, build in [
+            ("load into memory", lambda: len(load_books(size))),
+            ("import into sqlite (executemany)", import_sqlite),
+            ("open sqlite", lambda: bool(open_sqlite())),
+        ]:
+            start = time.perf_counter()
+            _, peak = in_child(build)
+            seconds = time.perf_counter() - start
+            print(f"{name:<40} {seconds:>9.2f} s {peak:>9.0f} MB peak RSS")
+        import_sqlite()
+
+        load_books(size)
+        memory = [
+            ("getBook x1000", lambda: [Book.getBook(i) for i in isbns]),
+            ("genre search", lambda: Book.search_by("genre", "Drama")),
+            ("title casefold", lambda: Book.search_by("title", title, "casefold")),
+            ("author exact", lambda: Book.search_by("author", author)),
+            (
+                "title substring, first 20",
+                lambda: Book.search_by("title", title[:4], "substring", 20),
+            ),
+            ("price range 100-110", lambda: Book.search_range("price", 100, 110)),
+        ]
+        timings = {name: best_of(run, repeat=3) for name, run in memory}
+        reset_books()
+        sqlstore.active = open_sqlite()
+
+        def cold_get_books():
+            reset_books()
+            return [Book.getBook(i) for i in isbns]
+
+        sqlite = dict(memory, **{"getBook x1000": cold_get_books})
+        try:
+            for name, run in sqlite.items():
+                seconds = best_of(run, repeat=3)
+                print(
+                    f"{name:<30} memory {timings[name] * 1e3:>9.3f} ms"
+                    f"   sqlite {seconds * 1e3:>9.3f} ms"
+                )
+        finally:
+            sqlstore.active.close()
+            sqlstore.active = None
+            reset_books()
+
+
+# revenue by genre and the top ten books by walking the order objects
+def loop_reports() -> tuple:
+    by_genre, units = {}, {}
+    for order in Order.all_orders.values():
+        if order.status != "approved":
+            continue
+        weight = sum(book.price * qty for book, qty in order.items.items())
+        for book, qty in order.items.items():
+            revenue = order.total * book.price * qty / weight
+            by_genre[book.genre] = by_genre.get(book.genre, 0) + revenue
+            units[book.isbn] = units.get(book.isbn, 0) + qty
+    return by_genre, sorted(units.items(), key=lambda item: -item[1])[:10]
+
+
+@benchmark
+def bench_analytics(size=100_000) -> None:
+    import analytics
+
+    load_books(10_000)
+    customers = load_customers(100)
+    books = list(Book.all_books.values())
+    Order.all_orders.clear()
+    Order.reindex()
+    employee = type("Employee", (), {"is_employee": True})()
+    rng = random.Random(20)
+    for i in range(size):
+        picked = rng.sample(books, rng.randint(1, 3))
+        items = {book: rng.randint(1, 3) for book in picked}
+        total = sum(book.price * qty for book, qty in items.items())
+        Order(customers[i % 100], items, total)
+    pending = list(Order.all_orders.values())
+    for order in pending[: size * 3 // 4]:
+        order.approve(employee)
+    print(f"{size} orders, 10000 books")
+    report("python loop: revenue by genre + top 10", best_of(loop_reports, repeat=3))
+
+    analytics.detach()
+    start = time.perf_counter()
+    engine = BookStore.analytics()
+    report("attach (one full build)", time.perf_counter() - start)
+
+    def vectorized():
+        engine.revenue_by("genre")
+        engine.top_sellers(10)
+
+    report("vectorized: revenue by genre + top 10", best_of(vectorized), "us")
+    # 50 timed calls below, each approves its share of the pending orders
+    waiting = pending[size * 3 // 4 :]
+    batch = max(1, min(100, len(waiting) // 50))
+    waiting = iter(waiting)
+
+    def approve_and_report():
+        for order in islice(waiting, batch):
+            order.approve(employee)
+        vectorized()
+
+    report(
+        f"{batch} approvals + refresh + reports",
+        best_of(approve_and_report, repeat=5, number=10),
+        "us",
+    )
+    expected, got = loop_reports()[0], engine.revenue_by("genre")
+    for genre, revenue in expected.items():
+        assert abs(got[genre] - revenue) < 1e-6 * revenue, genre
+    analytics.detach()
+
+
+@benchmark
+def bench_recommend(size=100_000) -> None:
+    import recommend
+
+    load_books(10_000)
+    customers = load_customers(100)
+    books = list(Book.all_books.values())
+    Order.all_orders.clear()
+    Order.reindex()
+    for customer in customers:
+        customer.orders.clear()
+    recommend.detach()
+    rng = random.Random(23)
+    # a few hundred books sell most, the rest now and then
+    popular = books[:300]
+    for i in range(size):
+        picked = {rng.choice(popular if rng.random() < 0.8 else books) for _ in range(3)}
+        customer = customers[i % len(customers)]
+        order = Order(customer, dict.fromkeys(picked, 1), 0)
+        customer.orders[order.order_id] = order
+    print(f"{size} orders, 10000 books")
+    start = time.perf_counter()
+    engine = recommend.attach()
+    report("attach (one full build)", time.perf_counter() - start)
+
+    def checkout():
+        customer = rng.choice(customers)
+        order = Order(customer, dict.fromkeys(rng.sample(popular, 3), 1), 0)
+        customer.orders[order.order_id] = order
+
+    report("order + co-purchase update", best_of(checkout, number=1000), "us")
+    isbns = [book.isbn for book in popular]
+    report(
+        "also_bought, after an order",
+        best_of(lambda: (checkout(), engine.also_bought(rng.choice(isbns))), number=1000),
+        "us",
+    )
+    report(
+        "also_bought, cached",
+        best_of(lambda: engine.also_bought(isbns[0]), number=1000),
+        "us",
+    )
+    page = [book.isbn for book in books[:20]]
+    report("for_books (results page)", best_of(lambda: engine.for_books(page)), "us")
+    report(
+        "for_customer, after an order",
+        best_of(lambda: (checkout(), engine.for_customer(customers[0])), number=100),
+        "us",
+    )
+    report(
+        "for_customer, cached",
+        best_of(lambda: engine.for_customer(customers[0]), number=1000),
+        "us",
+    )
+    recommend.detach()
+
+
+@benchmark
+def bench_shards(size=100_000, clients=8, seconds=2.0) -> None:
+    import shards
+
+    load_books(size)
+    rng = random.Random(24)
+    books = list(Book.all_books.values())
+    queries = []
+    for book in rng.sample(books, 200):
+        words = book.title.split()
+        queries += [
+            (Book.search_by, "title", words[0][:4], "substring"),
+            (Book.search_by, "author", book.author[:3], "prefix"),
+            (Book.search_by, "genre", book.genre, "exact"),
+            (Book.search_range, "price", book.price, book.price + 50),
+            (Book.search_range, "year", book.year, book.year + 2),
+        ]
+
+    # seconds per query with clients threads querying at once, the inverse
+    # of the throughput
+    def per_query() -> float:
+        done = [0] * clients
+        stop = time.perf_counter() + seconds
+
+        def client(i):
+            for search, *args in queries[i:] + queries[:i]:
+                if time.perf_counter() > stop:
+                    break
+                search(*args, limit=20)
+                done[i] += 1
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return (time.perf_counter() - start) / sum(done)
+
+    # once untimed, so one-off first-use costs stay out of the timings
+    for search, *args in queries:
+        search(*args, limit=20)
+    cores = os.cpu_count() or 1
+    print(f"search over {size} books, {clients} client threads, {cores} cores")
+    report("in process, per query", per_query(), "us")
+    for workers in sorted({1, 2, 4, cores}):
+        start = time.perf_counter()
+        shards.start(workers)
+        report(f"{workers} workers, start", time.perf_counter() - start)
+        report(f"{workers} workers, per query", per_query(), "us")
+    shards.stop()
+
+
+@benchmark
+def bench_events(size=100_000, watchers=100) -> None:
+    import events
+    from session import Session
+
+    load_books(size)
+    customers = load_customers(100)
+    employee = Employee(**next(iter_employees(1)))
+    books = list(Book.all_books.values())
+    rng = random.Random(25)
+    for customer in customers:
+        for _ in range(5):
+            customer.cart.add_book(rng.choice(books).isbn)
+        customer.checkout()
+    store = type("Store", (), {"name": "Bench", "address": ""})
+
+    def session(user, screen):
+        session = Session(store, None)
+        session.user, session.screen = user, screen
+        return session
+
+    def place_order():
+        customer = rng.choice(customers)
+        Order(customer, {rng.choice(books): 1}, 0)
+
+    print(f"{size} books, {Order.count('pending')} pending orders")
+    for screen, user, build in [
+        ("employee", employee, Session.employee_data),
+        ("customer", customers[0], Session.customer_data),
+    ]:
+        watched = session(user, screen)
+        report(
+            f"{screen} screen, rebuilt every time",
+            best_of(lambda: build(watched), number=10_000),
+            "us",
+        )
+        report(
+            f"{screen} screen, unchanged",
+            best_of(watched.view, number=10_000),
+            "us",
+        )
+        watched.close()
+    watched = session(employee, "employee")
+    report(
+        "employee screen, after an order",
+        best_of(lambda: (place_order(), watched.view()), number=1000),
+        "us",
+    )
+    watched.close()
+
+    # a restock touching every book while results pages are open
+    feed = [{"isbn": book.isbn, "quantity": 50} for book in books]
+    for count in (0, watchers):
+        isbns = list(Book.all_books)
+        pages = [
+            events.subscribe([events.BookChanged], rng.sample(isbns, 20))
+            for _ in range(count)
+        ]
+        report(
+            f"restock feed, {count} results pages open",
+            best_of(lambda: Book.apply_feed(feed, employee), repeat=3),
+        )
+        if pages:
+            kept = max(len(page.pending) for page in pages)
+            print(f"{'most changes queued for one page':<40} {kept:>12}")
+        for page in pages:
+            page.close()
+    subscription = events.subscribe([events.BookChanged], limit=events.LIMIT)
+    Book.apply_feed(feed, employee)
+    overflowed = subscription.drain() is None
+    print(f"{'all-books subscriber overflowed':<40} {overflowed!s:>12}")
+    subscription.close()
+
+
+@benchmark
+def bench_metrics(size=100_000) -> None:
+    import logging
+
+    import metrics
+
+    load_books(size)
+    sample = Book.getBook(make_books(size)[size // 2]["isbn"])
+    calls = [
+        ("getBook", lambda: Book.getBook(sample.isbn)),
+        ("search_by genre", lambda: Book.search_by("genre", sample.genre, limit=20)),
+        ("search_range price", lambda: Book.search_range("price", 100, 101)),
+    ]
+    print(f"instrumented calls over {size} books")
+    for state in ("disabled", "enabled"):
+        if state == "enabled":
+            metrics.enable(handlers=[logging.NullHandler()], log_interval=0)
+        for name, call in calls:
+            report(f"{name}, metrics {state}", best_of(call, number=10_000), "us")
+    report("export()", best_of(metrics.export, number=100), "us")
+    metrics.disable()
+    metrics.reset()
+
+
+# DOMAIN SUITE
+# The hot paths of the domain API on seeded synthetic data: size books, one
+# customer per 100 books and one employee per 10000, size / 10 orders. Meant
+# to be run at SUITE_SIZES and saved, e.g.
+#   python test/bench.py suite --size 10000 --size 100000 --save base.json
+#   python test/bench.py suite --size 10000 --size 100000 --compare base.json
+SUITE_SIZES = (10_000, 100_000, 1_000_000, 10_000_000)
+
+
+@benchmark
+def bench_suite(size=SUITE_SIZES[0]) -> None:
+    import hashing
+
+    customer_count, employee_count = max(100, size // 100), max(10, size // 10_000)
+    reset_store()
+    with tempfile.TemporaryDirectory() as tmp:
+        files = [
+            (Book, "books.json", iter_books(size)),
+            (Customer, "customers.json", iter_customers(customer_count)),
+            (Employee, "employees.json", iter_employees(employee_count)),
+        ]
+        for cls, name, records in files:
+            write_json_array(os.path.join(tmp, name), records)
+        print(f"{size} books, {customer_count} customers, {employee_count} employees")
+        for cls, name, _ in files:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                cls.from_json(os.path.join(tmp, name))
+            report(f"{cls.__name__}.from_json", time.perf_counter() - start, "s")
+
+    rng = random.Random(21)
+    books = rng.sample(list(Book.all_books.values()), min(size, 1000))
+    isbns = [book.isbn for book in books]
+    sample = books[0]
+    for category, value, mode in [
+        ("isbn", sample.isbn, "exact"),
+        ("title", sample.title.split()[0], "substring"),
+        ("author", sample.author.split()[-1], "substring"),
+        ("genre", sample.genre, "exact"),
+    ]:
+        search = lambda: Book.search_by(category, value, mode, limit=20)  # noqa: E731
+        report(f"search_by {category} {mode}", best_of(search, number=10), "us")
+    report(
+        "getBook",
+        best_of(lambda: [Book.getBook(isbn) for isbn in isbns]) / len(isbns),
+        "us",
+    )
+
+    customers = list(Customer.all_customers.values())
+    employee = next(iter(Employee.all_employees.values()))
+    cart = customers[0].cart
+    in_stock = [book.isbn for book in books if book.quantity][:100]
+
+    def add_remove():
+        for isbn in in_stock:
+            cart.add_book(isbn)
+            cart.remove_book(isbn)
+
+    seconds = best_of(add_remove) / len(in_stock)
+    report("Cart.add_book + remove_book", seconds, "us")
+
+    # the orders the dashboard and sales figures run over, most handled
+    for i in range(size // 10):
+        book = books[i % len(books)]
+        Order(customers[i % len(customers)], {book: 1}, book.price)
+    Order.approve_many(list(Order.all_orders)[: size // 20], employee)
+    buyers = customers[: min(len(customers), 1000)]
+    for customer in buyers:
+        customer.cart.add_book(in_stock[0])
+    start = time.perf_counter()
+    for customer in buyers:
+        customer.checkout()
+    report("Customer.checkout", (time.perf_counter() - start) / len(buyers), "us")
+
+    def first_after_change():
+        Order.version += 1
+        Order.get_pending_orders()
+
+    report("get_pending_orders", best_of(Order.get_pending_orders, number=100), "us")
+    report("get_pending_orders, changed", best_of(first_after_change), "us")
+    store = BookStore("Bench", "")
+    report("update_sales", best_of(store.update_sales, number=100), "us")
+
+    rows = list(iter_customers(min(customer_count, 20)))
+    signin = lambda row: User.signin(row["email"], row["pin"])  # noqa: E731
+
+    def cold_signins():
+        hashing.forget_verified()
+        for row in rows:
+            assert signin(row)
+
+    report("User.signin", best_of(cold_signins, repeat=3) / len(rows))
+    warm = best_of(lambda: [signin(row) for row in rows], number=10) / len(rows)
+    report("User.signin, verified before", warm, "us")
+    reset_store()
+
+
+# domain classes must import without UI or analytics dependencies
+HEAVY_MODULES = ["IPython", "jinja2", "pandas", "numpy"]
+
+
+# keyword only: --size is not a budget, see main()
+@benchmark
+def bench_import_time(*, budget=150) -> None:
+    code = "import sys, app; print(*[m for m in sys.argv[1:] if m in sys.modules])"
+    samples = []
+    for _ in range(5):
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code, *HEAVY_MODULES],
+            cwd="./src",
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        # "import time: self [us] | cumulative | imported package", app is last
+        for line in out.stderr.splitlines():
+            if line.endswith("| app"):
+                samples.append(int(line.split("|")[1]) / 1e6)
+    heavy = out.stdout.split()
+    seconds = min(samples)
+    report("import app (cumulative)", seconds)
+    report("budget", budget / 1e3)
+    if heavy:
+        sys.exit(f"import app pulled in {', '.join(heavy)}")
+    if seconds * 1e3 > budget:
+        sys.exit(f"import app took {seconds * 1e3:.0f} ms, over the {budget} ms budget")
+
+
+def save_results(file_path) -> None:
+    commit = subprocess.run(
+        ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True
+    ).stdout.strip()
+    meta = {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit or None,
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "cpus": os.cpu_count(),
+    }
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "results": RESULTS}, f, indent=2)
+    print(f"saved {sum(map(len, RESULTS.values()))} results to {file_path}")
+
+
+# timings in both runs that got slower by more than tolerance
+def compare_results(file_path, tolerance=REGRESSION_TOLERANCE) -> list:
+    with open(file_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"compared with {file_path} ({baseline['meta'].get('commit')})")
+    regressions = []
+    for run, results in RESULTS.items():
+        before = baseline["results"].get(run, {})
+        for name, seconds in results.items():
+            old = before.get(name)
+            if old is None or max(old, seconds) < NOISE_FLOOR:
+                continue
+            change = seconds / old - 1 if old else float("inf")
+            if change > tolerance:
+                regressions.append((run, name, old, seconds))
+                print(
+                    f"SLOWER {run} {name}: {old:.6f}s -> {seconds:.6f}s ({change:+.0%})"
+                )
+    if not regressions:
+        print(f"no timing slower by more than {tolerance:.0%}")
+    return regressions
+
+
+def main():
+    global current_run
+    parser = argparse.ArgumentParser(description="BookStore benchmarks")
+    parser.add_argument("names", nargs="*", help=", ".join(BENCHMARKS))
+    parser.add_argument(
+        "--size", type=int, action="append", help="repeat for several sizes"
+    )
+    parser.add_argument("--save", metavar="JSON", help="write the timings here")
+    parser.add_argument(
+        "--compare", metavar="JSON", help="flag timings slower than in this run"
+    )
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE)
+    args = parser.parse_args()
+
+    for name in args.names or BENCHMARKS:
+        bench = BENCHMARKS[name]
+        # without a size parameter it runs once, whatever --size says
+        if not bench.__defaults__:
+            current_run = name
+            bench()
+            continue
+        for size in args.size or bench.__defaults__[:1]:
+            current_run = f"{name}[{size}]"
+            bench(size)
+    if args.save:
+        save_results(args.save)
+    if args.compare and compare_results(args.compare, args.tolerance):
+        sys.exit("timings regressed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app import Book, Order, User  # noqa: E402
+
+BOOKS = [
+    {
+        "isbn": "000000001-1",
+        "title": "Thuja Occidentalis",
+        "author": "Ada Lane",
+        "year": 1965,
+        "genre": "Thriller",
+        "price": 275.12,
+        "quantity": 9,
+    },
+    {
+        "isbn": "000000002-2",
+        "title": "Quiet Harbour",
+        "author": "Ben Moss",
+        "year": 1999,
+        "genre": "Drama",
+        "price": 80.5,
+        "quantity": 3,
+    },
+]
+CUSTOMER = {
+    "name": "Xever Bouch",
+    "email": "xbouch0@example.com",
+    "pin": "944569",
+    "address": "Utrecht",
+    "phone": "119-309-4918",
+    "member_type": "regular",
+}
+EMPLOYEE = {
+    "name": "Tova Kilgallen",
+    "email": "tkilgallen0@example.com",
+    "pin": "862496",
+    "address": "Zernograd",
+    "phone": "570-766-2353",
+    "designation": "Cashier",
+}
+
+
+# the registries and indexes are class level, every test and bench run
+# starts from an empty store
+def reset_books() -> None:
+    Book.all_books.clear()
+    for indexes in Book.field_indexes.values():
+        for index in indexes:
+            index.clear()
+
+
+def reset_store() -> None:
+    reset_books()
+    User.all_users.clear()
+    Order.all_orders.clear()
+    Order.last_order_id = 0
+    Order.reindex()
+
+
+@pytest.fixture
+def empty_store():
+    reset_store()
+    yield
+    reset_store()
+
+
+# books.json, customers.json and employees.json with the records above
+@pytest.fixture
+def json_dir(tmp_path, empty_store):
+    for name, records in [
+        ("books", BOOKS),
+        ("customers", [CUSTOMER]),
+        ("employees", [EMPLOYEE]),
+    ]:
+        (tmp_path / f"{name}.json").write_text(json.dumps(records))
+    return tmp_path
@@ -0,0 +1,38 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+pytest.importorskip("numpy")
+
+import analytics  # noqa: E402
+from app import Book, BookStore, Customer, Employee  # noqa: E402
+
+
+@pytest.fixture
+def engine(empty_store):
+    Book("000000001-1", "Quiet Harbour", "Ben Moss", 1999, "Drama", 10.0, 50)
+    Book("000000002-2", "Thuja", "Ada Lane", 1965, "Thriller", 20.0, 50)
+    yield BookStore.analytics()
+    analytics.detach()
+
+
+def test_changes_are_kept_once_per_book_and_order(engine):
+    customer = Customer("Cy", "cy@example.com", "1234", "", "1", "regular")
+    employee = Employee("Clerk", "clerk@example.com", "1234", "", "9", "Clerk")
+    for _ in range(20):
+        customer.cart.add_book("000000001-1", 1)
+        customer.cart.remove_book("000000001-1")
+    customer.cart.add_book("000000001-1", 2)
+    customer.cart.add_book("000000002-2", 1)
+    customer.checkout()
+    (order_id,) = customer.orders
+    customer.orders[order_id].approve(employee)
+    assert len(engine.changed_books) == 2
+    assert len(engine.changed_orders) == 1
+    assert engine.revenue_by("genre") == pytest.approx(
+        {"Drama": 20.0, "Thriller": 20.0}
+    )
+    assert not engine.changed_books and not engine.changed_orders
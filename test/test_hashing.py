@@ -0,0 +1,12 @@
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import hashing  # noqa: E402
+
+
+def test_a_wrong_pin_is_refused_after_a_right_one():
+    stored = hashing.hash_pin("944569")
+    assert hashing.verify_pin("944569", stored)
+    assert not hashing.verify_pin("000000", stored)
@@ -0,0 +1,55 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+from app import Book, Customer, Employee, Order  # noqa: E402
+
+
+@pytest.fixture
+def store(empty_store):
+    book = Book("000000001-1", "Quiet Harbour", "Ben Moss", 1999, "Drama", 80.5, 1)
+    customers = [
+        Customer(f"Customer {i}", f"c{i}@example.com", "1234", "", f"{i}", "regular")
+        for i in range(2)
+    ]
+    employee = Employee("Clerk", "clerk@example.com", "1234", "", "9", "Clerk")
+    yield book, customers, employee
+
+
+def test_rejected_order_cannot_be_approved(store):
+    book, (first, second), employee = store
+    assert first.cart.add_book(book.isbn, 1)
+    assert first.checkout()
+    (order_id,) = first.orders
+    assert Order.cancel_many([order_id], employee) == [order_id]
+    assert book.quantity == 1  # the copy went back on the shelf
+    assert Order.approve_many([order_id], employee) == []
+    assert not Order.get_order_by_id(order_id).approve(employee)
+    assert Order.get_order_by_id(order_id).status == "rejected"
+    assert second.cart.add_book(book.isbn, 1)
+    assert book.quantity == 0
+    assert not first.cart.add_book(book.isbn, 1)  # sold once only
+
+
+def test_approve_many_returns_the_approved_ids(store):
+    book, (first, _), employee = store
+    first.cart.add_book(book.isbn, 1)
+    first.checkout()
+    (order_id,) = first.orders
+    assert Order.approve_many([order_id, "missing"], employee) == [order_id]
+    assert Order.get_order_by_id(order_id).status == "approved"
+
+
+def test_stock_ranges_follow_reservations(store):
+    book, (first, second), _ = store
+    other = Book("000000002-2", "Low Tide", "Ben Moss", 2001, "Drama", 12.0, 3)
+    assert first.cart.add_book(book.isbn, 1)
+    assert Book.search_range("quantity", high=0) == [book]
+    assert second.cart.add_book(other.isbn, 2)
+    assert first.cart.remove_book(book.isbn)
+    assert Book.search_range("quantity", 1, 1) == [book, other]
+    other.quantity = 7
+    assert Book.search_range("quantity", low=2) == [other]
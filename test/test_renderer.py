@@ -0,0 +1,20 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+pytest.importorskip("jinja2")
+
+from renderer import Renderer  # noqa: E402
+
+
+def test_equal_values_of_other_types_are_memoized_apart(tmp_path):
+    (tmp_path / "total.j2").write_text("{{ total }} {{ rows }}")
+    render = Renderer(tmp_path, cache_dir=str(tmp_path))
+    assert render("total.j2", total=0, rows=[1, 2]) == "0 [1, 2]"
+    assert render("total.j2", total=0.0, rows=[1.0, 2]) == "0.0 [1.0, 2]"
+    assert render("total.j2", total=False, rows=[True, 2]) == "False [True, 2]"
+    assert render("total.j2", total=0, rows=[1, 2]) == "0 [1, 2]"
+    assert render.hits == 1
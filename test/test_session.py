@@ -0,0 +1,74 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import session as session_module  # noqa: E402
+from app import Book, Customer, Employee  # noqa: E402
+from session import PAGE_SIZE, Session  # noqa: E402
+
+
+@pytest.fixture
+def session(empty_store):
+    for i in range(2 * PAGE_SIZE + 5):
+        Book(f"{i:09d}-0", f"Book {i:03d}", "Ann Author", 2000, "Drama", 10.0, 5)
+    session = Session(type("Store", (), {"name": "Test", "address": ""}), None)
+    session.user = Customer("Cy", "cy@example.com", "1234", "", "1", "regular")
+    return session
+
+
+def titles(session) -> list:
+    return [row[1] for row in session.results["body"]]
+
+
+def test_pages_and_refreshes_reuse_the_search(session, monkeypatch):
+    searches = []
+    iter_search_by = Book.iter_search_by
+
+    def counted(*args):
+        searches.append(args)
+        return iter_search_by(*args)
+
+    monkeypatch.setattr(Book, "iter_search_by", counted)
+    session.search("title", "book")
+    first = titles(session)
+    assert first == [f"Book {i:03d}" for i in range(PAGE_SIZE)]
+    session.on_results("NEXT")
+    session.on_results("NEXT")
+    assert titles(session) == [f"Book {i:03d}" for i in range(40, 45)]
+    assert not session.results["hasNext"]
+    session.on_results("PREV")
+    Book.getBook(f"{PAGE_SIZE:09d}-0").price = 12.0
+    session.view()  # refreshes the page the change is on
+    assert session.results["body"][0][5] == 12.0
+    assert len(searches) == 1
+
+
+def test_the_order_list_shows_a_new_order_on_refresh(session):
+    customer = session.user
+    customer.cart.add_book("000000000-0", 1)
+    customer.checkout()
+    session.on_customer("All Orders")
+    assert len(session.results["body"]) == 1
+    customer.cart.add_book("000000001-0", 1)
+    customer.checkout()
+    session.view()
+    assert len(session.results["body"]) == 2
+
+
+def test_feeds_are_only_read_from_the_feeds_directory(session, tmp_path, monkeypatch):
+    feeds = tmp_path / "feeds"
+    feeds.mkdir()
+    (feeds / "stock.csv").write_text("isbn,quantity\n000000000-0,42\n")
+    (tmp_path / "secret.csv").write_text("isbn,quantity\n000000001-0,0\n")
+    monkeypatch.setattr(session_module, "FEEDS_DIR", feeds)
+    session.user = Employee("Clerk", "clerk@example.com", "1234", "", "9", "Clerk")
+    session.screen = "employee"
+    for path in ["../secret.csv", str(tmp_path / "secret.csv"), "stock.csv"]:
+        session.handle("Update Stock")
+        session.handle(path)
+    assert Book.getBook("000000001-0").quantity == 5
+    assert Book.getBook("000000000-0").quantity == 42
+    assert session.message == "<h1>UPDATED 1 BOOK(S)</h1>"
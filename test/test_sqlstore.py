@@ -0,0 +1,97 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import sqlstore  # noqa: E402
+from app import Book, BookStore, Order, User  # noqa: E402
+from conftest import CUSTOMER, EMPLOYEE, reset_store  # noqa: E402
+
+
+# close, forget every object, open again from the same directory
+def reopen(data_dir) -> None:
+    BookStore.close_data()
+    reset_store()
+    BookStore.open_data(data_dir, display=False, backend="sqlite")
+
+
+@pytest.fixture
+def data_dir(json_dir):
+    BookStore.open_data(json_dir, display=False, backend="sqlite")
+    yield json_dir
+    BookStore.close_data()
+
+
+def test_added_book_is_found_and_survives_a_restart(data_dir):
+    assert Book.add_book("NEW-1", "New Arrival", "Cy Dunn", 2024, "Drama", 12.5, 4)
+    assert [book.isbn for book in Book.search_by("title", "New Arrival")] == ["NEW-1"]
+    reopen(data_dir)
+    book = Book.getBook("NEW-1")
+    assert book is not None
+    assert book.get_book_details() == {
+        "isbn": "NEW-1",
+        "title": "New Arrival",
+        "author": "Cy Dunn",
+        "year": 2024,
+        "genre": "Drama",
+        "price": 12.5,
+        "quantity": 4,
+    }
+
+
+def test_cart_and_its_stock_survive_a_restart(data_dir):
+    customer = User.get_user(CUSTOMER["email"])
+    assert customer.cart.add_book("000000001-1", 2)
+    assert Book.getBook("000000001-1").quantity == 7
+    reopen(data_dir)
+    customer = User.get_user(CUSTOMER["email"])
+    book = Book.getBook("000000001-1")
+    assert book.quantity == 7
+    assert customer.cart.items == {book: 2}
+    assert customer.cart.count == 2
+    assert customer.cart.total == pytest.approx(2 * 275.12)
+
+
+def test_orders_and_prices_survive_a_restart(data_dir):
+    customer = User.get_user(CUSTOMER["email"])
+    employee = User.get_user(EMPLOYEE["email"])
+    customer.cart.add_book("000000002-2", 1)
+    assert customer.checkout()
+    (order_id,) = customer.orders
+    assert Book.getBook("000000001-1").update_price(199.0, employee)
+    reopen(data_dir)
+    order = Order.get_order_by_id(order_id)
+    assert order.status == "pending"
+    assert [book.isbn for book in order.items] == ["000000002-2"]
+    assert Book.getBook("000000001-1").price == 199.0
+    assert Book.getBook("000000002-2").quantity == 2
+
+
+def test_range_search_reads_only_the_books_it_returns(data_dir):
+    assert not Book.all_books
+    assert [book.isbn for book in Book.search_range("price", limit=1)] == [
+        "000000002-2"
+    ]
+    assert list(Book.all_books) == ["000000002-2"]
+    employee = User.get_user(EMPLOYEE["email"])
+    Book.getBook("000000001-1").update_price(1.0, employee)  # not written yet
+    assert [book.isbn for book in Book.search_range("price", limit=1)] == [
+        "000000001-1"
+    ]
+    assert [book.isbn for book in Book.search_range("price", low=50)] == ["000000002-2"]
+    assert [book.isbn for book in Book.search_range("price", high=100)] == [
+        "000000001-1",
+        "000000002-2",
+    ]
+
+
+def test_iter_search_by_pages_through_the_rows(data_dir, monkeypatch):
+    monkeypatch.setattr(sqlstore, "ITER_FIRST", 1)
+    for i in range(6):
+        Book.add_book(f"NEW-{i}", f"Harbour {i}", "Cy Dunn", 2024, "Drama", 1.0, 1)
+    expected = [book.isbn for book in Book.search_by("title", "har", "substring")]
+    assert len(expected) == 7
+    found = [book.isbn for book in Book.iter_search_by("title", "har", "substring")]
+    assert found == expected
@@ -0,0 +1,113 @@
+import json
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "src"))
+
+import wal  # noqa: E402
+from app import Book, BookStore, Customer, Employee, Order, User  # noqa: E402
+from conftest import CUSTOMER, EMPLOYEE, reset_store  # noqa: E402
+
+ISBN = "000000002-2"
+
+
+@pytest.fixture
+def store(empty_store):
+    book = Book(ISBN, "Quiet Harbour", "Ben Moss", 1999, "Drama", 80.5, 1)
+    customers = [
+        Customer(f"Customer {i}", f"c{i}@example.com", "1234", "", f"{i}", "regular")
+        for i in range(2)
+    ]
+    return book, customers
+
+
+# records as the writer would log them, in the order given
+def write_log(path, *records) -> Path:
+    lines = [json.dumps({**data, "seq": seq}) for seq, data in enumerate(records, 1)]
+    path.write_text("\n".join(lines) + "\n")
+    return path
+
+
+def test_checkouts_logged_out_of_id_order_keep_their_ids(store, tmp_path):
+    book, (first, second) = store
+    book.quantity = 2
+    log = write_log(
+        tmp_path / "store.wal",
+        {"op": "cart_add", "email": first.email, "isbn": ISBN, "qty": 1},
+        {"op": "cart_add", "email": second.email, "isbn": ISBN, "qty": 1},
+        {"op": "checkout", "email": second.email, "order_id": "000001"},
+        {"op": "checkout", "email": first.email, "order_id": "000000"},
+    )
+    assert wal.replay(log) == 4
+    assert list(first.orders) == ["000000"]
+    assert list(second.orders) == ["000001"]
+    assert Order.last_order_id == 2
+    book.quantity = 1
+    first.cart.add_book(ISBN, 1)
+    assert first.checkout()
+    assert sorted(Order.all_orders) == ["000000", "000001", "000002"]
+    assert Order.count("pending") == 3
+
+
+def test_a_reservation_logged_before_the_release_it_needed(store, tmp_path):
+    # live: the first customer takes the only copy and puts it back, then the
+    # second one takes it, but the second add reached the log first
+    book, (first, second) = store
+    log = write_log(
+        tmp_path / "store.wal",
+        {"op": "cart_add", "email": first.email, "isbn": ISBN, "qty": 1},
+        {"op": "cart_add", "email": second.email, "isbn": ISBN, "qty": 1},
+        {"op": "cart_remove", "email": first.email, "isbn": ISBN},
+    )
+    wal.replay(log)
+    assert first.cart.items == {}
+    assert second.cart.items == {book: 1}
+    assert book.quantity == 0
+
+
+def test_a_restock_logged_before_an_earlier_reservation(store, tmp_path):
+    # live: 1 copy, the second customer takes it, an employee sets 10
+    book, (_, second) = store
+    log = write_log(
+        tmp_path / "store.wal",
+        {"op": "quantity", "isbn": ISBN, "quantity": 10, "delta": 10},
+        {"op": "cart_add", "email": second.email, "isbn": ISBN, "qty": 1},
+    )
+    wal.replay(log)
+    assert book.quantity == 10
+    assert second.cart.items == {book: 1}
+
+
+# open from JSON, change things, then either crash (the log is all there is)
+# or close (the snapshot holds everything) and open again
+@pytest.mark.parametrize("clean_close", [False, True])
+def test_changes_survive_a_restart(json_dir, clean_close):
+    BookStore.open_data(json_dir, display=False)
+    customer = User.get_user(CUSTOMER["email"])
+    employee = User.get_user(EMPLOYEE["email"])
+    assert isinstance(employee, Employee)
+    customer.cart.add_book(ISBN, 2)
+    assert customer.checkout()
+    (order_id,) = customer.orders
+    Order.get_order_by_id(order_id).approve(employee)
+    customer.cart.add_book("000000001-1", 1)
+    Book.getBook("000000001-1").update_quantity(20, employee)
+    Book.getBook(ISBN).update_price(70.0, employee)
+    if clean_close:
+        BookStore.close_data()
+    else:
+        wal.close_log()
+    reset_store()
+    BookStore.open_data(json_dir, display=False)
+    try:
+        customer = User.get_user(CUSTOMER["email"])
+        assert Order.get_order_by_id(order_id).status == "approved"
+        assert customer.cart.items == {Book.getBook("000000001-1"): 1}
+        assert Book.getBook("000000001-1").quantity == 20
+        assert Book.getBook(ISBN).quantity == 1
+        assert Book.getBook(ISBN).price == 70.0
+        assert Order.last_order_id == 1
+    finally:
+        BookStore.close_data()